@@ -0,0 +1,84 @@
+"""
+Peak memory and step time of gradient checkpointing across time
+
+Trains alexnet with feedback on the CPU for one step with plain
+`tf.gradients` and with `tnn.checkpoint` under several checkpoint
+placements, and reports the peak memory and the time of a forward and
+backward pass.
+
+    python benchmarks/bench_checkpoint.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import tnn.main
+import tnn.checkpoint
+
+BATCH_SIZE = 32
+NTIMES = 16
+FEEDBACK = [('conv5', 'conv3'), ('fc7', 'conv5')]
+PLACEMENTS = [('none', None),
+              ('every 2', {'every': 2}),
+              ('every 4 (sqrt)', {'every': 'sqrt'}),
+              ('every 8', {'every': 8}),
+              ('conv1-conv2', {'nodes': ['conv1', 'conv2']})]
+
+json_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'json')
+
+
+def peak_bytes(run_metadata):
+    peak = 0
+    for dev_stats in run_metadata.step_stats.dev_stats:
+        for node_stats in dev_stats.node_stats:
+            for mem in node_stats.memory:
+                peak = max(peak, mem.peak_bytes)
+    return peak
+
+
+def run(kwargs, repeat=3):
+    with tf.Graph().as_default():
+        images = tf.constant(np.random.standard_normal([BATCH_SIZE, 224, 224, 3]).astype(np.float32))
+        labels = tf.constant(np.random.randint(1000, size=BATCH_SIZE))
+        G = tnn.main.graph_from_json(os.path.join(json_dir, 'alexnet.json'))
+        G.add_edges_from(FEEDBACK)
+        tnn.main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+        if kwargs is None:
+            tnn.main.unroll(G, input_seq={'conv1': images}, ntimes=NTIMES)
+        else:
+            tnn.checkpoint.unroll(G, input_seq={'conv1': images}, ntimes=NTIMES, **kwargs)
+        logits = G.node['fc8']['outputs'][-1]
+        loss = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(logits=logits, labels=labels))
+        var_list = tf.trainable_variables()
+        if kwargs is None:
+            grads = tf.gradients(loss, var_list)
+        else:
+            grads = [g for g, v in tnn.checkpoint.gradients(G, loss, var_list=var_list)]
+
+        run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+        run_metadata = tf.RunMetadata()
+        with tf.Session(config=tf.ConfigProto(device_count={'GPU': 0})) as sess:
+            sess.run(tf.global_variables_initializer())
+            sess.run(grads, options=run_options, run_metadata=run_metadata)
+            times = []
+            for _ in range(repeat):
+                start = time.time()
+                sess.run(grads)
+                times.append(time.time() - start)
+        return peak_bytes(run_metadata), min(times)
+
+
+def main():
+    print('{:>16} {:>12} {:>12}'.format('checkpoints', 'peak (MB)', 'step (s)'))
+    for name, kwargs in PLACEMENTS:
+        peak, step = run(kwargs)
+        print('{:>16} {:>12.1f} {:>12.2f}'.format(name, peak / 2**20, step))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Memory of fc-to-conv feedback in the harbor
+
+Builds alexnet with feedback from the fc layers onto the conv layers and
+compares the harbor with channel_op 'concat', where fc inputs have to be
+tiled to a full [batch, height, width, channels] tensor, with 'add' and
+'multiply', where they are kept as broadcastable [batch, 1, 1, channels]
+vectors. Reports the bytes of tiled buffers that the broadcast avoids and
+the peak CPU memory of a forward pass.
+
+    python benchmarks/bench_harbor_broadcast.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import tnn.main
+
+BATCH_SIZE = 32
+NTIMES = 10
+FEEDBACK = [('fc6', 'conv5'), ('fc7', 'conv4'), ('fc8', 'conv3')]
+
+json_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'json')
+
+
+def peak_bytes(run_metadata):
+    peak = 0
+    for dev_stats in run_metadata.step_stats.dev_stats:
+        for node_stats in dev_stats.node_stats:
+            for mem in node_stats.memory:
+                peak = max(peak, mem.peak_bytes)
+    return peak
+
+
+def tiled_bytes(G):
+    """Bytes a full tile of every fc input to a conv harbor takes over all time steps"""
+    nbytes = 0
+    for node, attr in G.nodes(data=True):
+        harbor_shape = attr['kwargs']['harbor_shape']
+        if len(harbor_shape) != 4:
+            continue
+        for pred in G.predecessors(node):
+            if len(G.node[pred]['output_shape']) == 2:
+                nbytes += 4 * np.prod(harbor_shape[:3]) * harbor_shape[3] * NTIMES
+    return nbytes
+
+
+def run(channel_op):
+    with tf.Graph().as_default():
+        images = tf.constant(np.random.standard_normal([BATCH_SIZE, 224, 224, 3]).astype(np.float32))
+        G = tnn.main.graph_from_json(os.path.join(json_dir, 'alexnet.json'))
+        G.add_edges_from(FEEDBACK)
+        for node, attr in G.nodes(data=True):
+            attr['kwargs']['harbor'][1]['channel_op'] = channel_op
+        tnn.main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE, channel_op=channel_op)
+        tnn.main.unroll(G, input_seq={'conv1': images}, ntimes=NTIMES)
+        output = G.node['fc8']['outputs'][-1]
+
+        run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+        run_metadata = tf.RunMetadata()
+        with tf.Session(config=tf.ConfigProto(device_count={'GPU': 0})) as sess:
+            sess.run(tf.global_variables_initializer())
+            sess.run(output, options=run_options, run_metadata=run_metadata)
+        return tiled_bytes(G), peak_bytes(run_metadata)
+
+
+def main():
+    print('{:>10} {:>22} {:>16}'.format('channel_op', 'fc tiles (MB)', 'peak (MB)'))
+    for channel_op in ['concat', 'add', 'multiply']:
+        tiles, peak = run(channel_op)
+        avoided = '' if channel_op == 'concat' else ' (avoided)'
+        print('{:>10} {:>22} {:>16.1f}'.format(channel_op, '{:.1f}{}'.format(tiles / 2**20, avoided),
+                                               peak / 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Harbor spatial ops: per-image `tf.map_fn` against batched 4-D ops
+
+Times the 'pad' and 'tile' spatial ops of `tnn.cell.harbor` as they used to
+be implemented (`tf.image.resize_image_with_crop_or_pad` mapped over the
+batch) against `tnn.cell.crop_or_pad`, plus the already batched 'resize', on
+CPU for batch sizes from 1 to 256. Outputs of both paths are checked to be
+identical.
+
+    python benchmarks/bench_harbor_spatial.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from tnn import cell
+
+# (input shape without batch, target height and width), as in alexnet bypasses
+CASES = [([27, 27, 96], [14, 14]),
+         ([14, 14, 256], [27, 27]),
+         ([54, 54, 96], [14, 14])]
+
+
+def map_fn_pad(inp, shape):
+    return tf.map_fn(lambda im: tf.image.resize_image_with_crop_or_pad(im, shape[0], shape[1]),
+                     inp, dtype=tf.float32)
+
+
+def map_fn_tile(inp, shape):
+    inp_height, inp_width = inp.get_shape().as_list()[1:3]
+    tiled = tf.tile(inp, [1, 1 + shape[0] // inp_height, 1 + shape[1] // inp_width, 1])
+    return map_fn_pad(tiled, shape)
+
+
+def batched_tile(inp, shape):
+    return cell.tile_func(inp, [None] + shape)
+
+
+def timeit(sess, op, nsteps=20):
+    sess.run(op)  # warm up
+    start = time.time()
+    for _ in range(nsteps):
+        sess.run(op)
+    return (time.time() - start) / nsteps
+
+
+def main():
+    print('{:>6} {:>16} {:>10} {:>8} {:>12} {:>12}'.format(
+        'batch', 'input', 'target', 'op', 'map_fn (ms)', 'batched (ms)'))
+    for batch_size in [1, 8, 32, 64, 128, 256]:
+        for inp_shape, target in CASES:
+            with tf.Graph().as_default():
+                data = np.random.standard_normal([batch_size] + inp_shape).astype(np.float32)
+                inp = tf.Variable(data)
+                ops = [('pad', map_fn_pad(inp, target), cell.crop_or_pad(inp, *target)),
+                       ('tile', map_fn_tile(inp, target), batched_tile(inp, target)),
+                       ('resize', None, tf.image.resize_images(inp, target))]
+                with tf.Session(config=tf.ConfigProto(device_count={'GPU': 0})) as sess:
+                    sess.run(tf.global_variables_initializer())
+                    for name, old, new in ops:
+                        if old is not None:
+                            old_res, new_res = sess.run([old, new])
+                            assert np.array_equal(old_res, new_res)
+                            old_time = '{:.2f}'.format(timeit(sess, old) * 1000)
+                        else:
+                            old_time = '-'
+                        print('{:>6} {:>16} {:>10} {:>8} {:>12} {:>12.2f}'.format(
+                            batch_size, 'x'.join(map(str, inp_shape)), 'x'.join(map(str, target)),
+                            name, old_time, timeit(sess, new) * 1000))
+
+
+if __name__ == '__main__':
+    main()
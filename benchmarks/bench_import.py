@@ -0,0 +1,66 @@
+"""
+Cold-start time of config tooling
+
+Loads `alexnet.json`, resolves its shapes and estimates its cost in a fresh
+interpreter, through the TensorFlow-free modules (`tnn.config`,
+`tnn.shapes`, `tnn.cost`) and through `tnn.main.graph_from_json`, which
+imports TensorFlow and tfutils to resolve the functions of the config.
+
+    python benchmarks/bench_import.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import json
+import subprocess
+
+import numpy as np
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+root_dir = os.path.dirname(this_dir)
+
+SCRIPT = """
+import sys, time, json
+start = time.time()
+import tnn.config, tnn.shapes, tnn.cost
+{load}
+tnn.shapes.resolve(G, ['conv1'], batch_size=32, probe={probe})
+tnn.cost.estimate(G, ['conv1'])
+print(json.dumps({{'seconds': time.time() - start,
+                  'tensorflow': 'tensorflow' in sys.modules,
+                  'tfutils': 'tfutils' in sys.modules}}))
+"""
+
+CASES = [
+    ('config only', "G = tnn.config.graph_from_json({json!r})", 'None'),
+    ('tnn.main', "import tnn.main\nG = tnn.main.graph_from_json({json!r})",
+     'tnn.main._probe_output_shape(G)'),
+]
+
+
+def run(load, probe, repeat=5):
+    json_file = os.path.join(root_dir, 'json', 'alexnet.json')
+    script = SCRIPT.format(load=load.format(json=json_file), probe=probe)
+    results = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', script], cwd=root_dir)
+        results.append(json.loads(out.decode('utf-8').strip().splitlines()[-1]))
+    return np.median([r['seconds'] for r in results]), results[0]
+
+
+def main():
+    print('{:>12} {:>10} {:>12} {:>10}'.format('path', 'time (s)', 'tensorflow', 'tfutils'))
+    for name, load, probe in CASES:
+        try:
+            seconds, result = run(load, probe)
+        except subprocess.CalledProcessError:
+            print('{:>12} {:>10}'.format(name, 'failed'))
+            continue
+        print('{:>12} {:>10.3f} {:>12} {:>10}'.format(name, seconds, result['tensorflow'],
+                                                    result['tfutils']))
+
+
+if __name__ == '__main__':
+    main()
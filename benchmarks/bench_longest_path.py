@@ -0,0 +1,94 @@
+"""
+Scaling of the default `ntimes` search in `tnn.main.unroll`
+
+Compares `tnn.topology.longest_path_length` against the previous
+`nx.all_simple_paths` enumeration on random layered graphs with bypass and
+feedback edges. The old search is only run while it finishes within a time
+budget, as it is exponential in the number of bypass edges.
+
+    python benchmarks/bench_longest_path.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import time
+import random
+import itertools
+
+import networkx as nx
+
+from tnn import topology
+
+
+def random_tnn_graph(nnodes, nbypass, nfeedback, seed=0):
+    """Feedforward chain with random bypass (forward) and feedback (backward) edges"""
+    rng = random.Random(seed)
+    names = ['n{}'.format(i) for i in range(nnodes)]
+    G = nx.DiGraph()
+    G.add_edges_from(zip(names[:-1], names[1:]))
+    while G.number_of_edges() < nnodes - 1 + nbypass:
+        i, j = sorted(rng.sample(range(nnodes), 2))
+        G.add_edge(names[i], names[j])
+    nedges = G.number_of_edges()
+    while G.number_of_edges() < nedges + nfeedback:
+        i, j = sorted(rng.sample(range(nnodes), 2))
+        if j < nnodes - 1:  # keep the last node an output
+            G.add_edge(names[j], names[i])
+    return G, [names[0]]
+
+
+def all_simple_paths_length(G, input_nodes, budget):
+    """The search `unroll` used to do, aborted after `budget` seconds"""
+    start = time.time()
+    longest = 0
+    output_nodes = topology.output_nodes(G)
+    for inp, out in itertools.product(input_nodes, output_nodes):
+        for path in nx.all_simple_paths(G, inp, out):
+            longest = max(longest, len(path))
+            if time.time() - start > budget:
+                return None
+    return longest
+
+
+def timeit(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        res = func()
+        times.append(time.time() - start)
+    return res, min(times)
+
+
+def main(budget=5.):
+    print('{:>6} {:>7} {:>9} {:>6} {:>12} {:>12} {:>12}'.format(
+        'nodes', 'bypass', 'feedback', 'len', 'dp (ms)', 'cached (ms)', 'paths (ms)'))
+    for nnodes in [10, 20, 50, 100, 200, 500, 1000]:
+        for nbypass, nfeedback in [(nnodes // 5, 0), (nnodes // 5, nnodes // 10)]:
+            G, input_nodes = random_tnn_graph(nnodes, nbypass, nfeedback)
+
+            def uncached():
+                G.graph.pop('_topology_cache', None)
+                return topology.longest_path_length(G, input_nodes)
+
+            length, dp_time = timeit(uncached)
+            _, cached_time = timeit(lambda: topology.longest_path_length(G, input_nodes))
+
+            if nnodes > 200:
+                old_time = 'skipped'
+            else:
+                old, old_time = timeit(lambda: all_simple_paths_length(G, input_nodes, budget), repeat=1)
+            if old_time == 'skipped':
+                pass
+            elif old is None:
+                old_time = '>{:.0f}'.format(budget * 1000)
+            else:
+                if nfeedback == 0:
+                    assert old == length, (old, length)
+                old_time = '{:.2f}'.format(old_time * 1000)
+
+            print('{:>6} {:>7} {:>9} {:>6} {:>12.2f} {:>12.2f} {:>12}'.format(
+                nnodes, nbypass, nfeedback, length, dp_time * 1000, cached_time * 1000, old_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Throughput and latency of request coalescing
+
+Serves mnist_conv with feedback unrolled over 8 time steps on the CPU to
+many concurrent single-image clients, once with a batch-1 graph called
+directly by every client, and once with `tnn.serving.Runner` on a graph built
+for batches of 64 under several latency budgets.
+
+    python benchmarks/bench_serving.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import time
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+import tnn.main
+import tnn.serving
+
+NTIMES = 8
+NCLIENTS = 32
+NREQUESTS = 16  # per client
+BATCH_SIZE = 64
+LATENCIES = [.001, .005, .02]
+
+json_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'json')
+
+
+def build(batch_size):
+    images = tf.placeholder(tf.float32, shape=[batch_size, 28, 28, 1])
+    G = tnn.main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+    G.add_edges_from([('fc1', 'conv2')])
+    tnn.main.init_nodes(G, input_nodes=['conv1'], batch_size=batch_size)
+    tnn.main.unroll(G, input_seq={'conv1': images}, ntimes=NTIMES)
+    return images, G
+
+
+def clients(call):
+    """Runs NCLIENTS threads that call `call` NREQUESTS times each, returns latencies"""
+    image = np.random.standard_normal([28, 28, 1]).astype(np.float32)
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(NREQUESTS):
+            start = time.time()
+            call(image)
+            with lock:
+                latencies.append(time.time() - start)
+    threads = [threading.Thread(target=client) for _ in range(NCLIENTS)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies) / (time.time() - start), latencies
+
+
+def report(name, throughput, latencies):
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    print('{:>22} {:>12.0f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(name, throughput, p50, p90, p99))
+
+
+def main():
+    config = tf.ConfigProto(device_count={'GPU': 0})
+    print('{:>22} {:>12} {:>10} {:>10} {:>10}'.format('runner', 'requests/s', 'p50 (ms)',
+                                                      'p90 (ms)', 'p99 (ms)'))
+    with tf.Graph().as_default():
+        images, G = build(1)
+        output = G.node['fc2']['outputs'][-1]
+        with tf.Session(config=config) as sess:
+            sess.run(tf.global_variables_initializer())
+            throughput, latencies = clients(lambda image: sess.run(output, feed_dict={images: image[None]}))
+            report('batch 1, no batching', throughput, latencies)
+
+    with tf.Graph().as_default():
+        images, G = build(BATCH_SIZE)
+        with tf.Session(config=config) as sess:
+            sess.run(tf.global_variables_initializer())
+            for max_latency in LATENCIES:
+                runner = tnn.serving.Runner.from_graph(sess, G, {'conv1': images}, ['fc2'],
+                                                       max_latency=max_latency)
+                throughput, latencies = clients(runner.run)
+                runner.stop()
+                report('batch {}, wait {} ms'.format(BATCH_SIZE, max_latency * 1000),
+                       throughput, latencies)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Python overhead of a time step in `tnn.main.unroll`
+
+Compares the per-step bookkeeping of `_unroll_step` replaying a compiled
+`Plan` with the networkx lookups it used to do (predecessors sorted on every
+call, input membership and attribute dicts looked up per node, one standin
+per edge). Cells are replaced by trivial Python objects so that only the
+scheduling cost is measured, on random graphs with bypass and feedback
+edges.
+
+    python benchmarks/bench_unroll_plan.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import time
+
+import tnn.main
+import tnn.cell
+from bench_longest_path import random_tnn_graph
+
+NTIMES = 20
+
+
+def standin(shape, name, **kwargs):
+    return name
+
+
+class NullCell(object):
+    """Forwards its first input; costs next to nothing"""
+    input_init = (standin, {})
+
+    def __call__(self, inputs=None, state=None):
+        return (None if inputs is None else inputs[0].tensor), state
+
+    def hoist(self, enable=True):
+        pass
+
+
+def networkx_step(G, t, inputs, prev_outputs=None, prev_states=None):
+    """The loop `_unroll_step` ran before execution plans"""
+    edges = tnn.topology.edge_types(G, list(inputs.keys()))
+    outputs = {}
+    states = {}
+    for node, attr in G.nodes(data=True):
+        node_inputs = []
+        if node in inputs:
+            node_inputs.append(tnn.cell.HarborInput(inputs[node], None, 'input', t))
+        for pred in sorted(G.predecessors(node)):
+            if prev_outputs is None:
+                cell = G.node[pred]['cell']
+                _inp = cell.input_init[0](shape=G.node[pred]['output_shape'],
+                                          name=pred + '/standin', **cell.input_init[1])
+            else:
+                _inp = prev_outputs[pred]
+            node_inputs.append(tnn.cell.HarborInput(_inp, pred, edges[(pred, node)], t - 1))
+        state = None if prev_states is None else prev_states[node]
+        outputs[node], states[node] = attr['cell'](inputs=node_inputs, state=state)
+    return outputs, states
+
+
+def null_graph(nnodes):
+    G, input_nodes = random_tnn_graph(nnodes, nnodes // 5, nnodes // 10)
+    names = sorted(G.nodes(), key=lambda n: int(n[1:]))
+    for pred, node in zip(names[:-1], names[1:]):
+        G.node[node]['shape_from'] = pred
+    for node, attr in G.nodes(data=True):
+        attr['cell'] = NullCell()
+        attr['output_shape'] = [1]
+    return G, input_nodes
+
+
+def timeit(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    print('{:>6} {:>8} {:>14} {:>14} {:>8}'.format(
+        'nodes', 'compile', 'networkx (us)', 'plan (us)', 'speedup'))
+    for nnodes in [100, 200, 500, 1000]:
+        G, input_nodes = null_graph(nnodes)
+        inputs = dict((n, 'image') for n in input_nodes)
+
+        def compile_plan():
+            G.graph.pop('_topology_cache', None)
+            return tnn.main.compile_plan(G, input_nodes)
+
+        compile_time = timeit(compile_plan)
+        plan = tnn.main.compile_plan(G, input_nodes)
+
+        def run_networkx():
+            outputs, states = None, None
+            for t in range(NTIMES):
+                outputs, states = networkx_step(G, t, inputs, outputs, states)
+
+        def run_plan():
+            outputs, states = None, None
+            for t in range(NTIMES):
+                outputs, states = tnn.main._unroll_step(plan, t, inputs, outputs, states)
+
+        nx_time = timeit(run_networkx) / NTIMES
+        plan_time = timeit(run_plan) / NTIMES
+        print('{:>6} {:>6.1f}ms {:>14.1f} {:>14.1f} {:>7.1f}x'.format(
+            nnodes, compile_time * 1000, nx_time * 1e6, plan_time * 1e6, nx_time / plan_time))
+
+
+if __name__ == '__main__':
+    main()
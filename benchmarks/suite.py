@@ -0,0 +1,235 @@
+"""
+Benchmark suite for graph building and execution
+
+Times `graph_from_json`, `init_nodes`, `unroll`, a forward pass and a
+forward and backward pass on the CPU for the shipped configs and for
+synthetic deep and feedback graphs, over several batch sizes and `ntimes`.
+Every case runs in its own process so that its peak RSS can be measured.
+Results are written as json, and can be compared with the results of a
+previous version to catch regressions.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --quick --output new.json --baseline results.json
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.dirname(this_dir), 'json')
+
+# (name, json file or synthetic graph spec, input node, feedback edges)
+CONFIGS = [
+    ('mnist_fc', 'mnist_fc.json', 'fc1', []),
+    ('mnist_conv', 'mnist_conv.json', 'conv1', []),
+    ('mnist_conv_feedback', 'mnist_conv.json', 'conv1', [('fc1', 'conv2')]),
+    ('alexnet', 'alexnet.json', 'conv1', []),
+    ('alexnet_feedback', 'alexnet.json', 'conv1', [('conv5', 'conv3'), ('fc7', 'conv5')]),
+    ('deep_32', {'depth': 32}, 'conv0', []),
+    ('deep_32_feedback', {'depth': 32, 'feedback': 4}, 'conv0', []),
+]
+BATCH_SIZES = [1, 32]
+NTIMES = [4, 16]
+QUICK = {'configs': ['mnist_fc', 'mnist_conv_feedback', 'deep_32_feedback'],
+         'batch_sizes': [8], 'ntimes': [4]}
+TIMINGS = ['graph_from_json', 'init_nodes', 'unroll', 'forward', 'forward_backward']
+
+
+def synthetic_json(depth, feedback=None, size=16, channels=8):
+    """
+    A chain of `depth` small convolutions, with a feedback edge from every
+    `feedback`-th node to the node `feedback` steps below it
+    """
+    def node(name, shape_from=None):
+        json_node = {'name': name,
+                     'dtype': 'float32',
+                     'input_init': {'function': 'zeros'},
+                     'state_init': {'function': 'zeros'},
+                     'harbor': {'function': 'harbor'},
+                     'pre_memory': [{'function': 'conv', 'out_depth': channels, 'ksize': 3,
+                                     'strides': [1, 1, 1, 1], 'padding': 'SAME',
+                                     'kernel_init': 'xavier', 'bias': 0,
+                                     'activation': None, 'batch_norm': False}],
+                     'memory': {'function': 'memory', 'memory_decay': 0, 'trainable': False},
+                     'post_memory': [{'function': 'relu'}]}
+        if shape_from is None:
+            json_node['shape'] = [size, size, channels]
+        else:
+            json_node['shape_from'] = shape_from
+        return json_node
+
+    names = ['conv{}'.format(i) for i in range(depth)]
+    nodes = [node(names[0])] + [node(n, shape_from=p) for p, n in zip(names[:-1], names[1:])]
+    edges = [{'from': p, 'to': n} for p, n in zip(names[:-1], names[1:])]
+    if feedback:
+        for i in range(feedback, depth, feedback):
+            edges.append({'from': names[i], 'to': names[i - feedback]})
+    return {'nodes': nodes, 'edges': edges}
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def timed(func, repeat=1):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        res = func()
+        times.append(time.time() - start)
+    return res, float(np.median(times))
+
+
+def run_case(config, batch_size, ntimes, repeat=3):
+    """Runs one benchmark case in this process and returns its results"""
+    import tensorflow as tf
+    import tnn.main
+
+    name, source, input_node, feedback = [c for c in CONFIGS if c[0] == config][0]
+    result = {'config': name, 'batch_size': batch_size, 'ntimes': ntimes}
+    if isinstance(source, dict):
+        fd, json_path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(synthetic_json(**source), f)
+    else:
+        json_path = os.path.join(json_dir, source)
+
+    try:
+        with tf.Graph().as_default() as graph:
+            G, result['graph_from_json'] = timed(lambda: tnn.main.graph_from_json(json_path))
+            G.add_edges_from(feedback)
+            shape = G.node[input_node]['shape']
+            images = tf.constant(np.random.standard_normal([batch_size] + shape).astype(np.float32))
+            _, result['init_nodes'] = timed(lambda: tnn.main.init_nodes(
+                G, input_nodes=[input_node], batch_size=batch_size))
+            _, result['unroll'] = timed(lambda: tnn.main.unroll(
+                G, input_seq={input_node: images}, ntimes=ntimes))
+
+            outputs = [G.node[n]['outputs'][-1] for n in G if len(list(G.successors(n))) == 0]
+            loss = tf.add_n([tf.reduce_sum(o) for o in outputs])
+            grads = tf.gradients(loss, tf.trainable_variables())
+            result['graph_def_bytes'] = graph.as_graph_def().ByteSize()
+            result['nops'] = len(graph.get_operations())
+
+            config_proto = tf.ConfigProto(device_count={'GPU': 0})
+            with tf.Session(config=config_proto) as sess:
+                sess.run(tf.global_variables_initializer())
+                sess.run(outputs)  # warm up
+                _, result['forward'] = timed(lambda: sess.run(outputs), repeat=repeat)
+                sess.run(grads)
+                _, result['forward_backward'] = timed(lambda: sess.run(grads), repeat=repeat)
+    finally:
+        if isinstance(source, dict):
+            os.remove(json_path)
+    result['peak_rss_bytes'] = peak_rss()
+    return result
+
+
+def run_in_subprocess(config, batch_size, ntimes):
+    cmd = [sys.executable, '-m', 'benchmarks.suite', '--case',
+           json.dumps([config, batch_size, ntimes])]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            cwd=os.path.dirname(this_dir))
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        return {'config': config, 'batch_size': batch_size, 'ntimes': ntimes,
+                'error': err.decode('utf-8', 'replace').strip().splitlines()[-1:]}
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def environment():
+    import tensorflow as tf
+    import tnn
+    return {'tnn': tnn.__version__,
+            'tensorflow': tf.__version__,
+            'numpy': np.__version__,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count() if hasattr(os, 'cpu_count') else None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results, baseline, tolerance=.2):
+    """
+    Cases that got slower or bigger than `baseline` by more than `tolerance`
+
+    :Returns:
+        A list of (case, metric, baseline value, new value) tuples
+    """
+    def key(r):
+        return r['config'], r['batch_size'], r['ntimes']
+    old = dict((key(r), r) for r in baseline['results'] if 'error' not in r)
+    regressions = []
+    for r in results['results']:
+        if 'error' in r or key(r) not in old:
+            continue
+        for metric in TIMINGS + ['peak_rss_bytes', 'graph_def_bytes']:
+            before, after = old[key(r)].get(metric), r.get(metric)
+            if before and after and after > before * (1 + tolerance):
+                regressions.append((key(r), metric, before, after))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='json file to write the results to')
+    parser.add_argument('--configs', nargs='+', default=[c[0] for c in CONFIGS])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=BATCH_SIZES)
+    parser.add_argument('--ntimes', nargs='+', type=int, default=NTIMES)
+    parser.add_argument('--quick', action='store_true', help='only run a few small cases')
+    parser.add_argument('--baseline', help='results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=.2)
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case is not None:  # worker process
+        print(json.dumps(run_case(*json.loads(args.case))))
+        return 0
+
+    if args.quick:
+        args.configs, args.batch_sizes, args.ntimes = QUICK['configs'], QUICK['batch_sizes'], QUICK['ntimes']
+    results = {'environment': environment(), 'results': []}
+    header = '{:>22} {:>6} {:>6}' + ' {:>10}' * len(TIMINGS) + ' {:>10} {:>10}'
+    print(header.format('config', 'batch', 'ntimes', *(TIMINGS + ['rss (MB)', 'gdef (MB)'])))
+    for config in args.configs:
+        for batch_size in args.batch_sizes:
+            for ntimes in args.ntimes:
+                r = run_in_subprocess(config, batch_size, ntimes)
+                results['results'].append(r)
+                if 'error' in r:
+                    print('{:>22} {:>6} {:>6} failed: {}'.format(config, batch_size, ntimes, r['error']))
+                    continue
+                row = '{:>22} {:>6} {:>6}' + ' {:>10.3f}' * len(TIMINGS) + ' {:>10.1f} {:>10.2f}'
+                print(row.format(config, batch_size, ntimes, *([r[t] for t in TIMINGS] +
+                                 [r['peak_rss_bytes'] / 2**20, r['graph_def_bytes'] / 2**20])))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        for case, metric, before, after in regressions:
+            print('regression in {} {}: {:.4g} -> {:.4g}'.format(case, metric, before, after))
+        return 1 if len(regressions) > 0 else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,19 +2,22 @@
 """
 
 import os
+import re
 import setuptools
 import codecs
 
-import tnn
-
 # Get the long description from the README file
 here = os.path.abspath(os.path.dirname(__file__))
 with codecs.open(os.path.join(here, 'README.md'), encoding='utf-8') as f:
     long_description = f.read()
 
+# Read the version without importing tnn, which needs the dependencies
+with codecs.open(os.path.join(here, 'tnn', '__init__.py'), encoding='utf-8') as f:
+    version = re.search(r"^__version__ = '(.*)'", f.read(), re.M).group(1)
+
 setuptools.setup(
     name='tnn',
-#    version=tnn.__version__,
+    version=version,
     description='Temporal Neural Networks',
     long_description=long_description,
     url='https://github.com/dicarlolab/tnn',
@@ -0,0 +1,63 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from tnn import cache
+
+BATCH_SIZE = 16
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def test_cache():
+    json_path = os.path.join(json_dir, 'mnist_conv.json')
+    cache_dir = tempfile.mkdtemp()
+    images = np.random.standard_normal([BATCH_SIZE, 28, 28, 1]).astype(np.float32)
+    try:
+        results = []
+        for _ in range(2):
+            with tf.Graph().as_default():
+                G = cache.unroll_from_json(json_path, ['conv1'], batch_size=BATCH_SIZE,
+                                           edges=[('conv1', 'fc1')], cache_dir=cache_dir)
+                assert len(os.listdir(cache_dir)) == 1
+                assert G.node['fc1']['kwargs']['harbor_shape'] == [BATCH_SIZE, 7 * 7 * 64 + 14 * 14 * 32]
+                assert G.node['fc2']['outputs'][-1].shape.as_list() == [BATCH_SIZE, 10]
+                assert len(G.node['conv1']['states']) == len(G.node['fc2']['outputs'])
+                with tf.Session() as sess:
+                    sess.run(tf.global_variables_initializer())
+                    results.append(sess.run(G.node['fc2']['outputs'][-1],
+                                            feed_dict={G.graph['inputs']['conv1']: images}))
+        # weights are initialized with fixed seeds
+        assert np.allclose(results[0], results[1])
+
+        with tf.Graph().as_default():
+            cache.unroll_from_json(json_path, ['conv1'], batch_size=BATCH_SIZE // 2,
+                                   cache_dir=cache_dir)
+        assert len(os.listdir(cache_dir)) == 2
+
+        # into a graph that already has tensors of the same names
+        with tf.Graph().as_default():
+            first = cache.unroll_from_json(json_path, ['conv1'], batch_size=BATCH_SIZE,
+                                           edges=[('conv1', 'fc1')], cache_dir=cache_dir)
+            second = cache.unroll_from_json(json_path, ['conv1'], batch_size=BATCH_SIZE,
+                                            edges=[('conv1', 'fc1')], cache_dir=cache_dir)
+            first_out = first.node['fc2']['outputs'][-1]
+            second_out = second.node['fc2']['outputs'][-1]
+            assert first_out is not second_out
+            assert first.graph['inputs']['conv1'] is not second.graph['inputs']['conv1']
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                first_out, second_out = sess.run(
+                    [first_out, second_out],
+                    feed_dict={first.graph['inputs']['conv1']: images,
+                               second.graph['inputs']['conv1']: -images})
+            assert np.allclose(first_out, results[0])
+            assert not np.allclose(second_out, results[0])
+    finally:
+        shutil.rmtree(cache_dir)
@@ -0,0 +1,173 @@
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import tensorflow as tf
+
+from tnn import cell
+
+BATCH_SIZE = 8
+
+
+def test_crop_or_pad():
+    for inp_shape, target in [([27, 27, 5], [14, 14]),
+                              ([14, 14, 5], [27, 27]),
+                              ([13, 28, 5], [20, 9]),
+                              ([14, 14, 5], [14, 14])]:
+        data = np.random.standard_normal([BATCH_SIZE] + inp_shape).astype(np.float32)
+        inp = tf.constant(data)
+        batched = cell.crop_or_pad(inp, target[0], target[1])
+        assert batched.shape.as_list() == [BATCH_SIZE] + target + inp_shape[-1:]
+        per_image = tf.map_fn(lambda im: tf.image.resize_image_with_crop_or_pad(im, target[0], target[1]),
+                              inp, dtype=tf.float32)
+        tiled = cell.tile_func(inp, [BATCH_SIZE] + target + inp_shape[-1:])
+        assert tiled.shape.as_list() == [BATCH_SIZE] + target + inp_shape[-1:]
+        with tf.Session() as sess:
+            batched, per_image = sess.run([batched, per_image])
+            assert np.array_equal(batched, per_image)
+
+
+def test_crop_func():
+    ff = np.random.uniform(1, 2, size=[BATCH_SIZE, 14, 14, 4]).astype(np.float32)
+    fb = np.random.standard_normal([BATCH_SIZE, 7, 7, 6]).astype(np.float32)
+    with tf.name_scope('conv2'):
+        ff_in = tf.identity(tf.constant(ff), name='output')
+    with tf.name_scope('conv4'):
+        fb_in = tf.identity(tf.constant(fb), name='output')
+    kwargs = dict(l1_inpnm='split', ff_inpnm='conv2', node_nms=['conv1', 'conv2', 'conv3', 'conv4'],
+                  shape=[BATCH_SIZE, 14, 14, 4], kernel_init='xavier', channel_op='concat')
+    with tf.variable_scope('crop'):
+        out, = cell.crop_func([ff_in, fb_in], reuse=None, **kwargs)
+    with tf.variable_scope('crop'):
+        as_gain, = cell.crop_func([ff_in, fb_in], reuse=True, gain=True, **kwargs)
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        out, as_gain = sess.run([out, as_gain])
+    assert np.allclose(out, as_gain, atol=1e-5)
+
+    # the input is modulated by a constant inside a box and unchanged outside
+    gain = out / ff - 1
+    for g in gain:
+        inside = np.abs(g[:, :, 0]) > 1e-6
+        rows = np.where(inside.any(axis=1))[0]
+        cols = np.where(inside.any(axis=0))[0]
+        if len(rows) > 0:
+            box = np.zeros_like(inside)
+            box[rows.min(): rows.max() + 1, cols.min(): cols.max() + 1] = True
+            assert np.array_equal(inside, box)
+            assert np.allclose(g[inside], g[inside][0], atol=1e-5)
+
+
+def test_box_mask():
+    height, width, depth = 14, 11, 3
+    boxes = np.random.uniform(size=[32, 4]).astype(np.float32)
+    # boxes clipped at the bottom and right border, empty and full boxes
+    boxes[:4] = [[.9, .8, .5, .6], [0., .95, 1., .5], [.5, .5, 0., 0.], [0., 0., 1., 1.]]
+    boxes[4:8, :2] = .75
+    mask = cell.box_mask(tf.constant(boxes), height, width)
+
+    # mask of the previous implementation: a box of ones padded per example
+    boxes = tf.constant(boxes)
+    total_height = tf.constant(height, dtype=tf.float32)
+    total_width = tf.constant(width, dtype=tf.float32)
+    offset_height = tf.floor(total_height * tf.squeeze(tf.slice(boxes, [0, 0], [-1, 1]), axis=-1))
+    offset_width = tf.floor(total_width * tf.squeeze(tf.slice(boxes, [0, 1], [-1, 1]), axis=-1))
+    target_height = tf.floor(total_height * tf.squeeze(tf.slice(boxes, [0, 2], [-1, 1])))
+    target_width = tf.floor(total_width * tf.squeeze(tf.slice(boxes, [0, 3], [-1, 1])))
+    height_val = tf.minimum(offset_height + target_height, total_height)
+    width_val = tf.minimum(offset_width + target_width, total_width)
+    elems = tuple([tf.cast(x, tf.int32) for x in [offset_height, offset_width,
+                                                  height_val - offset_height, width_val - offset_width,
+                                                  total_height - height_val, total_width - width_val]])
+    reference = tf.map_fn(lambda x: tf.pad(tf.ones([x[2], x[3], depth]),
+                                           [[x[0], x[4]], [x[1], x[5]], [0, 0]], "CONSTANT"),
+                          elems, dtype=tf.float32)
+
+    with tf.Session() as sess:
+        mask, reference = sess.run([mask, reference])
+    assert mask.shape == (32, height, width, 1)
+    assert np.allclose(np.broadcast_to(mask, reference.shape), reference)
+
+
+def test_harbor_broadcast():
+    conv = np.random.standard_normal([BATCH_SIZE, 7, 7, 16]).astype(np.float32)
+    fc = np.random.standard_normal([BATCH_SIZE, 16]).astype(np.float32)
+    shape = [BATCH_SIZE, 7, 7, 16]
+    for channel_op, func in [('add', np.add), ('multiply', np.multiply)]:
+        with tf.variable_scope(channel_op):
+            output = cell.harbor([tf.constant(conv), tf.constant(fc)], shape, 'conv',
+                                 channel_op=channel_op)
+            only_fc = cell.harbor([tf.constant(fc)], shape, 'conv', channel_op=channel_op)
+        assert output.shape.as_list() == shape
+        assert only_fc.shape.as_list() == shape
+        with tf.Session() as sess:
+            output, only_fc = sess.run([output, only_fc])
+        assert np.allclose(output, func(conv, fc[:, None, None, :]))
+        assert np.allclose(only_fc, np.tile(fc[:, None, None, :], [1, 7, 7, 1]))
+
+
+def test_harbor_input_records():
+    ff = np.random.uniform(1, 2, size=[BATCH_SIZE, 14, 14, 4]).astype(np.float32)
+    fb = np.random.standard_normal([BATCH_SIZE, 7, 7, 6]).astype(np.float32)
+    # tensor names that cannot be parsed into node names
+    with tf.name_scope('outer/stream_0'):
+        ff_in = tf.constant(ff)
+        fb_in = tf.constant(fb)
+    inputs = [cell.HarborInput(ff_in, 'conv2', 'feedforward', 0),
+              cell.HarborInput(fb_in, 'conv4', 'feedback', 0)]
+    ff_rec, skips, feedbacks = cell.gather_inputs(inputs, [BATCH_SIZE, 14, 14, 4], 'split',
+                                                  'conv2', ['conv1', 'conv2', 'conv3', 'conv4'])
+    assert ff_rec is inputs[0]
+    assert skips == []
+    assert len(feedbacks) == 1 and feedbacks[0].shape.as_list() == [BATCH_SIZE, 7 * 7 * 6]
+
+    # records are classified on node_nms like tensors named after their nodes,
+    # and inputs from nodes that are not listed are dropped
+    sk = np.random.standard_normal([BATCH_SIZE, 28, 28, 2]).astype(np.float32)
+    with tf.name_scope('outer/stream_0'):
+        sk_in = tf.constant(sk)
+    records = inputs + [cell.HarborInput(sk_in, 'conv1', 'skip', 0),
+                        cell.HarborInput(sk_in, 'pool1', 'skip', 0)]
+    with tf.name_scope('conv1'):
+        sk_named = tf.identity(sk_in, name='output')
+    with tf.name_scope('pool1'):
+        other_named = tf.identity(sk_in, name='output')
+    named = [tf.identity(ff_in, name='conv2/output'), tf.identity(fb_in, name='conv4/output'),
+             sk_named, other_named]
+    for ins in [records, named]:
+        ff_rec, skips, feedbacks = cell.gather_inputs(ins, [BATCH_SIZE, 14, 14, 4], 'split',
+                                                      'conv2', ['conv1', 'conv2', 'conv3', 'conv4'])
+        assert ff_rec is ins[0]
+        assert len(skips) == 1 and skips[0] is ins[2]
+        assert len(feedbacks) == 1
+
+    with tf.variable_scope('conv3'):
+        out = cell.harbor(inputs, [BATCH_SIZE, 14, 14, 4], 'conv3', ff_inpnm='conv2',
+                          node_nms=['conv1', 'conv2', 'conv3', 'conv4'], preproc='crop',
+                          channel_op='add')
+    with tf.variable_scope('plain'):
+        plain = cell.harbor(inputs, [BATCH_SIZE, 14, 14, 4], 'conv3', ff_inpnm='conv2',
+                            node_nms=['conv1', 'conv2', 'conv3', 'conv4'], channel_op='add')
+    names = [v.name for v in tf.global_variables()]
+    assert any(n.startswith('conv3/crop_mlp_for_conv2/') for n in names)
+    # the crop consumes the feedback input, which is not combined afterwards
+    assert not any(n.startswith('conv3/conv_to_conv_harbor_for_conv4/') for n in names)
+    assert any(n.startswith('plain/conv_to_conv_harbor_for_conv4/') for n in names)
+    assert out.shape.as_list() == plain.shape.as_list() == [BATCH_SIZE, 14, 14, 4]
+
+
+def test_harbor_cache():
+    static = tf.constant(np.random.standard_normal([BATCH_SIZE, 28, 28, 4]).astype(np.float32))
+    changing = [tf.constant(np.random.standard_normal([BATCH_SIZE, 14, 14, 4]).astype(np.float32))
+                for t in range(3)]
+    for dtype in ['float32', 'float16']:
+        c = cell.GenFuncCell([BATCH_SIZE, 14, 14, 8], pre_memory=[], post_memory=[],
+                             memory=(cell.memory, {'memory_decay': .5}),
+                             dtype=dtype, name='cache_' + dtype)
+        c.hoist()
+        state = None
+        for inp in changing:
+            output, state = c(inputs=[static, inp], state=state)
+        assert output.dtype == tf.as_dtype(dtype)
+        # the static input is only resized once
+        assert len(c._cache['harbor']) == 1 + len(changing)
@@ -0,0 +1,62 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from tnn import main, checkpoint
+
+BATCH_SIZE = 4
+NTIMES = 5
+MEM = .5
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def test_checkpoint_steps():
+    assert checkpoint.checkpoint_steps(10, 3) == [0, 3, 6, 9]
+    assert checkpoint.checkpoint_steps(16, 'sqrt') == [0, 4, 8, 12]
+    assert checkpoint.checkpoint_steps(10, [5, 2, 12]) == [0, 2, 5]
+
+
+def mnist_graph():
+    G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+    G.add_edges_from([('fc1', 'conv2')])
+    G.node['conv2']['kwargs']['memory'][1]['memory_decay'] = MEM
+    main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+    return G
+
+
+def loss_on(G):
+    outputs = G.node['fc2']['outputs']
+    return tf.reduce_sum(outputs[-1] ** 2) + tf.reduce_sum(outputs[2]) + tf.reduce_sum(G.node['conv2']['states'][1])
+
+
+def test_checkpoint_gradients():
+    images = np.random.standard_normal([NTIMES, BATCH_SIZE, 28, 28, 1]).astype(np.float32)
+    with tf.Graph().as_default():
+        with tf.variable_scope('tconvnet'):
+            G = mnist_graph()
+            input_seq = [tf.constant(im) for im in images]
+            main.unroll(G, input_seq={'conv1': list(input_seq)}, ntimes=NTIMES)
+            loss = loss_on(G)
+            var_list = tf.trainable_variables()
+            expected = tf.gradients(loss, var_list)
+
+            results = []
+            for kwargs in [{'every': 2}, {'every': 'sqrt'}, {'nodes': ['conv1', 'conv2']}]:
+                checkpoint.unroll(G, {'conv1': list(input_seq)}, ntimes=NTIMES, **kwargs)
+                ckpt_loss = loss_on(G)
+                grads = checkpoint.gradients(G, ckpt_loss, var_list=var_list)
+                assert [v for g, v in grads] == var_list
+                results.append((ckpt_loss, [g for g, v in grads]))
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            loss, expected, results = sess.run([loss, expected, results])
+        for ckpt_loss, grads in results:
+            assert np.allclose(ckpt_loss, loss, rtol=1e-5)
+            for g, e in zip(grads, expected):
+                assert np.allclose(g, e, rtol=1e-3, atol=1e-4)
@@ -0,0 +1,72 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import subprocess
+
+from tnn import config, registry
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def test_no_tensorflow():
+    script = '\n'.join([
+        'import sys',
+        'import tnn.config, tnn.shapes, tnn.cost, tnn.main',
+        'G = tnn.config.graph_from_json({!r})'.format(os.path.join(json_dir, 'alexnet.json')),
+        "tnn.main.check_inputs(G, ['conv1'])",
+        "tnn.shapes.resolve(G, ['conv1'], batch_size=8)",
+        "tnn.cost.estimate(G, ['conv1'])",
+        "assert 'tensorflow' not in sys.modules",
+        "assert 'tfutils' not in sys.modules",
+    ])
+    subprocess.check_call([sys.executable, '-c', script], cwd=os.path.dirname(this_dir))
+
+
+def test_registry():
+    @registry.register
+    def my_layer(inp, **kwargs):
+        return inp
+    try:
+        assert registry.lookup('my_layer') is my_layer
+        assert registry.resolve(function='my_layer', out_depth=3) == (my_layer, {'out_depth': 3})
+        assert registry.lookup('relu') is registry.lookup('relu')
+        try:
+            registry.lookup('cnov')
+        except ValueError as e:
+            assert '"conv"' in str(e)
+        else:
+            raise AssertionError('typo was not caught')
+    finally:
+        registry.unregister('my_layer')
+    assert not registry.known('my_layer')
+
+
+def test_registry_import_error():
+    registry.NAMESPACES.insert(0, 'tnn.no_such_module')
+    try:
+        registry.lookup('no_such_function')
+    except ImportError:
+        pass
+    else:
+        raise AssertionError('a namespace that cannot be imported was skipped')
+    finally:
+        registry.NAMESPACES.remove('tnn.no_such_module')
+
+
+def test_validate():
+    nodes, edges = config.import_json(os.path.join(json_dir, 'mnist_conv.json'))
+    config.validate(nodes, edges)
+    nodes[1]['pre_memory'][0]['function'] = 'cnov'
+    del nodes[2]['memory']
+    nodes[3]['shape_from'] = 'fc9'
+    try:
+        config.validate(nodes, edges)
+    except ValueError as e:
+        message = str(e)
+    else:
+        raise AssertionError('invalid config was not caught')
+    assert 'node conv2: unknown function "cnov"' in message
+    assert 'node fc1: missing memory' in message
+    assert 'node fc2: shape_from fc9 is not a node' in message
@@ -0,0 +1,52 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import tensorflow as tf
+
+from tnn import main, cost
+
+BATCH_SIZE = 4
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def test_mnist_cost():
+    with tf.Graph().as_default():
+        G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+        main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+    costs = cost.costs(G, ['conv1'])
+    assert costs['conv1']['params'] == 5 * 5 * 1 * 32 + 32
+    assert costs['conv2']['params'] == 5 * 5 * 32 * 64 + 64
+    assert costs['fc1']['params'] == 7 * 7 * 64 * 512 + 512
+    assert costs['fc2']['params'] == 512 * 10 + 10
+    conv = costs['conv1']['stages'][1]
+    assert conv['stage'] == 'pre_0'
+    assert conv['flops'] >= 2 * 5 * 5 * 1 * 32 * BATCH_SIZE * 28 * 28
+    assert costs['fc2']['output_bytes'] == 2 * BATCH_SIZE * 10 * 4
+    assert all([len(c['unknown']) == 0 for c in costs.values()])
+
+    est = cost.estimate(G, ['conv1'], ntimes=4)
+    assert est['params'] == sum([c['params'] for c in costs.values()])
+    assert est['flops'] == 4 * sum([c['flops'] for c in costs.values()])
+    bigger = cost.estimate(G, ['conv1'], ntimes=8, batch_size=2 * BATCH_SIZE)
+    assert bigger['activation_bytes'] == 4 * est['activation_bytes']
+    assert bigger['peak_bytes'] > est['peak_bytes']
+    inference = cost.estimate(G, ['conv1'], ntimes=8, training=False)
+    assert inference['peak_bytes'] < bigger['peak_bytes']
+
+    wave = cost.per_step(G, ['conv1'], ntimes=4, wavefront=True)
+    assert [s['nodes'] for s in wave] == [['conv1'], ['conv2'], ['fc1'], ['fc2']]
+
+
+def test_bypass_cost():
+    with tf.Graph().as_default():
+        G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+        G.add_edges_from([('conv1', 'fc1')])
+        main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+    costs = cost.costs(G, ['conv1'])
+    # the bypass is resized to 7x7 and concatenated to the harbor of fc1
+    assert costs['fc1']['harbor_width'] == 64 + 32
+    assert costs['fc1']['params'] == 7 * 7 * (64 + 32) * 512 + 512
+    assert costs['fc1']['stages'][0]['flops'] == cost.RESIZE_FLOPS * BATCH_SIZE * 7 * 7 * 32
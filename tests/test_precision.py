@@ -0,0 +1,86 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from tnn import main, precision
+
+BATCH_SIZE = 8
+NTIMES = 4
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def mnist_graph(dtype):
+    G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+    G.add_edges_from([('fc1', 'conv2')])
+    for node, attr in G.nodes(data=True):
+        attr['kwargs']['dtype'] = dtype
+        attr['kwargs']['memory'][1]['memory_decay'] = .5
+    main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+    return G
+
+
+def test_float16():
+    images = tf.constant(np.random.uniform(size=[BATCH_SIZE, 28, 28, 1]).astype(np.float32))
+    with tf.variable_scope('full'):
+        G = mnist_graph('float32')
+        main.unroll(G, input_seq={'conv1': images}, ntimes=NTIMES)
+    full = G.node['fc2']['outputs'][-1]
+    with tf.variable_scope('half'):
+        G = mnist_graph('float16')
+        main.unroll(G, input_seq={'conv1': images}, ntimes=NTIMES)
+    half = G.node['fc2']['outputs'][-1]
+    assert half.dtype == tf.float16
+    assert G.node['conv2']['states'][-1].dtype == tf.float16
+    half_vars = tf.global_variables(scope='half')
+    assert all([v.dtype.base_dtype == tf.float32 for v in half_vars])
+
+    loss = tf.reduce_sum(tf.cast(half, tf.float32) ** 2)
+    grads = precision.compute_gradients(loss, var_list=half_vars, loss_scale=128.)
+    assert all([g is None or g.dtype == tf.float32 for g, v in grads])
+    loss_scale = precision.DynamicLossScale(initial=2 ** 10)
+    train_op = precision.minimize(tf.train.GradientDescentOptimizer(1e-6), loss,
+                                  var_list=[v for v in half_vars if v in tf.trainable_variables()],
+                                  loss_scale=loss_scale)
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        # same initial values, since initializers are seeded
+        full, half = sess.run([full, half])
+        assert np.allclose(full, half, rtol=1e-2, atol=1e-2)
+        sess.run(train_op)
+        assert sess.run(loss_scale.good_steps) == 1
+
+
+def test_skip_overflow():
+    with tf.Graph().as_default():
+        w = tf.get_variable('w', initializer=[1., 2.])
+        loss = tf.reduce_sum(tf.cast(w, tf.float16) ** 2)
+        loss_scale = precision.DynamicLossScale(initial=1.)
+        optimizer = tf.train.MomentumOptimizer(.1, momentum=.9)
+        global_step = tf.train.get_or_create_global_step()
+        train_op = precision.minimize(optimizer, loss, var_list=[w], loss_scale=loss_scale,
+                                      global_step=global_step)
+        state = [w, optimizer.get_slot(w, 'momentum')]
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            sess.run(train_op)
+            before = sess.run(state)
+            assert np.all(before[1] != 0)
+            # float16 gradients overflow with this scale
+            sess.run(tf.assign(loss_scale.scale, 2. ** 20))
+            sess.run(train_op)
+            after = sess.run(state)
+            for b, a in zip(before, after):
+                assert np.array_equal(b, a)
+            assert sess.run(global_step) == 2
+            assert sess.run(loss_scale.scale) == 2. ** 19
+
+        # another loss scale in the same graph
+        other = precision.DynamicLossScale(initial=1., name='other_loss_scale')
+        assert other.scale is not loss_scale.scale
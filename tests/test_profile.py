@@ -0,0 +1,56 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import tempfile
+
+import tensorflow as tf
+
+from tnn import main, profiling
+
+BATCH_SIZE = 4
+NTIMES = 4
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def test_attribute():
+    calls = {'tconvnet/conv1_2': ('conv1', 2)}
+    assert profiling.attribute('tconvnet/conv1_2/pre_0/conv/Conv2D', calls) == ('conv1', 2, 'pre_0', False)
+    assert profiling.attribute('tconvnet/conv1_2/memory/mul', calls) == ('conv1', 2, 'memory', False)
+    assert profiling.attribute('tconvnet/conv1_2/concat', calls) == ('conv1', 2, 'harbor', False)
+    assert profiling.attribute('gradients/tconvnet/conv1_2/post_0/Relu_grad/ReluGrad',
+                               calls) == ('conv1', 2, 'post_0', True)
+    assert profiling.attribute('tconvnet/conv1_22/output', calls) == (None, None, None, False)
+
+
+def test_profile():
+    images = tf.random_normal([BATCH_SIZE, 28, 28, 1])
+    with tf.variable_scope('tconvnet'):
+        G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+        G.add_edges_from([('conv2', 'conv1')])
+        main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+        main.unroll(G, input_seq={'conv1': images}, ntimes=NTIMES)
+    loss = tf.reduce_mean(G.node['fc2']['outputs'][-1])
+    train_op = tf.train.GradientDescentOptimizer(.1).minimize(loss)
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        prof = profiling.profile(sess, train_op, G)
+
+    rows = prof.table(by=['node', 'time', 'backward'])
+    seen = set([(row['node'], row['time'], row['backward']) for row in rows])
+    for t in range(NTIMES):
+        assert ('conv1', t, False) in seen
+    assert ('fc2', NTIMES - 1, True) in seen
+    stages = set([row['stage'] for row in prof.table(by=['stage'])])
+    assert set(['harbor', 'pre_0', 'memory']) <= stages
+
+    tmp = tempfile.mkdtemp()
+    prof.to_csv(os.path.join(tmp, 'profile.csv'))
+    prof.to_chrome_trace(os.path.join(tmp, 'trace.json'))
+    with open(os.path.join(tmp, 'trace.json')) as f:
+        trace = json.load(f)
+    names = [e['args']['name'] for e in trace['traceEvents'] if e['ph'] == 'M']
+    assert 'conv1' in names and 'fc2' in names
@@ -0,0 +1,66 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import tempfile
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from tnn import main, serving
+
+BATCH_SIZE = 8
+NTIMES = 3
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def test_runner():
+    with tf.Graph().as_default():
+        images = tf.placeholder(tf.float32, shape=[BATCH_SIZE, 28, 28, 1])
+        with tf.variable_scope('tconvnet'):
+            G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+            main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+            main.unroll(G, input_seq={'conv1': images}, ntimes=NTIMES)
+        data = np.random.standard_normal([20, 28, 28, 1]).astype(np.float32)
+        # pad to full batches for the reference outputs
+        padded = np.concatenate([data, np.zeros([4, 28, 28, 1], dtype=np.float32)])
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            expected = np.concatenate([sess.run(G.node['fc2']['outputs'][-1],
+                                                feed_dict={images: padded[i: i + BATCH_SIZE]})
+                                       for i in range(0, 24, BATCH_SIZE)])[:20]
+
+            runner = serving.Runner.from_graph(sess, G, {'conv1': images},
+                                               ['fc2', ('conv2', 1)], max_latency=.05)
+            results = {}
+
+            def request(i):
+                results[i] = runner.run(data[i])
+            threads = [threading.Thread(target=request, args=(i,)) for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for i in range(20):
+                assert np.allclose(results[i]['fc2'], expected[i], atol=1e-4)
+                assert results[i][('conv2', 1)].shape == (7, 7, 64)
+            stats = runner.stats()
+            assert stats['requests'] == 20
+            assert stats['batches'] < 20
+            assert stats['latency_p99'] >= stats['latency_p50'] > 0
+
+            path = os.path.join(tempfile.mkdtemp(), 'tnn.sock')
+            server = serving.serve(runner, path)
+            client = serving.Client(path)
+            try:
+                outputs = client.run({'conv1': data[3]})
+                assert np.allclose(outputs['fc2'], expected[3], atol=1e-4)
+                assert outputs['conv2:1'].shape == (7, 7, 64)
+            finally:
+                client.close()
+                server.shutdown()
+                server.server_close()
+                runner.stop()
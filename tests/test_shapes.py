@@ -0,0 +1,147 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+
+import networkx as nx
+import pytest
+
+from tnn import shapes
+
+BATCH_SIZE = 256
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def named(name):
+    """Stand-in for a cell function; shape rules only look at the name"""
+    def func(*args, **kwargs):
+        raise NotImplementedError
+    func.__name__ = name
+    return func
+
+
+def kwargs_from_json(json_node):
+    def resolve(kwargs):
+        kwargs = dict(kwargs)
+        return named(kwargs.pop('function')), kwargs
+    return {'harbor': resolve(json_node['harbor']),
+            'pre_memory': [resolve(k) for k in json_node['pre_memory']],
+            'memory': resolve(json_node['memory']),
+            'post_memory': [resolve(k) for k in json_node['post_memory']]}
+
+
+def json_shapes(json_name):
+    with open(os.path.join(json_dir, json_name)) as f:
+        json_nodes = json.load(f)['nodes']
+    output_shapes = {}
+    state_shapes = {}
+    for json_node in json_nodes:
+        if 'shape' in json_node:
+            harbor_shape = [BATCH_SIZE] + json_node['shape']
+        else:
+            harbor_shape = output_shapes[json_node['shape_from']]
+        kwargs = kwargs_from_json(json_node)
+        output_shapes[json_node['name']], state_shapes[json_node['name']] = \
+            shapes.cell_shapes(kwargs, harbor_shape)
+    return output_shapes, state_shapes
+
+
+def test_alexnet_shapes():
+    output_shapes, state_shapes = json_shapes('alexnet.json')
+
+    assert state_shapes['conv1'] == [BATCH_SIZE, 54, 54, 96]
+    assert state_shapes['conv2'] == [BATCH_SIZE, 27, 27, 256]
+    assert state_shapes['conv3'] == [BATCH_SIZE, 14, 14, 384]
+    assert state_shapes['conv5'] == [BATCH_SIZE, 14, 14, 256]
+    assert state_shapes['fc6'] == [BATCH_SIZE, 4096]
+
+    assert output_shapes['conv1'] == [BATCH_SIZE, 27, 27, 96]
+    assert output_shapes['conv2'] == [BATCH_SIZE, 14, 14, 256]
+    assert output_shapes['conv4'] == [BATCH_SIZE, 14, 14, 384]
+    assert output_shapes['conv5'] == [BATCH_SIZE, 7, 7, 256]
+    assert output_shapes['fc7'] == [BATCH_SIZE, 4096]
+    assert output_shapes['fc8'] == [BATCH_SIZE, 1000]
+
+
+def test_mnist_shapes():
+    output_shapes, _ = json_shapes('mnist_conv.json')
+    assert output_shapes['conv2'] == [BATCH_SIZE, 7, 7, 64]
+    assert output_shapes['fc2'] == [BATCH_SIZE, 10]
+    output_shapes, _ = json_shapes('mnist_fc.json')
+    assert output_shapes['fc1'] == [BATCH_SIZE, 2048]
+
+
+def test_unknown_function():
+    kwargs = {'harbor': (named('harbor'), {}),
+              'pre_memory': [(named('my_custom_layer'), {})],
+              'memory': (named('memory'), {}),
+              'post_memory': []}
+    assert shapes.cell_shapes(kwargs, [BATCH_SIZE, 10]) is None
+
+
+def test_harbor_policy():
+    shape = shapes.harbor_policy([[BATCH_SIZE, 27, 27, 96], [BATCH_SIZE, 14, 14, 256]],
+                                 [BATCH_SIZE, 14, 14, 256])
+    assert shape == [BATCH_SIZE, 14, 14, 96 + 256]
+    shape = shapes.harbor_policy([[BATCH_SIZE, 4096], [BATCH_SIZE, 7, 7, 256]],
+                                 [BATCH_SIZE, 4096])
+    assert shape == [BATCH_SIZE, 4096 + 7 * 7 * 256]
+    shape = shapes.harbor_policy([[BATCH_SIZE, 4096], [BATCH_SIZE, 7, 7, 256]],
+                                 [BATCH_SIZE, 4096], channel_op='add')
+    assert shape == [BATCH_SIZE, 4096]
+
+
+def alexnet_graph():
+    with open(os.path.join(json_dir, 'alexnet.json')) as f:
+        json_data = json.load(f)
+    G = nx.DiGraph([(e['from'], e['to']) for e in json_data['edges']])
+    for json_node in json_data['nodes']:
+        attr = G.node[json_node['name']]
+        for key in ['shape', 'shape_from']:
+            if key in json_node:
+                attr[key] = json_node[key]
+        attr['kwargs'] = kwargs_from_json(json_node)
+    return G
+
+
+def test_resolve_bypass():
+    G = alexnet_graph()
+    G.add_edges_from([('conv1', 'conv3'), ('conv1', 'conv5'), ('conv3', 'conv5')])
+    shapes.resolve(G, ['conv1'], batch_size=BATCH_SIZE)
+    assert G.node['conv1']['kwargs']['harbor_shape'] == [BATCH_SIZE, 224, 224, 3]
+    assert G.node['conv3']['kwargs']['harbor_shape'] == [BATCH_SIZE, 14, 14, 96 + 256]
+    assert G.node['conv5']['kwargs']['harbor_shape'] == [BATCH_SIZE, 14, 14, 96 + 384 + 384]
+    assert G.node['fc6']['kwargs']['harbor_shape'] == [BATCH_SIZE, 7, 7, 256]
+    assert G.node['fc8']['output_shape'] == [BATCH_SIZE, 1000]
+
+
+def test_resolve_incremental():
+    G = alexnet_graph()
+    updated = shapes.resolve(G, ['conv1'], batch_size=BATCH_SIZE)
+    assert sorted(updated) == sorted(G.nodes())
+    assert shapes.resolve(G, ['conv1'], batch_size=BATCH_SIZE) == []
+
+    G.add_edges_from([('conv5', 'fc7')])
+    assert shapes.resolve(G, ['conv1'], batch_size=BATCH_SIZE) == ['fc7']
+    assert G.node['fc7']['kwargs']['harbor_shape'] == [BATCH_SIZE, 4096 + 7 * 7 * 256]
+
+    updated = shapes.resolve(G, ['conv1'], batch_size=BATCH_SIZE // 2)
+    assert sorted(updated) == sorted(G.nodes())
+    assert G.node['fc7']['kwargs']['harbor_shape'] == [BATCH_SIZE // 2, 4096 + 7 * 7 * 256]
+
+
+def test_resolve_errors():
+    G = alexnet_graph()
+    G.node['conv2']['shape_from'] = 'conv3'
+    G.node['conv3']['shape_from'] = 'conv2'
+    with pytest.raises(ValueError) as excinfo:
+        shapes.resolve(G, ['conv1'], batch_size=BATCH_SIZE)
+    assert 'cycle' in str(excinfo.value)
+
+    G = alexnet_graph()
+    G.node['conv4']['shape_from'] = 'conv9'
+    with pytest.raises(ValueError) as excinfo:
+        shapes.resolve(G, ['conv1'], batch_size=BATCH_SIZE)
+    assert 'conv9' in str(excinfo.value)
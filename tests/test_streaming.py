@@ -0,0 +1,43 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from tnn import main, streaming
+
+BATCH_SIZE = 4
+NTIMES = 5
+MEM = .5
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def test_streamer():
+    frames = np.random.standard_normal([NTIMES, BATCH_SIZE, 28, 28, 1]).astype(np.float32)
+    with tf.Graph().as_default():
+        with tf.variable_scope('tconvnet'):
+            G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+            G.add_edges_from([('conv2', 'conv1')])
+            G.node['conv1']['kwargs']['memory'][1]['memory_decay'] = MEM
+            main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+            main.unroll(G, input_seq={'conv1': [tf.constant(f) for f in frames]}, ntimes=NTIMES)
+            unrolled = G.node['fc2']['outputs']
+            streamer = streaming.Streamer(G, ['conv1'])
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            expected = sess.run(unrolled)
+            streamer.reset()
+            for t in range(NTIMES):
+                outputs = streamer.step(frames[t])
+                assert np.allclose(outputs['fc2'], expected[t], atol=1e-4)
+            assert list(streamer.steps()) == [NTIMES] * BATCH_SIZE
+
+            # a reset stream starts over while the others go on
+            streamer.reset(streams=[1])
+            outputs = streamer.step(frames[0])
+            assert np.allclose(outputs['fc2'][1], expected[0][1], atol=1e-4)
+            assert list(streamer.steps()) == [NTIMES + 1, 1, NTIMES + 1, NTIMES + 1]
@@ -0,0 +1,44 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from tnn import main, tbptt
+
+BATCH_SIZE = 4
+NTIMES = 6
+K = 2
+MEM = .5
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+json_dir = os.path.join(os.path.split(this_dir)[0], 'json')
+
+
+def test_truncated_unroll():
+    sequence = np.random.standard_normal([NTIMES, BATCH_SIZE, 28, 28, 1]).astype(np.float32)
+    with tf.Graph().as_default():
+        with tf.variable_scope('tconvnet'):
+            G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+            G.add_edges_from([('fc1', 'conv2')])
+            G.node['conv2']['kwargs']['memory'][1]['memory_decay'] = MEM
+            main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+            main.unroll(G, input_seq={'conv1': [tf.constant(s) for s in sequence]}, ntimes=NTIMES)
+            full = G.node['fc2']['outputs']
+            truncated = tbptt.TruncatedUnroll(G, ['conv1'], K)
+
+        assert len(truncated.outputs['fc2']) == K
+        loss = tf.reduce_sum(truncated.outputs['fc2'][-1])
+        carried = truncated.state.outputs + truncated.state.states
+        assert all([g is None for g in tf.gradients(loss, carried)])
+        weights = tf.trainable_variables()
+        assert all([g is not None for g in tf.gradients(loss, weights)])
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            expected = sess.run(full)
+            chunks = truncated.run_sequence(sequence, fetches=truncated.outputs['fc2'])
+            outputs = [o for chunk in chunks for o in chunk]
+            for out, exp in zip(outputs, expected):
+                assert np.allclose(out, exp, atol=1e-4)
@@ -5,7 +5,7 @@ import numpy as np
 import tensorflow as tf
 import math
 
-from tnn import main
+from tnn import main, registry
 
 BATCH_SIZE = 256
 MEM = .5
@@ -315,6 +315,245 @@ def test_feedback():
         assert np.array_equal(conv3hr, concatr)
 
 
+def test_while_unroll():
+    images = tf.constant(np.random.standard_normal([BATCH_SIZE, 224, 224, 3]).astype(np.float32))
+    with tf.variable_scope('tconvnet'):
+        json_path = os.path.join(json_dir, 'alexnet.json')
+        G = main.graph_from_json(json_path)
+        G.add_edges_from([('conv1', 'conv3'), ('fc7', 'conv5')])
+        main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+        main.unroll(G, input_seq={'conv1': images}, ntimes=6)
+        static_outputs = {n: G.node[n]['outputs'] for n in G}
+        static_states = {n: G.node[n]['states'] for n in G}
+        # cells are already built, so the loop reuses the same variables
+        main.unroll(G, input_seq={'conv1': images}, ntimes=6, mode='while')
+
+    for node in G:
+        assert len(G.node[node]['outputs']) == 6
+        assert len(G.node[node]['states']) == 6
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        for node in ['conv3', 'conv5', 'fc8']:
+            static_res, while_res = sess.run([static_outputs[node], G.node[node]['outputs']])
+            for s, w in zip(static_res, while_res):
+                assert np.allclose(s, w, atol=1e-5)
+            static_res, while_res = sess.run([static_states[node], G.node[node]['states']])
+            for s, w in zip(static_res, while_res):
+                assert np.allclose(s, w, atol=1e-5)
+
+
+def test_wavefront():
+    images = tf.constant(np.random.standard_normal([BATCH_SIZE, 224, 224, 3]).astype(np.float32))
+    graph = tf.get_default_graph()
+    with tf.variable_scope('tconvnet'):
+        json_path = os.path.join(json_dir, 'alexnet.json')
+        G = main.graph_from_json(json_path)
+        G.add_edges_from([('conv1', 'conv3')])
+        main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+        nops = len(graph.get_operations())
+        main.unroll(G, input_seq={'conv1': images})
+        full_output = G.node['fc8']['outputs'][-1]
+        nops_full = len(graph.get_operations()) - nops
+        nops = len(graph.get_operations())
+        main.unroll(G, input_seq={'conv1': images}, wavefront=True)
+        nops_wavefront = len(graph.get_operations()) - nops
+
+    assert nops_wavefront < nops_full / 2
+    # conv1 cannot affect fc8 at the last step anymore
+    assert G.node['conv1']['outputs'][-1] is None
+    # fc8 has not received any signal at the first step, and its biases make
+    # its output differ from zeros
+    assert G.node['fc8']['outputs'][0] is None
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        full, wavefront = sess.run([full_output, G.node['fc8']['outputs'][-1]])
+        assert np.allclose(full, wavefront, atol=1e-5)
+
+
+def test_wavefront_feedback():
+    # conv2, fc1 and fc2 have biases, so their outputs are not zero before
+    # any signal reaches them; fc1 feeds them back to conv2
+    with tf.Graph().as_default():
+        images = tf.constant(np.random.standard_normal([BATCH_SIZE, 28, 28, 1]).astype(np.float32))
+        with tf.variable_scope('tconvnet'):
+            G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+            G.add_edges_from([('fc1', 'conv2')])
+            G.node['fc1']['kwargs']['memory'][1]['memory_decay'] = MEM
+            main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+            main.unroll(G, input_seq={'conv1': images}, ntimes=6)
+            full = dict((n, {'outputs': G.node[n]['outputs'], 'states': G.node[n]['states']})
+                        for n in G)
+            main.unroll(G, input_seq={'conv1': images}, ntimes=6, wavefront=True)
+            wave = dict((n, {'outputs': G.node[n]['outputs'], 'states': G.node[n]['states']})
+                        for n in G)
+
+        # only fc2 is left out until the signal reaches it
+        assert all([wave[n]['outputs'][0] is not None for n in ['conv1', 'conv2', 'fc1']])
+        assert wave['fc2']['outputs'][:3] == [None] * 3
+        assert wave['fc2']['states'][:3] == [None] * 3
+        # every entry that is not None is the same as in the full unroll
+        pairs = []
+        for node in G:
+            for key in ['outputs', 'states']:
+                pairs.extend([(f, w) for f, w in zip(full[node][key], wave[node][key])
+                              if w is not None])
+        # conv1, conv2 and fc1 no longer reach fc2 in the last 3, 2 and 1 steps
+        assert len(pairs) == 2 * (4 * 6 - 3 - (3 + 2 + 1))
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            for f, w in sess.run(pairs):
+                assert np.allclose(f, w, atol=1e-5)
+
+
+def test_hoist():
+    images = tf.constant(np.random.standard_normal([BATCH_SIZE, 224, 224, 3]).astype(np.float32))
+    graph = tf.get_default_graph()
+    with tf.variable_scope('tconvnet'):
+        json_path = os.path.join(json_dir, 'alexnet.json')
+        G = main.graph_from_json(json_path)
+        G.add_edges_from([('conv1', 'conv3')])
+        G.node['conv2']['kwargs']['memory'][1]['memory_decay'] = MEM
+        main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+        nops = len(graph.get_operations())
+        main.unroll(G, input_seq={'conv1': images}, ntimes=6)
+        full_outputs = {n: G.node[n]['outputs'] for n in G}
+        nops_full = len(graph.get_operations()) - nops
+        nops = len(graph.get_operations())
+        main.unroll(G, input_seq={'conv1': images}, ntimes=6, hoist=True)
+        nops_hoist = len(graph.get_operations()) - nops
+
+    assert nops_hoist < nops_full
+    # conv1 always gets the same image and does not decay
+    assert all([o is G.node['conv1']['outputs'][0] for o in G.node['conv1']['outputs']])
+    # conv2 decays, so only its harbor and convolution are shared
+    assert G.node['conv2']['outputs'][4] is not G.node['conv2']['outputs'][5]
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        for node in ['conv1', 'conv2', 'conv3', 'fc8']:
+            full, hoisted = sess.run([full_outputs[node], G.node[node]['outputs']])
+            for f, h in zip(full, hoisted):
+                assert np.allclose(f, h, atol=1e-5)
+
+
+def test_compile_plan():
+    images = tf.constant(np.random.standard_normal([BATCH_SIZE, 224, 224, 3]).astype(np.float32))
+    with tf.variable_scope('tconvnet'):
+        json_path = os.path.join(json_dir, 'alexnet.json')
+        G = main.graph_from_json(json_path)
+        G.add_edges_from([('conv1', 'conv3'), ('fc7', 'conv5')])
+        main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+        plan = main.compile_plan(G, ['conv1'])
+        conv5 = plan.nodes.index('conv5')
+        assert [plan.nodes[p] for p in plan.preds[conv5]] == ['conv4', 'fc7']
+        assert plan.edges[conv5] == ('feedforward', 'feedback')
+        assert plan.inputs[plan.nodes.index('conv1')] == 'conv1'
+
+        main.unroll(G, input_seq={'conv1': images}, ntimes=4)
+        main.unroll(G, input_seq={'conv1': images}, ntimes=6)
+        assert main.compile_plan(G, ['conv1']) is plan
+        assert len(G.node['fc8']['outputs']) == 6
+
+        G.add_edges_from([('conv2', 'conv4')])
+        assert main.compile_plan(G, ['conv1']) is not plan
+
+
+def test_unroll_until():
+    images = tf.constant(np.random.standard_normal([BATCH_SIZE, 28, 28, 1]).astype(np.float32))
+    with tf.variable_scope('tconvnet'):
+        json_path = os.path.join(json_dir, 'mnist_conv.json')
+        G = main.graph_from_json(json_path)
+        G.add_edges_from([('fc1', 'conv2')])
+        main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+        main.unroll(G, input_seq={'conv1': images}, ntimes=5)
+        full = G.node['fc2']['outputs']
+        never = main.unroll_until(G, {'conv1': images}, lambda outputs: tf.zeros([BATCH_SIZE], tf.bool), ntimes=5)
+        always = main.unroll_until(G, {'conv1': images}, main.confidence_halt('fc2', 0.), ntimes=5)
+        some = main.unroll_until(G, {'conv1': images}, main.confidence_halt('fc2', .5), ntimes=5)
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        full, never, always, some = sess.run([full, never, always, some])
+    assert never['nsteps'] == 5
+    assert np.all(never['exit_steps'] == 4)
+    assert np.allclose(never['outputs']['fc2'], full[-1], atol=1e-5)
+    assert always['nsteps'] == 1
+    assert np.all(always['exit_steps'] == 0)
+    assert np.allclose(always['outputs']['fc2'], full[0], atol=1e-5)
+    # every example has the outputs of the step it exited at
+    for i, t in enumerate(some['exit_steps']):
+        assert np.allclose(some['outputs']['fc2'][i], full[t][i], atol=1e-5)
+
+
+def test_fetches():
+    images = tf.constant(np.random.standard_normal([BATCH_SIZE, 28, 28, 1]).astype(np.float32))
+    with tf.variable_scope('tconvnet'):
+        json_path = os.path.join(json_dir, 'mnist_conv.json')
+        G = main.graph_from_json(json_path)
+        G.add_edges_from([('fc1', 'conv2')])
+        main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+        main.unroll(G, input_seq={'conv1': images}, ntimes=6)
+        full = [G.node['fc2']['outputs'][-1], G.node['fc1']['outputs'][3]]
+        report = main.unroll(G, input_seq={'conv1': images}, ntimes=6,
+                             fetches=['fc2', ('fc1', 3)])
+        assert report['kept'] == 2
+        assert report['dropped'] == 4 * 6 - 2
+        assert report['dropped_bytes'] > report['kept_bytes']
+        # conv1, conv2 and fc1 can no longer reach fc2 in the last 3, 2 and 1 steps
+        assert report['skipped_steps'] == 3 + 2 + 1
+        assert G.node['fc2']['outputs'][:-1] == [None] * 5
+        assert G.node['conv1']['outputs'] == [None] * 6
+        fetched = [G.node['fc2']['outputs'][-1], G.node['fc1']['outputs'][3]]
+
+        main.unroll(G, input_seq={'conv1': images}, ntimes=6, mode='while',
+                    fetches=['fc2', ('fc1', 3)])
+        looped = [G.node['fc2']['outputs'][-1], G.node['fc1']['outputs'][3]]
+        assert G.node['conv2']['outputs'] == [None] * 6
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        full, fetched, looped = sess.run([full, fetched, looped])
+    for f, g, h in zip(full, fetched, looped):
+        assert np.allclose(f, g, atol=1e-5)
+        assert np.allclose(f, h, atol=1e-5)
+
+
+def test_dynamic_batch():
+    with tf.Graph().as_default():
+        images = tf.placeholder(tf.float32, shape=[None, 28, 28, 1])
+        with tf.variable_scope('tconvnet'):
+            G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+            G.add_edges_from([('conv2', 'conv1'), ('fc1', 'conv2'), ('conv1', 'fc1')])
+            for node in ['fc1', 'fc2']:  # tfutils' fc needs a static batch size
+                pre_memory = G.node[node]['kwargs']['pre_memory']
+                G.node[node]['kwargs']['pre_memory'] = [(registry.lookup('dynamic_fc'), kwargs)
+                                                        for _, kwargs in pre_memory]
+            main.init_nodes(G, input_nodes=['conv1'], batch_size=None)
+            main.unroll(G, input_seq={'conv1': images}, ntimes=5)
+            dynamic = G.node['fc2']['outputs'][-1]
+        assert G.node['fc2']['output_shape'] == [None, 10]
+        assert dynamic.shape.as_list() == [None, 10]
+
+        # the same weights in a graph built for a fixed batch size with tfutils' fc
+        data = np.random.standard_normal([BATCH_SIZE, 28, 28, 1]).astype(np.float32)
+        with tf.variable_scope('tconvnet', reuse=True):
+            G = main.graph_from_json(os.path.join(json_dir, 'mnist_conv.json'))
+            G.add_edges_from([('conv2', 'conv1'), ('fc1', 'conv2'), ('conv1', 'fc1')])
+            main.init_nodes(G, input_nodes=['conv1'], batch_size=BATCH_SIZE)
+            main.unroll(G, input_seq={'conv1': tf.constant(data)}, ntimes=5)
+            static = G.node['fc2']['outputs'][-1]
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            expected = sess.run(static)
+            for batch_size in [BATCH_SIZE, 7, 1]:
+                res = sess.run(dynamic, feed_dict={images: data[:batch_size]})
+                assert res.shape == (batch_size, 10)
+                assert np.allclose(res, expected[:batch_size], atol=1e-4)
+
+
 if __name__ == '__main__':
 #    test_memory()
 
@@ -326,4 +565,3 @@ if __name__ == '__main__':
 
 #    tf.reset_default_graph()
     test_feedback2()
-
@@ -0,0 +1,111 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import random
+import itertools
+
+import networkx as nx
+
+from tnn import config, shapes, topology
+
+
+def simple_paths_length(G, input_nodes):
+    lengths = [0]
+    for inp, out in itertools.product(input_nodes, topology.output_nodes(G)):
+        if inp == out:
+            continue
+        lengths.extend([len(p) for p in nx.all_simple_paths(G, inp, out)])
+    return max(lengths)
+
+
+def alexnet_graph():
+    names = ['conv1', 'conv2', 'conv3', 'conv4', 'conv5', 'fc6', 'fc7', 'fc8']
+    return nx.DiGraph(list(zip(names[:-1], names[1:])))
+
+
+def test_longest_path_bypass():
+    G = alexnet_graph()
+    assert topology.longest_path_length(G, ['conv1']) == 8
+    G.add_edges_from([('conv1', 'conv3'), ('conv1', 'conv5'), ('conv3', 'conv5')])
+    assert topology.longest_path_length(G, ['conv1']) == simple_paths_length(G, ['conv1']) == 8
+
+
+def test_longest_path_feedback():
+    G = alexnet_graph()
+    G.add_edges_from([('conv5', 'conv3'), ('conv5', 'conv4'), ('conv4', 'conv3')])
+    assert topology.longest_path_length(G, ['conv1']) == simple_paths_length(G, ['conv1'])
+    G = alexnet_graph()
+    G.add_edges_from([('fc7', 'conv5')])
+    assert topology.longest_path_length(G, ['conv1']) == simple_paths_length(G, ['conv1'])
+
+
+def test_longest_path_single_node():
+    G = nx.DiGraph()
+    G.add_node('fc')
+    assert topology.longest_path_length(G, ['fc']) == 0
+
+
+def test_longest_path_random_dags():
+    rng = random.Random(0)
+    for _ in range(20):
+        nnodes = rng.randint(2, 12)
+        G = nx.DiGraph()
+        G.add_nodes_from(range(nnodes))
+        for i, j in itertools.combinations(range(nnodes), 2):
+            if rng.random() < .3:
+                G.add_edge(i, j)
+        input_nodes = [n for n in G if len(list(G.predecessors(n))) == 0]
+        assert topology.longest_path_length(G, input_nodes) == simple_paths_length(G, input_nodes)
+
+
+def test_longest_path_cache():
+    G = alexnet_graph()
+    assert topology.longest_path_length(G, ['conv1']) == 8
+    G.add_edges_from([('fc6', 'fc9')])
+    assert topology.longest_path_length(G, ['conv1']) == 8
+    G.add_edges_from([('fc8', 'fc10')])
+    assert topology.longest_path_length(G, ['conv1']) == 9
+
+
+def test_distances():
+    G = alexnet_graph()
+    G.add_edges_from([('conv1', 'conv3'), ('fc7', 'conv5')])
+    dist_in = topology.distances(G, ['conv1'])
+    assert dist_in == {'conv1': 0, 'conv2': 1, 'conv3': 1, 'conv4': 2,
+                       'conv5': 3, 'fc6': 4, 'fc7': 5, 'fc8': 6}
+    dist_out = topology.distances(G, topology.output_nodes(G), reverse=True)
+    assert dist_out == {'conv1': 6, 'conv2': 6, 'conv3': 5, 'conv4': 4,
+                        'conv5': 3, 'fc6': 2, 'fc7': 1, 'fc8': 0}
+
+
+def test_edge_types():
+    G = alexnet_graph()
+    for pred, node in list(G.edges()):
+        G.node[node]['shape_from'] = pred
+    G.add_edges_from([('conv1', 'conv3'), ('fc7', 'conv5'), ('conv5', 'conv5')])
+    types = topology.edge_types(G, ['conv1'])
+    assert types[('conv1', 'conv2')] == 'feedforward'
+    assert types[('fc7', 'fc8')] == 'feedforward'
+    assert types[('conv1', 'conv3')] == 'skip'
+    assert types[('fc7', 'conv5')] == 'feedback'
+    assert types[('conv5', 'conv5')] == 'feedback'
+    assert len(types) == G.number_of_edges()
+
+
+def test_wavefront():
+    json_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                             'json', 'mnist_conv.json')
+    G = config.graph_from_json(json_path)
+    shapes.resolve(G, ['conv1'], batch_size=8)
+    first, last = topology.wavefront(G, ['conv1'], 4)
+    assert first == {'conv1': 0, 'conv2': 1, 'fc1': 2, 'fc2': 3}
+    assert last == first
+    # the biased output of fc1 before the signal reaches it is fed back to conv2
+    G.add_edges_from([('fc1', 'conv2')])
+    shapes.resolve(G, ['conv1'], batch_size=8)
+    first, last = topology.wavefront(G, ['conv1'], 6)
+    assert first == {'conv1': 0, 'conv2': 0, 'fc1': 0, 'fc2': 3}
+    # a decaying memory depends on all previous steps
+    G.node['fc2']['kwargs']['memory'][1]['memory_decay'] = .5
+    first, last = topology.wavefront(G, ['conv1'], 6)
+    assert first['fc2'] == 0
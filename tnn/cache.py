@@ -0,0 +1,165 @@
+"""
+On-disk cache of unrolled graphs
+
+Building a large unrolled graph (`graph_from_json`, `init_nodes` and
+`unroll`) can take longer than running it, and is identical every time for
+the same config. `unroll_from_json` stores the unrolled graph as a MetaGraph
+together with the names of the output and state tensors of every node, and
+imports it on the next call instead of building it again.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import networkx as nx
+import tensorflow as tf
+
+import tnn
+import tnn.main
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.tnn', 'cache')
+
+
+def cache_key(json_file_name, input_nodes, batch_size=256, ntimes=None,
+              channel_op='concat', edges=None, mode='static'):
+    """
+    Hash of everything that determines the unrolled graph
+    """
+    with open(json_file_name, 'rb') as f:
+        key = hashlib.sha1(f.read())
+    params = {'input_nodes': sorted(input_nodes),
+              'edges': sorted([list(e) for e in edges or []]),
+              'batch_size': batch_size,
+              'ntimes': ntimes,
+              'channel_op': channel_op,
+              'mode': mode,
+              'tnn': tnn.__version__,
+              'tensorflow': tf.__version__}
+    key.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return key.hexdigest()
+
+
+def unroll_from_json(json_file_name, input_nodes, batch_size=256, ntimes=None,
+                     channel_op='concat', edges=None, mode='static',
+                     cache_dir=None, scope=None):
+    """
+    Builds an unrolled graph from a json config, or imports it from the cache
+
+    The graph is built in a separate tf.Graph with a placeholder for each
+    input node, stored in `cache_dir` and then imported into the default
+    graph, so cold and warm starts produce exactly the same tensors.
+
+    :Args:
+        - json_file_name (str)
+        - input_nodes (list)
+            Names of the input nodes
+    :Kwargs:
+        - batch_size (int, default: 256)
+        - ntimes (int or None, default: None)
+            The number of time steps, see `unroll`
+        - channel_op (str, default: 'concat')
+        - edges (list or None, default: None)
+            Extra (from, to) edges added after `graph_from_json`, e.g. bypass
+            and feedback connections
+        - mode (str, default: 'static')
+            Unroll mode, see `unroll`
+        - cache_dir (str or None, default: None)
+            Where to keep the cached graphs. Defaults to `~/.tnn/cache`.
+        - scope (str or None, default: None)
+            Name scope to import the graph into, made unique like any name
+            scope. Defaults to 'tnn_cache', so the imported tensors never
+            clash with the ones already in the graph.
+
+    :Returns:
+        A NetworkX DiGraph with the same `outputs`, `states`,
+        `output_shape` and `harbor_shape` attributes as after `unroll`. Cells
+        are not available (`attr['cell']` is None). The input placeholders
+        are in `G.graph['inputs']`.
+    """
+    if cache_dir is None:
+        cache_dir = DEFAULT_CACHE_DIR
+    edges = [tuple(e) for e in edges or []]
+    key = cache_key(json_file_name, input_nodes, batch_size=batch_size,
+                    ntimes=ntimes, channel_op=channel_op, edges=edges, mode=mode)
+    path = os.path.join(cache_dir, key)
+
+    if not os.path.isdir(path):
+        _build(path, json_file_name, input_nodes, batch_size, ntimes,
+               channel_op, edges, mode)
+    return _load(path, json_file_name, edges, scope)
+
+
+def _build(path, json_file_name, input_nodes, batch_size, ntimes, channel_op, edges, mode):
+    with tf.Graph().as_default() as graph:
+        G = tnn.main.graph_from_json(json_file_name)
+        G.add_edges_from(edges)
+        tnn.main.init_nodes(G, input_nodes=input_nodes, batch_size=batch_size,
+                            channel_op=channel_op)
+        inputs = {}
+        for node in input_nodes:
+            attr = G.node[node]
+            inputs[node] = tf.placeholder(attr.get('dtype', tf.float32),
+                                          shape=attr['kwargs']['harbor_shape'],
+                                          name='inputs/' + node)
+        tnn.main.unroll(G, input_seq=dict(inputs), ntimes=ntimes, mode=mode)
+
+        names = lambda tensors: [None if t is None else t.name for t in tensors]
+        tensors = {'inputs': dict((n, t.name) for n, t in inputs.items()),
+                   'nodes': {}}
+        for node, attr in G.nodes(data=True):
+            tensors['nodes'][node] = {'outputs': names(attr['outputs']),
+                                      'states': names(attr['states']),
+                                      'output_shape': attr['output_shape'],
+                                      'harbor_shape': attr['kwargs']['harbor_shape']}
+
+        # write to a temporary directory first so that concurrent processes
+        # never see a half-written entry
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        tmp_path = tempfile.mkdtemp(dir=parent)
+        tf.train.export_meta_graph(filename=os.path.join(tmp_path, 'graph.meta'),
+                                   graph=graph)
+    with open(os.path.join(tmp_path, 'tensors.json'), 'w') as f:
+        json.dump(tensors, f, default=int)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:  # another process got there first
+        shutil.rmtree(tmp_path)
+
+
+def _load(path, json_file_name, edges, scope):
+    with open(os.path.join(path, 'tensors.json')) as f:
+        tensors = json.load(f)
+    graph = tf.get_default_graph()
+    # import into a scope that is not in use yet: the tensors of a graph
+    # imported without one would get renamed if the names are taken, and
+    # looking them up by name would return the tensors that were there first
+    scope = graph.unique_name(scope or 'tnn_cache', mark_as_used=False)
+    with graph.name_scope(None):
+        tf.train.import_meta_graph(os.path.join(path, 'graph.meta'), import_scope=scope)
+    get = lambda name: None if name is None else graph.get_tensor_by_name(scope + '/' + name)
+
+    json_nodes, json_edges = tnn.main.import_json(json_file_name)
+    G = nx.DiGraph()
+    G.add_nodes_from([str(n['name']) for n in json_nodes])
+    G.add_edges_from(json_edges)
+    G.add_edges_from(edges)
+    for json_node in json_nodes:
+        attr = G.node[json_node['name']]
+        for key in ['shape', 'shape_from', 'dtype']:
+            if key in json_node:
+                attr[key] = json_node[key]
+        node_tensors = tensors['nodes'][json_node['name']]
+        attr['cell'] = None
+        attr['kwargs'] = {'harbor_shape': node_tensors['harbor_shape']}
+        attr['output_shape'] = node_tensors['output_shape']
+        attr['outputs'] = [get(name) for name in node_tensors['outputs']]
+        attr['states'] = [get(name) for name in node_tensors['states']]
+    G.graph['inputs'] = dict((n, get(name)) for n, name in tensors['inputs'].items())
+    return G
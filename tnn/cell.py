@@ -6,11 +6,79 @@ from __future__ import absolute_import, division, print_function
 
 import re
 import math
+import collections
+
 import numpy as np
 import tensorflow as tf
 from tensorflow.contrib.rnn import RNNCell
 
 import tfutils.model
+import tnn.precision
+
+
+class HarborInput(collections.namedtuple('HarborInput', ['tensor', 'source', 'edge', 'time'])):
+    """
+    An input to a cell tagged with where it came from
+
+    :Fields:
+        - tensor
+        - source (str or None)
+            Name of the node that produced the tensor, None for inputs fed from outside of the graph
+        - edge (str)
+            'input' for inputs from outside of the graph, or 'feedforward', 'skip' or 'feedback'
+        - time (int or tensor)
+            Time step at which the source produced the tensor
+    """
+    __slots__ = ()
+
+
+def _tensor(inp):
+    return inp.tensor if isinstance(inp, HarborInput) else inp
+
+
+def _source(inp, l1_inpnm=None):
+    """Name of the node an input came from"""
+    if isinstance(inp, HarborInput):
+        if inp.edge == 'input':
+            return 'input' if l1_inpnm is None else l1_inpnm
+        return inp.source
+    # plain tensors: recover the node from names such as 'scope/conv2_3/output:0'
+    if l1_inpnm is not None and l1_inpnm in inp.name:
+        return l1_inpnm
+    pat = re.compile(':|/')
+    return pat.sub('__', inp.name.split('/')[-2].split('_')[0])
+
+
+def _shape(tensor):
+    """
+    Shape of a tensor as a list, with the dimensions that are unknown when
+    the graph is built (such as a dynamic batch size) read from `tf.shape`
+    """
+    static = tensor.shape.as_list()
+    if None not in static:
+        return static
+    dynamic = tf.shape(tensor)
+    return [dynamic[i] if dim is None else dim for i, dim in enumerate(static)]
+
+
+def _flatten(tensor, name=None):
+    """Reshapes to [batch, features] without relying on a static batch size"""
+    return tf.reshape(tensor, [-1, int(np.prod(tensor.shape.as_list()[1:]))], name=name)
+
+
+def _cast(inp, dtype, cache=None):
+    """Casts an input to `dtype`; with `cache`, every tensor is cast only once"""
+    tensor = _tensor(inp)
+    if cache is None:
+        cast = tnn.precision.cast(tensor, dtype)
+    else:
+        if tensor not in cache:
+            cache[tensor] = tnn.precision.cast(tensor, dtype)
+        cast = cache[tensor]
+    if isinstance(inp, HarborInput):
+        return inp._replace(tensor=cast)
+    return cast
+
 
 def gather_inputs(inputs, shape, l1_inpnm, ff_inpnm, node_nms):
     '''Helper function that returns the skip, feedforward, and feedback inputs'''
@@ -34,20 +102,17 @@ def gather_inputs(inputs, shape, l1_inpnm, ff_inpnm, node_nms):
     feedback_ins = []
     ff_in = None
     for inp in inputs:
-        pat = re.compile(':|/')
-        if l1_inpnm not in inp.name:
-            nm = pat.sub('__', inp.name.split('/')[-2].split('_')[0])
-        else:
-            nm = l1_inpnm
-      
+        nm = _source(inp, l1_inpnm) # records know their source, plain tensors are parsed
+
         if ff_inpnm == nm:
             ff_in = inp
         elif nm in feedbacks: # a feedback input
-            if len(inp.shape) == 4: # flatten conv inputs to pass through mlp later
-                reshaped_inp = tf.reshape(inp, [inp.get_shape().as_list()[0], -1])
+            tensor = _tensor(inp)
+            if len(tensor.shape) == 4: # flatten conv inputs to pass through mlp later
+                reshaped_inp = _flatten(tensor)
                 feedback_ins.append(reshaped_inp)
-            elif len(inp.shape) == 2:
-                feedback_ins.append(inp)
+            elif len(tensor.shape) == 2:
+                feedback_ins.append(tensor)
             else:
                 raise ValueError
         elif nm in skips:
@@ -55,132 +120,189 @@ def gather_inputs(inputs, shape, l1_inpnm, ff_inpnm, node_nms):
     
     return ff_in, skip_ins, feedback_ins
 
-def crop_func(inputs, l1_inpnm, ff_inpnm, node_nms, shape, kernel_init, channel_op, reuse):
+def box_mask(boxes, height, width, dtype=tf.float32):
+    """
+    Masks of shape [batch, height, width, 1] that are 1 inside a box per example
+
+    Each box is (offset_height, offset_width, target_height, target_width) as
+    fractions of the image size; the pixel coordinates are floored and the box
+    is clipped at the image border. The mask is built for the whole batch at
+    once by comparing coordinate grids with the box edges, and selects the
+    same pixels as padding a box of ones per example.
+    """
+    total_height = tf.constant(height, dtype=dtype)
+    total_width = tf.constant(width, dtype=dtype)
+    # compute bbox coords
+    offset_height = tf.floor(total_height * boxes[:, 0])
+    offset_width = tf.floor(total_width * boxes[:, 1])
+    target_height = tf.floor(total_height * boxes[:, 2])
+    target_width = tf.floor(total_width * boxes[:, 3])
+    # clip height and width of bounding box
+    height_val = tf.minimum(offset_height + target_height, total_height)
+    width_val = tf.minimum(offset_width + target_width, total_width)
+    # [batch, height, 1, 1] & [batch, 1, width, 1]
+    rows = tf.cast(tf.range(height), dtype)
+    cols = tf.cast(tf.range(width), dtype)
+    in_rows = tf.logical_and(rows >= offset_height[:, None], rows < height_val[:, None])
+    in_cols = tf.logical_and(cols >= offset_width[:, None], cols < width_val[:, None])
+    mask = tf.logical_and(in_rows[:, :, None, None], in_cols[:, None, :, None])
+    return tf.cast(mask, dtype)
+
+def crop_func(inputs, l1_inpnm, ff_inpnm, node_nms, shape, kernel_init, channel_op, reuse, gain=False):
+    """
+    Modulates the feedforward input with a bounding box predicted from the
+    feedback inputs
+
+    :Kwargs:
+        - gain (bool, default: False)
+            Compute `ff + alpha * mask * ff` as `ff * (1 + alpha * mask)`, a
+            single multiplication of the feedforward input with a broadcast
+            gain, instead of materializing the masked input. This happens
+            before and independently of the harbor's channel_op. Equal up to
+            floating point rounding.
+    """
     # note: e.g. node_nms = ['split', 'V1', 'V2', 'V4', 'pIT', 'aIT']
 
-    ff_in, skip_ins, feedback_ins = gather_inputs(inputs, shape, l1_inpnm, ff_inpnm, node_nms)
+    ff_record, skip_ins, feedback_ins = gather_inputs(inputs, shape, l1_inpnm, ff_inpnm, node_nms)
+    ff_in = None if ff_record is None else _tensor(ff_record)
     if len(feedback_ins) == 0 or ff_in is None or len(shape) != 4 or len(ff_in.shape) != 4: # we do nothing in this case, and proceed as usual (appeases initialization too)
         return inputs
     feedback_ins = tf.concat(feedback_ins, axis=-1, name='comb')
     mlp_nm = 'crop_mlp_for_%s' % ff_inpnm
     with tf.variable_scope(mlp_nm, reuse=reuse):
-        mlp_out = tfutils.model.fc(feedback_ins, 5, kernel_init=kernel_init, activation=None) # best way to initialize this?
+        mlp_out = dynamic_fc(feedback_ins, 5, kernel_init=kernel_init, activation=None) # best way to initialize this?
 
     alpha = tf.slice(mlp_out, [0, 0], [-1, 1])
     alpha = tf.expand_dims(tf.expand_dims(alpha, axis=-1), axis=-1)
     alpha = tf.nn.tanh(alpha) # we want to potentially have negatives to downweight
     boxes = tf.slice(mlp_out, [0, 1], [-1, 4])
     boxes = tf.nn.sigmoid(boxes) # keep values in [0, 1] range
-    # dimensions of original ff
-    total_height = tf.constant(ff_in.get_shape().as_list()[1], dtype=tf.float32)
-    total_width = tf.constant(ff_in.get_shape().as_list()[2], dtype=tf.float32)
-    total_depth = tf.constant(ff_in.get_shape().as_list()[3], dtype=tf.int32)
-    # compute bbox coords
-    offset_height_frac = tf.squeeze(tf.slice(boxes, [0, 0], [-1, 1]), axis=-1)
-    offset_height = tf.floor(total_height * offset_height_frac)
-    offset_width_frac = tf.squeeze(tf.slice(boxes, [0, 1], [-1, 1]), axis=-1)
-    offset_width = tf.floor(total_width * offset_width_frac)
-    target_height_frac = tf.squeeze(tf.slice(boxes, [0, 2], [-1, 1]))
-    target_height = tf.floor(total_height * target_height_frac)
-    target_width_frac = tf.squeeze(tf.slice(boxes, [0, 3], [-1, 1]))
-    target_width = tf.floor(total_width * target_width_frac)
-    # clip height and width of bounding box
-    height_val = tf.minimum(offset_height + target_height, total_height)
-    width_val = tf.minimum(offset_width + target_width, total_width)
-    clipped_target_height = height_val - offset_height
-    clipped_target_width = width_val - offset_width
-    rem_height = total_height - height_val
-    rem_width = total_width - width_val
-    # construct mask
-    offset_height = tf.cast(offset_height, tf.int32)
-    offset_width = tf.cast(offset_width, tf.int32)
-    clipped_target_height = tf.cast(clipped_target_height, tf.int32)
-    clipped_target_width = tf.cast(clipped_target_width, tf.int32)
-    rem_height = tf.cast(rem_height, tf.int32)
-    rem_width = tf.cast(rem_width, tf.int32)
-    elems = (offset_height, offset_width, clipped_target_height, clipped_target_width, rem_height, rem_width)
-    mask = tf.map_fn(lambda x: tf.pad(tf.ones([x[2], x[3], total_depth]), \
-        [[x[0], x[4]], [x[1], x[5]], [0, 0]], \
-        "CONSTANT"), elems, dtype=tf.float32)
-
-    padded_img = tf.multiply(ff_in, mask)
-    padded_img = tf.multiply(alpha, padded_img)
-    pat = re.compile(':|/')
-    ff_nm = pat.sub('__', ff_in.name.split('/')[-2].split('_')[0])
-    new_name = ff_nm + '_mod'
-    new_in = tf.add(ff_in, padded_img, name=new_name)
+    height, width = ff_in.get_shape().as_list()[1:3]
+    mask = box_mask(boxes, height, width, dtype=ff_in.dtype)
+
+    new_name = _source(ff_record, l1_inpnm) + '_mod'
+    if gain:
+        new_in = tf.multiply(ff_in, 1 + alpha * mask, name=new_name)
+    else:
+        padded_img = tf.multiply(ff_in, mask)
+        padded_img = tf.multiply(alpha, padded_img)
+        new_in = tf.add(ff_in, padded_img, name=new_name)
 
+    if isinstance(ff_record, HarborInput):
+        new_in = ff_record._replace(tensor=new_in)
     new_out = [new_in] + skip_ins # skips will be combined after
     return new_out
 
+def crop_or_pad(inp, height, width):
+    """
+    Batched equivalent of `tf.image.resize_image_with_crop_or_pad`
+
+    Centrally crops and/or zero-pads all images in a 4-D batch at once using
+    their static shape, instead of mapping over the images one by one.
+    """
+    inp_height, inp_width = inp.get_shape().as_list()[1:3]
+    # same offsets as tf.image.resize_image_with_crop_or_pad
+    crop_height = max(inp_height - height, 0) // 2
+    crop_width = max(inp_width - width, 0) // 2
+    pad_height = max(height - inp_height, 0) // 2
+    pad_width = max(width - inp_width, 0) // 2
+    out_height = min(height, inp_height)
+    out_width = min(width, inp_width)
+
+    out = inp
+    if out_height != inp_height or out_width != inp_width:
+        out = out[:, crop_height: crop_height + out_height, crop_width: crop_width + out_width]
+    if out_height != height or out_width != width:
+        out = tf.pad(out, [[0, 0],
+                           [pad_height, height - out_height - pad_height],
+                           [pad_width, width - out_width - pad_width],
+                           [0, 0]])
+    return out
+
 def tile_func(inp, shape):
     inp_height = inp.get_shape().as_list()[1]
     inp_width = inp.get_shape().as_list()[2]
     height_multiple = 1 + (shape[1] // inp_height)
     width_multiple = 1 + (shape[2] // inp_width)
     tiled_out = tf.tile(inp, [1, height_multiple, width_multiple, 1])
-    return tf.map_fn(lambda im: tf.image.resize_image_with_crop_or_pad(im, shape[1], shape[2]), tiled_out, dtype=tf.float32) 
+    return crop_or_pad(tiled_out, shape[1], shape[2])
 
-def harbor(inputs, shape, name, ff_inpnm=None, node_nms=None, l1_inpnm='split', preproc=None, spatial_op='resize', channel_op='concat', kernel_init='xavier', weight_decay=None, reuse=None):
+def harbor(inputs, shape, name, ff_inpnm=None, node_nms=None, l1_inpnm='split', preproc=None, spatial_op='resize', channel_op='concat', kernel_init='xavier', weight_decay=None, crop_gain=False, cache=None, reuse=None):
     """
     Default harbor function which can crop the input (as a preproc), followed by a spatial_op which by default resizes inputs to a desired shape (or pad or tile), and finished with a channel_op which by default concatenates along the channel dimension (or add or multiply based on user specification).
 
     :Args:
         - inputs
+            Tensors or `HarborInput` records. Inputs are dispatched on their source node, which records carry and which is parsed from the tensor name for plain tensors
         - shape
+    :Kwargs:
+        - crop_gain (bool, default: False)
+            Apply the crop as a broadcast gain on the feedforward input before the channel_op (see `crop_func`)
+        - cache (dict or None, default: None)
+            If given, each input tensor is only resized and projected once; the result is stored here and reused when the same tensor comes in again
     """
     outputs = []
     if preproc == 'crop':
-        inputs = crop_func(inputs, l1_inpnm, ff_inpnm, node_nms, shape, kernel_init, channel_op, reuse)
+        inputs = crop_func(inputs, l1_inpnm, ff_inpnm, node_nms, shape, kernel_init, channel_op, reuse, gain=crop_gain)
+
+    for record in inputs:
+        inp = _tensor(record)
+        key = inp
+        if cache is not None and key in cache:
+            outputs.append(cache[key])
+            continue
 
-    for inp in inputs:
         if len(shape) == 2:
-            pat = re.compile(':|/')
             if len(inp.shape) == 2:
                 if channel_op != 'concat' and inp.shape[1] != shape[1]:
-                    nm = pat.sub('__', inp.name.split('/')[-2].split('_')[0])
+                    nm = _source(record, l1_inpnm)
                     nm = 'fc_to_fc_harbor_for_%s' % nm
                     with tf.variable_scope(nm, reuse=reuse):
-                        inp = tfutils.model.fc(inp, shape[1], kernel_init=kernel_init, weight_decay=weight_decay)
+                        inp = dynamic_fc(inp, shape[1], kernel_init=kernel_init, weight_decay=weight_decay)
 
                 outputs.append(inp)
 
             elif len(inp.shape) == 4:
-                out = tf.reshape(inp, [inp.get_shape().as_list()[0], -1])
+                out = _flatten(inp)
                 if channel_op != 'concat' and out.shape[1] != shape[1]:
-                    nm = pat.sub('__', inp.name.split('/')[-2].split('_')[0])
+                    nm = _source(record, l1_inpnm)
                     nm = 'conv_to_fc_harbor_for_%s' % nm
                     with tf.variable_scope(nm, reuse=reuse):
-                        out = tfutils.model.fc(out, shape[1], kernel_init=kernel_init, weight_decay=weight_decay)    
+                        out = dynamic_fc(out, shape[1], kernel_init=kernel_init, weight_decay=weight_decay)    
 
                 outputs.append(out)
             else:
                 raise ValueError
 
         elif len(shape) == 4:
-            pat = re.compile(':|/')
             if len(inp.shape) == 2:
                 nchannels = shape[3]
                 if nchannels != inp.shape[1]:
-                    nm = pat.sub('__', inp.name.split('/')[-2].split('_')[0])
+                    nm = _source(record, l1_inpnm)
                     nm = 'fc_to_conv_harbor_for_%s' % nm
                     with tf.variable_scope(nm, reuse=reuse):
-                        inp = tfutils.model.fc(inp, nchannels, kernel_init=kernel_init, weight_decay=weight_decay)
+                        inp = dynamic_fc(inp, nchannels, kernel_init=kernel_init, weight_decay=weight_decay)
                  
-                xs, ys = shape[1: 3]
-                inp = tf.tile(inp, [1, xs*ys])
-                out = tf.reshape(inp, (inp.shape.as_list()[0], xs, ys, nchannels))
+                if channel_op == 'concat':
+                    xs, ys = shape[1: 3]
+                    inp = tf.tile(inp, [1, xs*ys])
+                    out = tf.reshape(inp, (-1, xs, ys, nchannels))
+                else:
+                    # add and multiply broadcast over space, so keep a single
+                    # copy of the vector instead of one for every location
+                    out = tf.expand_dims(tf.expand_dims(inp, 1), 1)
 
             elif len(inp.shape) == 4:
                 if spatial_op == 'tile':
                     out = tile_func(inp, shape)
                 elif spatial_op == 'pad':
-                    out = tf.map_fn(lambda im: tf.image.resize_image_with_crop_or_pad(im, shape[1], shape[2]), inp, dtype=tf.float32)
+                    out = crop_or_pad(inp, shape[1], shape[2])
                 else:
-                    out = tf.image.resize_images(inp, shape[1:3])
+                    # resize_images always returns float32
+                    out = tnn.precision.cast(tf.image.resize_images(inp, shape[1:3]), inp.dtype)
 
                 if channel_op != 'concat' and out.shape[3] != shape[3]:
-                    nm = pat.sub('__', inp.name.split('/')[-2].split('_')[0])
+                    nm = _source(record, l1_inpnm)
                     nm = 'conv_to_conv_harbor_for_%s' % nm
                     with tf.variable_scope(nm, reuse=reuse):
                         out = tfutils.model.conv(out, out_depth=shape[3], ksize=[1, 1], kernel_init=kernel_init, weight_decay=weight_decay)
@@ -191,8 +313,18 @@ def harbor(inputs, shape, name, ff_inpnm=None, node_nms=None, l1_inpnm='split',
         else:
             raise ValueError('harbor cannot process layer of dim {}'.format(len(shape)))
 
+        if cache is not None:
+            cache[key] = outputs[-1]
+
+    # fc inputs to conv harbors are kept as [batch, 1, 1, channels] for add and multiply
+    broadcast = [channel_op != 'concat' and o.shape.as_list()[1:] != shape[1:] for o in outputs]
     if channel_op == 'add':
-        output = tf.add_n(outputs, name='harbor')
+        if any(broadcast):
+            output = outputs[0]
+            for output_elem in outputs[1:]:
+                output = tf.add(output, output_elem)
+        else:
+            output = tf.add_n(outputs, name='harbor')
     elif channel_op == 'multiply':
         if len(outputs) == 1:
             output = outputs[0]
@@ -204,6 +336,11 @@ def harbor(inputs, shape, name, ff_inpnm=None, node_nms=None, l1_inpnm='split',
     else:
         output = tf.concat(outputs, axis=-1, name='harbor')
 
+    if any(broadcast):
+        if all(broadcast):  # only vectors came in, so spread them out once
+            output = tf.tile(output, [1, shape[1], shape[2], 1])
+        output = tf.identity(output, name='harbor')
+
     return output
 
 
@@ -214,12 +351,63 @@ def memory(inp, state, memory_decay=0, trainable=False, name='memory'):
     initializer = tfutils.model.initializer(kind='constant', value=memory_decay)
     mem = tf.get_variable(initializer=initializer,
                           shape=1,
-                          dtype=tf.float32,
+                          dtype=state.dtype.base_dtype,
                           trainable=trainable,
                           name='memory_decay')
     state = tf.add(state * mem, inp, name=name)
     return state
 
+def dynamic_fc(inp,
+               out_depth,
+               kernel_init='xavier',
+               kernel_init_kwargs=None,
+               bias=1,
+               weight_decay=None,
+               activation='relu',
+               batch_norm=True,
+               dropout=None,
+               dropout_seed=None,
+               name='fc'):
+    """
+    Same as `tfutils.model.fc`, but does not need a static batch size
+
+    Used by the harbor and `crop_func`. Configs built with
+    `init_nodes(batch_size=None)` can use it as "dynamic_fc" in place of
+    "fc", with the same arguments. The variables are the same, so
+    checkpoints of either version can be restored into the other.
+    """
+    if weight_decay is None:
+        weight_decay = 0.
+    if kernel_init_kwargs is None:
+        kernel_init_kwargs = {}
+    resh = _flatten(inp, name='reshape')
+    in_depth = resh.get_shape().as_list()[-1]
+
+    # weights
+    init = tfutils.model.initializer(kernel_init, **kernel_init_kwargs)
+    kernel = tf.get_variable(initializer=init,
+                            shape=[in_depth, out_depth],
+                            dtype=inp.dtype.base_dtype,
+                            regularizer=tf.contrib.layers.l2_regularizer(weight_decay),
+                            name='weights')
+    init = tfutils.model.initializer(kind='constant', value=bias)
+    biases = tf.get_variable(initializer=init,
+                            shape=[out_depth],
+                            dtype=inp.dtype.base_dtype,
+                            regularizer=tf.contrib.layers.l2_regularizer(weight_decay),
+                            name='bias')
+    # ops
+    output = tf.nn.bias_add(tf.matmul(resh, kernel), biases, name=name)
+
+    if activation is not None:
+        output = getattr(tf.nn, activation)(output, name=activation)
+    if batch_norm:
+        output = tf.nn.batch_normalization(output, mean=0, variance=1, offset=None,
+                            scale=None, variance_epsilon=1e-8, name='batch_norm')
+    if dropout is not None:
+        output = tf.nn.dropout(output, dropout, seed=dropout_seed, name='dropout')
+    return output
+
 def component_conv(inp,
          inputs_list,
          out_depth,
@@ -257,16 +445,20 @@ harbor channel op of concat. Other channel ops should work with tfutils.model.co
     kernel_list = []
     w_idx = 0
     for input_elem in inputs_list:
-       if input_name is not None and input_name in input_elem.name:
+       is_basenet = input_name in _tensor(input_elem).name
+       if isinstance(input_elem, HarborInput) and input_elem.source is not None:
+            is_basenet = is_basenet or input_name in input_elem.source
+       input_elem = _tensor(input_elem)
+       if input_name is not None and is_basenet:
             kernel = tf.get_variable(initializer=init,
                             shape=[ksize[0], ksize[1], input_elem.get_shape().as_list()[-1], out_depth],
-                            dtype=tf.float32,
+                            dtype=inp.dtype.base_dtype,
                             regularizer=tf.contrib.layers.l2_regularizer(weight_decay),
                             name='weights_basenet')
        else:
             kernel = tf.get_variable(initializer=init,
                             shape=[ksize[0], ksize[1], input_elem.get_shape().as_list()[-1], out_depth],
-                            dtype=tf.float32,
+                            dtype=inp.dtype.base_dtype,
                             regularizer=tf.contrib.layers.l2_regularizer(weight_decay),
                             name='weights_' + str(w_idx))
 
@@ -278,7 +470,7 @@ harbor channel op of concat. Other channel ops should work with tfutils.model.co
     const_init = tfutils.model.initializer(kind='constant', value=bias)
     biases = tf.get_variable(initializer=const_init,
                             shape=[out_depth],
-                            dtype=tf.float32,
+                            dtype=inp.dtype.base_dtype,
                             regularizer=tf.contrib.layers.l2_regularizer(weight_decay),
                             name='bias')
     # ops
@@ -317,10 +509,32 @@ class GenFuncCell(RNNCell):
         self.input_init = input_init if input_init[1] is not None else (input_init[0], {})
         self.state_init = state_init if state_init[1] is not None else (state_init[0], {})
 
-        self.dtype = dtype
+        self.dtype = tf.as_dtype(dtype)
         self.name = name
 
         self._reuse = None
+        self._cache = None
+
+    def hoist(self, enable=True):
+        """
+        Reuse time-invariant stages across calls
+
+        While enabled, the harbor and pre-memory stages are built only once
+        for the same list of input tensors, and the default harbor resizes and
+        projects every input tensor only once. If the memory does not decay,
+        the output and state are reused as well. These stages must be
+        deterministic (e.g., no dropout) for this to give the same results.
+
+        :Kwargs:
+            - enable (bool, default: True)
+                Start with an empty cache if True, disable caching if False
+        """
+        self._cache = {'inputs': {}, 'harbor': {}, 'cast': {}} if enable else None
+
+    def _memoryless(self):
+        function, kwargs = self.memory
+        return (function is memory and kwargs.get('memory_decay', 0) == 0
+                and not kwargs.get('trainable', False))
 
     def __call__(self, inputs=None, state=None):
         """
@@ -330,12 +544,19 @@ class GenFuncCell(RNNCell):
 
         :Kwargs:
             - inputs (list)
-                A list of inputs. Inputs are combined using the harbor function
+                A list of inputs (tensors or `HarborInput` records). Inputs are combined using the harbor function
             - state
 
         :Returns:
             (output, state)
         """
+        key = None
+        if self._cache is not None and inputs is not None:
+            key = tuple([_tensor(i) for i in inputs])
+            cached = self._cache['inputs'].get(key, {})
+            if 'output' in cached:  # nothing depends on time
+                return cached['output'], cached['state']
+
         # if hasattr(self, 'output') and inputs is None:
         #     raise ValueError('must provide inputs')
 
@@ -343,7 +564,10 @@ class GenFuncCell(RNNCell):
         #     inputs = [None] * len(self.input_shapes)
         # import pdb; pdb.set_trace()
 
-        with tf.variable_scope(self.name, reuse=self._reuse):
+        getter = None
+        if tnn.precision.is_reduced(self.dtype):  # float32 master weights
+            getter = tnn.precision.master_weights_getter(self.dtype)
+        with tf.variable_scope(self.name, reuse=self._reuse, custom_getter=getter):
             # inputs_full = []
             # for inp, shape, dtype in zip(inputs, self.input_shapes, self.input_dtypes):
             #     if inp is None:
@@ -353,21 +577,38 @@ class GenFuncCell(RNNCell):
             if inputs is None:
                 inputs = [self.input_init[0](shape=self.harbor_shape,
                                              **self.input_init[1])]
-            output = self.harbor[0](inputs, self.harbor_shape, self.name, reuse=self._reuse, **self.harbor[1])
-
-            pre_name_counter = 0
-            for function, kwargs in self.pre_memory:
-                with tf.variable_scope("pre_" + str(pre_name_counter), reuse=self._reuse):
-                    if function.__name__ == "component_conv":
-                       output = function(output, inputs, **kwargs) # component_conv needs to know the inputs
-                    else:
-                       output = function(output, **kwargs)
-                pre_name_counter += 1
-            if state is None:
-                state = self.state_init[0](shape=output.shape,
-                                           dtype=self.dtype,
-                                           **self.state_init[1])
-            state = self.memory[0](output, state, **self.memory[1])
+            # the same cast for the same tensor, so that the harbor cache,
+            # which is keyed on the cast tensors, works in reduced precision
+            casts = None if self._cache is None else self._cache['cast']
+            inputs = [_cast(i, self.dtype, casts) for i in inputs]
+            if key is not None and key in self._cache['inputs']:
+                output = self._cache['inputs'][key]['pre_memory']
+            else:
+                harbor_kwargs = self.harbor[1]
+                if self.harbor[0] is harbor:
+                    if self._cache is not None:
+                        harbor_kwargs = dict(harbor_kwargs, cache=self._cache['harbor'])
+                    harbor_inputs = inputs
+                else:  # custom harbors get plain tensors
+                    harbor_inputs = [_tensor(i) for i in inputs]
+                output = self.harbor[0](harbor_inputs, self.harbor_shape, self.name, reuse=self._reuse, **harbor_kwargs)
+
+                pre_name_counter = 0
+                for function, kwargs in self.pre_memory:
+                    with tf.variable_scope("pre_" + str(pre_name_counter), reuse=self._reuse):
+                        if function.__name__ == "component_conv":
+                           output = function(output, inputs, **kwargs) # component_conv needs to know the inputs
+                        else:
+                           output = function(output, **kwargs)
+                    pre_name_counter += 1
+                if key is not None:
+                    self._cache['inputs'][key] = {'pre_memory': output}
+            with tf.name_scope('memory'):
+                if state is None:
+                    state = self.state_init[0](shape=_shape(output),
+                                               dtype=self.dtype,
+                                               **self.state_init[1])
+                state = self.memory[0](output, state, **self.memory[1])
             self.state = tf.identity(state, name='state')
 
             output = self.state
@@ -382,6 +623,8 @@ class GenFuncCell(RNNCell):
             self.output = tf.identity(tf.cast(output, self.dtype), name='output')
             # scope.reuse_variables()
             self._reuse = True
+        if key is not None and self._memoryless():
+            self._cache['inputs'][key].update(output=self.output, state=self.state)
         self.state_shape = self.state.shape
         self.output_shape = self.output.shape
         return self.output, self.state
@@ -0,0 +1,217 @@
+"""
+Gradient checkpointing across time steps
+
+Backpropagating through an `unroll` keeps the activations of every stage of
+every cell at every time step until the backward pass reaches them, so the
+memory needed for training grows with `ntimes`. `unroll` in this module
+builds the same forward pass, but cuts it into segments of time steps and
+only keeps the outputs and states at segment boundaries. `gradients` then
+walks the segments backwards and rebuilds each of them from its boundary
+just before its gradients are needed.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import math
+
+import tensorflow as tf
+
+import tnn.main
+import tnn.topology
+
+
+def checkpoint_steps(ntimes, every='sqrt'):
+    """
+    First time step of every segment
+
+    :Args:
+        - ntimes (int)
+            The number of time steps
+    :Kwargs:
+        - every (int, 'sqrt' or list, default: 'sqrt')
+            Segment length, 'sqrt' for segments of about sqrt(ntimes) steps
+            (which minimizes memory for a given recomputation cost), or a list
+            of time steps where segments start
+    """
+    if every == 'sqrt':
+        every = max(1, int(round(math.sqrt(ntimes))))
+    if isinstance(every, int):
+        if every < 1:
+            raise ValueError('segments must have at least one time step, got {}'.format(every))
+        return list(range(0, ntimes, every))
+    steps = sorted(set([0] + [t for t in every if 0 <= t < ntimes]))
+    return steps
+
+
+def unroll(G, input_seq, ntimes=None, every='sqrt', nodes=None):
+    """
+    Unrolls G in the static mode with checkpoints for `gradients`
+
+    The outputs and states in `attr['outputs']` and `attr['states']` have the
+    same values as with `tnn.main.unroll` but do not propagate gradients:
+    compute the gradients of a loss built on them with `gradients`.
+
+    :Args:
+        - G
+            NetworkX DiGraph that stores initialized GenFuncCell in 'cell' nodes
+        - input_seq (dict)
+            A dict of inputs that specifies the input for each input node as its keys
+    :Kwargs:
+        - ntimes (int or None, default: None)
+            The number of time steps
+        - every (int, 'sqrt' or list, default: 'sqrt')
+            Checkpoint placement in time, see `checkpoint_steps`. Only the
+            outputs and states at the start of every segment are kept for the
+            backward pass; the rest of the segment is recomputed.
+        - nodes (list or None, default: None)
+            Checkpoint per node instead: the outputs and states of every cell
+            at every time step are kept, and only the inner stages (harbor,
+            pre-memory and post-memory functions) of the cells of `nodes` are
+            recomputed. Use it for the nodes with the largest intermediate
+            activations, e.g. convolutions followed by pooling. Overrides
+            `every`.
+    """
+    input_nodes = list(input_seq.keys())
+    tnn.main.check_inputs(G, input_nodes)
+    if ntimes is None:
+        ntimes = tnn.topology.longest_path_length(G, input_nodes) + 1
+        print('Using a default ntimes of: ', ntimes) # useful for logging
+    for k in input_seq.keys():
+        input_val = input_seq[k]
+        if not isinstance(input_val, (tuple, list)):
+            input_seq[k] = [input_val] * ntimes
+
+    plan = tnn.main.compile_plan(G, input_nodes)
+    for attr, cell in zip(plan.attrs, plan.cells):
+        attr['outputs'] = []
+        attr['states'] = []
+        cell.hoist(False)
+
+    if nodes is None:
+        starts = checkpoint_steps(ntimes, every)
+        recompute = set(range(len(plan.nodes)))
+    else:
+        starts = list(range(ntimes))
+        recompute = set([plan.nodes.index(node) for node in nodes])
+
+    segments = []
+    outputs, states = None, None
+    for start, end in zip(starts, starts[1:] + [ntimes]):
+        if outputs is not None:
+            outputs = [tf.stop_gradient(o) for o in outputs]
+            states = [tf.stop_gradient(s) for s in states]
+        boundary = (outputs, states)
+        forward = []
+        for t in range(start, end):
+            inputs = {k: v[t] for k, v in input_seq.items()}
+            outputs, states = tnn.main._unroll_step(plan, t, inputs, outputs, states)
+            forward.append((outputs, states))
+            for attr, output, state in zip(plan.attrs, outputs, states):
+                attr['outputs'].append(tf.stop_gradient(output))
+                attr['states'].append(tf.stop_gradient(state))
+        segments.append({'start': start, 'end': end, 'boundary': boundary, 'forward': forward})
+
+    G.graph['_checkpoints'] = {'plan': plan, 'input_seq': input_seq,
+                               'segments': segments, 'recompute': recompute}
+
+
+def _add(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return tf.add(tf.convert_to_tensor(a), tf.convert_to_tensor(b))
+
+
+def gradients(G, loss, var_list=None):
+    """
+    Gradients of `loss` for a graph unrolled with `checkpoint.unroll`
+
+    :Args:
+        - G
+            NetworkX DiGraph unrolled with `unroll` from this module
+        - loss (tensor)
+            Built on `attr['outputs']` and `attr['states']` of G
+    :Kwargs:
+        - var_list (list or None, default: None)
+            Variables to differentiate, by default all trainable variables
+
+    :Returns:
+        A list of (gradient, variable) pairs, as `Optimizer.compute_gradients`
+    """
+    info = G.graph['_checkpoints']
+    plan = info['plan']
+    segments = info['segments']
+    nnodes = len(plan.nodes)
+    if var_list is None:
+        var_list = tf.trainable_variables()
+
+    # gradients with respect to the outputs and states the loss is built on
+    exposed = []
+    for attr in plan.attrs:
+        exposed.extend(attr['outputs'])
+        exposed.extend(attr['states'])
+    grads = tf.gradients(loss, exposed + var_list)
+    var_grads = grads[len(exposed):]
+    ntimes = len(plan.attrs[0]['outputs'])
+    d_outputs = [grads[2 * i * ntimes: (2 * i + 1) * ntimes] for i in range(nnodes)]
+    d_states = [grads[(2 * i + 1) * ntimes: (2 * i + 2) * ntimes] for i in range(nnodes)]
+
+    # gradients with respect to the last outputs and states of the segment
+    carry_outputs = [None] * nnodes
+    carry_states = [None] * nnodes
+    for segment in reversed(segments):
+        start, end = segment['start'], segment['end']
+        ys = []
+        for t in range(start, end):
+            for i in range(nnodes):
+                d_output, d_state = d_outputs[i][t], d_states[i][t]
+                if t == end - 1:
+                    d_output = _add(d_output, carry_outputs[i])
+                    d_state = _add(d_state, carry_states[i])
+                ys.append((t, i, 'output', d_output))
+                ys.append((t, i, 'state', d_state))
+        ys = [y[:-1] + (tf.convert_to_tensor(y[-1]),) for y in ys if y[-1] is not None]
+        if len(ys) == 0:
+            carry_outputs = [None] * nnodes
+            carry_states = [None] * nnodes
+            continue
+
+        # rebuild the segment once the gradients flowing into it are known
+        with tf.control_dependencies([y[-1] for y in ys]):
+            recomputed = _recompute(plan, info['input_seq'], info['recompute'], segment)
+
+        boundary_outputs, boundary_states = segment['boundary']
+        xs = list(var_list)
+        if boundary_outputs is not None:
+            xs = boundary_outputs + boundary_states + xs
+        seg_grads = tf.gradients([recomputed[t - start][0 if kind == 'output' else 1][i]
+                                  for t, i, kind, _ in ys],
+                                 xs, grad_ys=[y[-1] for y in ys])
+        if boundary_outputs is not None:
+            carry_outputs = seg_grads[:nnodes]
+            carry_states = seg_grads[nnodes: 2 * nnodes]
+            seg_grads = seg_grads[2 * nnodes:]
+        var_grads = [_add(g, s) for g, s in zip(var_grads, seg_grads)]
+
+    return list(zip(var_grads, var_list))
+
+
+def _recompute(plan, input_seq, recompute, segment):
+    """
+    Builds the time steps of a segment again from its boundary
+
+    Cells that are not recomputed reuse the forward outputs and states,
+    which only depend on the boundary since these segments are one step long.
+    """
+    outputs, states = segment['boundary']
+    steps = []
+    dead = set(range(len(plan.nodes))) - recompute
+    for k, t in enumerate(range(segment['start'], segment['end'])):
+        inputs = {key: v[t] for key, v in input_seq.items()}
+        outputs, states = tnn.main._unroll_step(plan, t, inputs, outputs, states, dead=dead)
+        forward_outputs, forward_states = segment['forward'][k]
+        for i in dead:
+            outputs[i], states[i] = forward_outputs[i], forward_states[i]
+        steps.append((outputs, states))
+    return steps
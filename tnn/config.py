@@ -0,0 +1,198 @@
+"""
+Loading json configs
+
+Only depends on networkx, so configs can be loaded and analyzed (see
+`tnn.topology`, `tnn.shapes` and `tnn.cost`) without importing TensorFlow.
+`tnn.main.graph_from_json` builds on this to get graphs whose cells can be
+initialized.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import itertools
+
+import networkx as nx
+
+
+def import_json(json_file_name):
+    with open(json_file_name) as f:
+        json_data = json.load(f)
+
+    assert 'nodes' in json_data, 'nodes field not in the json file'
+    assert len(json_data['nodes']) > 0, 'no nodes in the json file'
+    assert 'edges' in json_data, 'edges field not in the json file'
+
+    edges = [(str(i['from']), str(i['to'])) for i in json_data['edges']]
+    node_names = []
+    for node in json_data['nodes']:
+        assert 'name' in node
+        node_names.append(node['name'])
+    if len(edges) != 0:
+        assert set(itertools.chain(*edges)) == set(node_names), 'nodes and edges do not match'
+
+    return json_data['nodes'], edges
+
+
+REQUIRED = ['harbor', 'pre_memory', 'memory', 'post_memory', 'input_init',
+            'state_init', 'dtype']
+FUNCTION_FIELDS = ['harbor', 'memory', 'input_init', 'state_init']
+FUNCTION_LIST_FIELDS = ['pre_memory', 'post_memory']
+
+
+def validate(json_nodes, edges=(), check_functions=True):
+    """
+    Checks a config in one pass and reports all of its problems at once
+
+    :Args:
+        - json_nodes (list)
+            Nodes as returned by `import_json`
+    :Kwargs:
+        - edges (list, default: ())
+        - check_functions (bool, default: True)
+            Also check that every function name is known to `tnn.registry`
+            (this imports TensorFlow). Every distinct name is looked up once.
+
+    :Raises:
+        ValueError listing every missing field, unknown node and unknown
+        function
+    """
+    errors = []
+    names = set()
+    functions = {}  # function name -> nodes that use it
+    for i, json_node in enumerate(json_nodes):
+        name = json_node.get('name', '#{}'.format(i))
+        if name in names:
+            errors.append('node {}: duplicate name'.format(name))
+        names.add(name)
+        missing = [field for field in REQUIRED if field not in json_node]
+        if 'shape' not in json_node and 'shape_from' not in json_node:
+            missing.append('shape or shape_from')
+        if len(missing) > 0:
+            errors.append('node {}: missing {}'.format(name, ', '.join(missing)))
+
+        entries = [(field, json_node[field]) for field in FUNCTION_FIELDS if field in json_node]
+        for field in FUNCTION_LIST_FIELDS:
+            if field not in json_node:
+                continue
+            if not isinstance(json_node[field], list):
+                errors.append('node {}: {} must be a list'.format(name, field))
+                continue
+            entries += [('{}[{}]'.format(field, k), e) for k, e in enumerate(json_node[field])]
+        for field, entry in entries:
+            if not isinstance(entry, dict) or 'function' not in entry:
+                errors.append('node {}: {} must be a dict with a "function" field'.format(name, field))
+            else:
+                functions.setdefault(entry['function'], []).append(name)
+
+    for json_node in json_nodes:
+        shape_from = json_node.get('shape_from')
+        if 'shape' not in json_node and shape_from is not None and shape_from not in names:
+            errors.append('node {}: shape_from {} is not a node'.format(json_node.get('name'),
+                                                                        shape_from))
+    for edge in edges:
+        for node in edge:
+            if node not in names:
+                errors.append('edge {} -> {}: {} is not a node'.format(edge[0], edge[1], node))
+
+    if check_functions:
+        import tnn.registry
+        for function in sorted(functions):
+            try:
+                tnn.registry.lookup(function)
+            except ValueError as e:
+                nodes = sorted(set(functions[function]))
+                errors.append('node{} {}: {}'.format('s' if len(nodes) > 1 else '',
+                                                     ', '.join(nodes), e))
+
+    if len(errors) > 0:
+        raise ValueError('invalid config:\n  ' + '\n  '.join(errors))
+
+
+class FunctionRef(object):
+    """
+    A function named in a json file, imported only when it is called
+
+    Has the `__name__` of the function, which is all that shape inference and
+    the cost model need.
+    """
+
+    def __init__(self, name):
+        self.__name__ = name
+        self._function = None
+
+    def __call__(self, *args, **kwargs):
+        if self._function is None:
+            import tnn.registry
+            self._function = tnn.registry.lookup(self.__name__)
+        return self._function(*args, **kwargs)
+
+    def __repr__(self):
+        return '<function {} (not imported)>'.format(self.__name__)
+
+
+def _lazy_function(function, **kwargs):
+    return FunctionRef(function), kwargs
+
+
+def graph_from_json(json_file_name, lazy=True, cell=None):
+    """
+    Builds the graph of a json config
+
+    The config is checked with `validate` first.
+
+    :Args:
+        - json_file_name (str)
+    :Kwargs:
+        - lazy (bool, default: True)
+            Store functions as `FunctionRef`, which are only imported when
+            they are called, instead of looking them up in `tnn.registry`
+            (which imports TensorFlow)
+        - cell (class or None, default: None)
+            Stored in the 'cell' attribute of every node if given
+
+    :Returns:
+        A NetworkX DiGraph with 'kwargs' (and 'shape' or 'shape_from') in
+        every node
+    """
+    json_nodes, edges = import_json(json_file_name)
+    validate(json_nodes, edges, check_functions=not lazy)
+    if lazy:
+        resolve = _lazy_function
+    else:
+        import tnn.registry
+        resolve = tnn.registry.resolve
+
+    if len(edges) == 0: # only one node in the graph
+       edges = {}
+       for json_node in json_nodes:
+          edges[json_node['name']] = {}
+
+    G = nx.DiGraph(data=edges)
+    for json_node in json_nodes:
+        attr = G.node[json_node['name']]
+
+        if 'shape' in json_node:
+            attr['shape'] = json_node['shape']
+        elif 'shape_from' in json_node:
+            attr['shape_from'] = json_node['shape_from']
+        if 'dtype' in json_node:
+            attr['dtype'] = json_node['dtype']
+
+        if cell is not None:
+            attr['cell'] = cell
+        attr['kwargs'] = {}
+        attr['kwargs']['harbor'] = resolve(**json_node['harbor'])
+        attr['kwargs']['pre_memory'] = []
+        for kwargs in json_node['pre_memory']:
+            attr['kwargs']['pre_memory'].append(resolve(**kwargs))
+        attr['kwargs']['memory'] = resolve(**json_node['memory'])
+        attr['kwargs']['post_memory'] = []
+        for kwargs in json_node['post_memory']:
+            attr['kwargs']['post_memory'].append(resolve(**kwargs))
+        attr['kwargs']['input_init'] = resolve(**json_node['input_init'])
+        attr['kwargs']['state_init'] = resolve(**json_node['state_init'])
+        attr['kwargs']['dtype'] = json_node['dtype']
+        attr['kwargs']['name'] = json_node['name']
+
+    return G
@@ -0,0 +1,362 @@
+"""
+Cost model
+
+Estimates FLOPs, parameters and activation memory of every node of a graph
+from the shapes that `init_nodes` (or `tnn.shapes.resolve`) stores in it,
+without building any TensorFlow ops, e.g. to choose `ntimes`, the batch size
+or the bypass and feedback edges that fit on a device before launching a
+job. FLOPs count multiplies and adds separately; functions without a cost
+rule are counted as free and reported in `unknown`.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import collections
+
+import numpy as np
+
+import tnn.shapes
+import tnn.topology
+
+RULES = {}
+
+# flops per output element of a bilinear resize
+RESIZE_FLOPS = 8
+
+ITEMSIZES = {'float16': 2, 'bfloat16': 2, 'float32': 4, 'float64': 8}
+
+
+def rule(*names):
+    """
+    Registers a cost rule for the functions called `names`
+
+    A rule is called as `rule(in_shape, out_shape, **kwargs)` with the kwargs
+    given to the function in the json file, and returns (flops, params).
+    """
+    def decorator(func):
+        for name in names:
+            RULES[name] = func
+        return func
+    return decorator
+
+
+def _size(shape):
+    # a dynamic batch size (None) counts as 1, so costs are per example
+    return int(np.prod([1 if dim is None else dim for dim in shape]))
+
+
+def _activation(out_shape, activation='relu', batch_norm=True):
+    flops = 0
+    if activation is not None:
+        flops += _size(out_shape)
+    if batch_norm:
+        flops += 2 * _size(out_shape)
+    return flops
+
+
+@rule('conv', 'component_conv')
+def _conv(in_shape, out_shape, out_depth, ksize=[3, 3], activation='relu',
+          batch_norm=True, **kwargs):
+    if isinstance(ksize, int):
+        ksize = [ksize, ksize]
+    elif len(ksize) == 4:
+        ksize = ksize[1:3]
+    weights = ksize[0] * ksize[1] * in_shape[-1] * out_depth
+    flops = 2 * weights * _size(out_shape[:-1]) + _size(out_shape)
+    flops += _activation(out_shape, activation, batch_norm)
+    return flops, weights + out_depth
+
+
+@rule('fc')
+def _fc(in_shape, out_shape, out_depth, activation='relu', batch_norm=True, **kwargs):
+    weights = _size(in_shape[1:]) * out_depth
+    flops = 2 * weights * _size(in_shape[:1]) + _size(out_shape)
+    flops += _activation(out_shape, activation, batch_norm)
+    return flops, weights + out_depth
+
+
+@rule('max_pool', 'avg_pool')
+def _pool(in_shape, out_shape, ksize, **kwargs):
+    if isinstance(ksize, int):
+        ksize = [ksize, ksize]
+    elif len(ksize) == 4:
+        ksize = ksize[1:3]
+    return ksize[0] * ksize[1] * _size(out_shape), 0
+
+
+@rule('relu', 'relu6', 'elu', 'tanh', 'sigmoid', 'dropout')
+def _elementwise(in_shape, out_shape, **kwargs):
+    return _size(out_shape), 0
+
+
+@rule('identity')
+def _identity(in_shape, out_shape, **kwargs):
+    return 0, 0
+
+
+@rule('lrn', 'local_response_normalization', 'softmax', 'batch_normalization')
+def _normalization(in_shape, out_shape, depth_radius=5, **kwargs):
+    return (2 * depth_radius + 4) * _size(out_shape), 0
+
+
+@rule('memory')
+def _memory(in_shape, out_shape, memory_decay=0, trainable=False, **kwargs):
+    if memory_decay == 0 and not trainable:
+        return 0, 0
+    return 2 * _size(out_shape), 1 if trainable else 0
+
+
+def _fc_projection(batch, in_features, out_features):
+    return 2 * batch * in_features * out_features, (in_features + 1) * out_features
+
+
+def harbor_cost(G, node, edge_types=None):
+    """
+    FLOPs and parameters of the default harbor of a node
+
+    Follows `tnn.cell.harbor`: inputs of another rank or spatial size are
+    resized and, unless the channel op is 'concat', projected to the harbor
+    depth before they are combined. With the 'crop' preproc, the feedback
+    inputs predict a bounding box that modulates the feedforward input (see
+    `tnn.cell.crop_func`).
+
+    :Args:
+        - G
+            NetworkX DiGraph with resolved shapes
+        - node
+    :Kwargs:
+        - edge_types (dict or None, default: None)
+            As returned by `tnn.topology.edge_types`, needed for the 'crop'
+            preproc
+
+    :Returns:
+        (flops, params)
+    """
+    attr = G.node[node]
+    shape = attr['kwargs']['harbor_shape']
+    function, kwargs = attr['kwargs']['harbor']
+    kwargs = kwargs or {}
+    channel_op = kwargs.get('channel_op', 'concat')
+    spatial_op = kwargs.get('spatial_op', 'resize')
+    preds = sorted(G.predecessors(node))
+    if len(preds) == 0:
+        return 0, 0
+
+    flops = 0
+    params = 0
+    batch = _size(shape[:1])
+    for pred in preds:
+        in_shape = G.node[pred]['output_shape']
+        if len(shape) == 2:
+            if channel_op != 'concat' and _size(in_shape[1:]) != shape[1]:
+                f, p = _fc_projection(batch, _size(in_shape[1:]), shape[1])
+                flops, params = flops + f, params + p
+        elif len(in_shape) == 2:
+            if in_shape[1] != shape[3]:
+                f, p = _fc_projection(batch, in_shape[1], shape[3])
+                flops, params = flops + f, params + p
+        else:
+            if spatial_op == 'resize' and in_shape[1:3] != shape[1:3]:
+                flops += RESIZE_FLOPS * _size(shape[:3] + in_shape[3:])
+            if channel_op != 'concat' and in_shape[3] != shape[3]:
+                weights = in_shape[3] * shape[3]
+                flops += 2 * weights * _size(shape[:3])
+                params += weights + shape[3]
+    if channel_op != 'concat':
+        flops += (len(preds) - 1) * _size(shape)
+
+    if kwargs.get('preproc') == 'crop' and edge_types is not None and len(shape) == 4:
+        feedback = [p for p in preds if edge_types.get((p, node)) == 'feedback']
+        feedforward = [p for p in preds if edge_types.get((p, node)) == 'feedforward']
+        if len(feedback) > 0 and len(feedforward) > 0:
+            width = sum([_size(G.node[p]['output_shape'][1:]) for p in feedback])
+            f, p = _fc_projection(batch, width, 5)
+            ff_shape = G.node[feedforward[0]]['output_shape']
+            flops += f + 4 * _size(ff_shape)
+            params += p
+    return flops, params
+
+
+def _itemsize(dtype):
+    if hasattr(dtype, 'size'):  # tf.DType
+        return dtype.size
+    if str(dtype) in ITEMSIZES:
+        return ITEMSIZES[str(dtype)]
+    return np.dtype(dtype).itemsize
+
+
+def node_cost(G, node, edge_types=None):
+    """
+    Cost of one call of a node's cell, i.e. of one node at one time step
+
+    :Returns:
+        A dict with
+        - 'flops', 'params'
+        - 'activation_bytes': bytes of the outputs of all stages, which are
+          kept for the backward pass when training
+        - 'output_bytes': bytes of the output and state, which are carried
+          to the next time step
+        - 'harbor_width': the depth of the harbor output, i.e. the number of
+          channels (or features) its inputs are concatenated into
+        - 'stages': a list of dicts with 'stage', 'function', 'shape',
+          'flops', 'params' and 'bytes' for every stage
+        - 'unknown': names of the functions without a cost rule
+    """
+    attr = G.node[node]
+    if 'output_shape' not in attr:
+        raise ValueError('node {} has no output shape: resolve the shapes first '
+                         'with init_nodes'.format(node))
+    kwargs = attr['kwargs']
+    harbor_shape = kwargs['harbor_shape']
+    itemsize = _itemsize(kwargs.get('dtype', 'float32'))
+    cost = {'flops': 0, 'params': 0, 'activation_bytes': 0,
+            'harbor_width': int(harbor_shape[-1]), 'stages': [], 'unknown': []}
+
+    stages = tnn.shapes.cell_stages(kwargs, harbor_shape)
+    if stages is None:  # only the output shape is known
+        functions = [kwargs['harbor'], kwargs['memory']]
+        functions += (kwargs.get('pre_memory') or []) + (kwargs.get('post_memory') or [])
+        cost['unknown'] = [tnn.shapes._name(f) for f, _ in functions
+                           if tnn.shapes._name(f) not in tnn.shapes.RULES]
+        stages = [('post', None, {}, harbor_shape, attr['output_shape'])]
+        state_shape = attr['output_shape']
+    else:
+        state_shape = [s[-1] for s in stages if s[0] == 'memory'][0]
+
+    for stage, function, fkwargs, in_shape, out_shape in stages:
+        if function is None:
+            flops, params = 0, 0
+        elif stage == 'harbor' and function == 'harbor':
+            flops, params = harbor_cost(G, node, edge_types)
+        elif function in RULES:
+            flops, params = RULES[function](in_shape, out_shape, **fkwargs)
+        else:
+            flops, params = 0, 0
+            cost['unknown'].append(function)
+        nbytes = _size(out_shape) * itemsize
+        cost['stages'].append({'stage': stage, 'function': function, 'shape': list(out_shape),
+                               'flops': int(flops), 'params': int(params), 'bytes': int(nbytes)})
+        cost['flops'] += int(flops)
+        cost['params'] += int(params)
+        cost['activation_bytes'] += int(nbytes)
+    cost['output_bytes'] = int((_size(attr['output_shape']) + _size(state_shape)) * itemsize)
+    return cost
+
+
+def costs(G, input_nodes):
+    """
+    `node_cost` of every node of G, as an ordered dict keyed by node
+
+    :Args:
+        - G
+            NetworkX DiGraph with resolved shapes, e.g. after `init_nodes`
+        - input_nodes (list)
+            Names of the input nodes
+    """
+    types = tnn.topology.edge_types(G, input_nodes)
+    return collections.OrderedDict((node, node_cost(G, node, types)) for node in sorted(G))
+
+
+def active_steps(G, input_nodes, ntimes, wavefront=False):
+    """
+    Time steps at which every node is computed, as a dict {node: range}
+
+    All of them by default; with `wavefront`, only those that
+    `unroll(..., wavefront=True)` computes (see `tnn.topology.wavefront`).
+    """
+    if not wavefront:
+        return dict((node, range(ntimes)) for node in G)
+    first, last = tnn.topology.wavefront(G, input_nodes, ntimes)
+    return dict((node, range(first[node], last[node] + 1)) for node in G)
+
+
+def per_step(G, input_nodes, ntimes=None, wavefront=False):
+    """
+    FLOPs and activation bytes of every time step of an unroll
+
+    :Returns:
+        A list with a dict of 'flops', 'activation_bytes' and 'nodes' (the
+        nodes computed at that step) for every time step
+    """
+    if ntimes is None:
+        ntimes = tnn.topology.longest_path_length(G, input_nodes) + 1
+    node_costs = costs(G, input_nodes)
+    active = active_steps(G, input_nodes, ntimes, wavefront=wavefront)
+    steps = []
+    for t in range(ntimes):
+        nodes = [node for node in node_costs if t in active[node]]
+        steps.append({'flops': sum([node_costs[n]['flops'] for n in nodes]),
+                      'activation_bytes': sum([node_costs[n]['activation_bytes'] for n in nodes]),
+                      'nodes': nodes})
+    return steps
+
+
+def estimate(G, input_nodes, batch_size=None, ntimes=None, training=True, wavefront=False):
+    """
+    Total cost of an unroll and its projected peak memory
+
+    Costs are computed at the batch size G was initialized with (1 for a
+    dynamic batch size) and scaled linearly to `batch_size`. The peak memory
+    is the size of the parameters (in float32, plus their gradients when
+    training) and of the activations that are alive at the same time: when
+    training, the activations of all stages of all nodes at all time steps are
+    kept for the backward pass; for inference, only the outputs and states of
+    two consecutive time steps and the largest activations of a single cell
+    call.
+
+    :Args:
+        - G
+            NetworkX DiGraph with resolved shapes, e.g. after `init_nodes`
+        - input_nodes (list)
+            Names of the input nodes
+    :Kwargs:
+        - batch_size (int or None, default: None)
+            By default the batch size of G, or 1 if it is dynamic
+        - ntimes (int or None, default: None)
+            The number of time steps, by default the same as `unroll`
+        - training (bool, default: True)
+        - wavefront (bool, default: False)
+            Only count the time steps `unroll(..., wavefront=True)` computes
+
+    :Returns:
+        A dict with 'flops', 'params', 'param_bytes', 'activation_bytes',
+        'peak_bytes', 'ntimes', 'batch_size', 'steps' (see `per_step`) and
+        'nodes' (see `costs`)
+    """
+    if ntimes is None:
+        ntimes = tnn.topology.longest_path_length(G, input_nodes) + 1
+    built = _size(G.node[input_nodes[0]]['kwargs']['harbor_shape'][:1])
+    if batch_size is None:
+        batch_size = built
+    scale = batch_size / built
+
+    node_costs = costs(G, input_nodes)
+    active = active_steps(G, input_nodes, ntimes, wavefront=wavefront)
+    flops = 0
+    activation_bytes = 0
+    for node, cost in node_costs.items():
+        flops += len(active[node]) * cost['flops']
+        activation_bytes += len(active[node]) * cost['activation_bytes']
+    params = sum([cost['params'] for cost in node_costs.values()])
+    param_bytes = 4 * params
+
+    if training:
+        peak = 2 * param_bytes + activation_bytes * scale
+    else:
+        carried = sum([cost['output_bytes'] for cost in node_costs.values()])
+        largest = max([cost['activation_bytes'] for cost in node_costs.values()])
+        peak = param_bytes + (2 * carried + largest) * scale
+
+    steps = per_step(G, input_nodes, ntimes=ntimes, wavefront=wavefront)
+    for step in steps:
+        step['flops'] = int(step['flops'] * scale)
+        step['activation_bytes'] = int(step['activation_bytes'] * scale)
+    return {'flops': int(flops * scale),
+            'params': params,
+            'param_bytes': param_bytes,
+            'activation_bytes': int(activation_bytes * scale),
+            'peak_bytes': int(peak),
+            'ntimes': ntimes,
+            'batch_size': batch_size,
+            'steps': steps,
+            'nodes': node_costs}
@@ -0,0 +1,61 @@
+"""
+Lazily imported modules
+
+TensorFlow and tfutils take seconds to import. Modules that only need them
+to build cells refer to them through a `LazyModule`, which imports the real
+module on first attribute access, so that loading and checking configs
+(`tnn.config`, `tnn.topology`, `tnn.shapes`, `tnn.cost`) stays fast and works
+without TensorFlow installed.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import sys
+import types
+import importlib
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for the module `name` until one of its attributes is used
+
+    Submodules are imported on access as well, so `LazyModule('tfutils').model`
+    works even if `tfutils` does not import `tfutils.model` itself.
+    """
+
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self.__dict__['_module'] is None:
+            self.__dict__['_module'] = importlib.import_module(self.__name__)
+        return self.__dict__['_module']
+
+    def __getattr__(self, attr):
+        module = self._load()
+        try:
+            return getattr(module, attr)
+        except AttributeError:
+            try:
+                return importlib.import_module(self.__name__ + '.' + attr)
+            except ImportError:
+                raise AttributeError('module {} has no attribute {}'.format(self.__name__, attr))
+
+    def __repr__(self):
+        return '<lazy module {}>'.format(self.__name__)
+
+
+def submodules(package, names):
+    """
+    Makes `package.<name>` a `LazyModule` for each of `names` that has not
+    been imported yet
+
+    Code can then keep referring to e.g. `tnn.cell.GenFuncCell`; the real
+    module replaces the stand-in in `package` once it is imported.
+    """
+    for name in names:
+        full_name = package.__name__ + '.' + name
+        if full_name not in sys.modules:
+            setattr(package, name, LazyModule(full_name))
+
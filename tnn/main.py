@@ -1,174 +1,148 @@
 from __future__ import absolute_import, division, print_function
 
-import json
-import itertools
 import copy
 import math
+import collections
 
-import networkx as nx
-import tensorflow as tf
 import numpy as np
 
-import tfutils.model
-import tnn.cell
+import tnn
+import tnn.lazy
+import tnn.config
+import tnn.shapes
+import tnn.topology
 
-
-def _get_func_from_kwargs(function, **kwargs):
-    """
-    Guess the function from its name
-    """
-    try:
-        f = getattr(tnn.cell, function)
-    except:
-        try:
-            f = getattr(tfutils.model, function)
-        except:
-            try:
-                f = getattr(tf.nn, function)
-            except:
-                try:
-                    f = getattr(tf, function)
-                except:
-                    f = getattr(tf.contrib.layers, function)
-    return f, kwargs
+# only needed once cells are built
+tf = tnn.lazy.LazyModule('tensorflow')
+tnn.lazy.submodules(tnn, ['cell', 'precision'])
 
 
-def import_json(json_file_name):
-    with open(json_file_name) as f:
-        json_data = json.load(f)
+import_json = tnn.config.import_json
 
-    assert 'nodes' in json_data, 'nodes field not in the json file'
-    assert len(json_data['nodes']) > 0, 'no nodes in the json file'
-    assert 'edges' in json_data, 'edges field not in the json file'
 
-    edges = [(str(i['from']), str(i['to'])) for i in json_data['edges']]
-    node_names = []
-    for node in json_data['nodes']:
-        assert 'name' in node
-        node_names.append(node['name'])
-    if len(edges) != 0:
-        assert set(itertools.chain(*edges)) == set(node_names), 'nodes and edges do not match'
-
-    return json_data['nodes'], edges
+def graph_from_json(json_file_name):
+    return tnn.config.graph_from_json(json_file_name, lazy=False, cell=tnn.cell.GenFuncCell)
 
 
-def graph_from_json(json_file_name):
-    json_nodes, edges = import_json(json_file_name)
-
-    if len(edges) == 0: # only one node in the graph
-       edges = {}
-       for json_node in json_nodes:
-          edges[json_node['name']] = {}
-
-    G = nx.DiGraph(data=edges)
-    for json_node in json_nodes:
-        attr = G.node[json_node['name']]
-
-        if 'shape' in json_node:
-            attr['shape'] = json_node['shape']
-        elif 'shape_from' in json_node:
-            attr['shape_from'] = json_node['shape_from']
-        if 'dtype' in json_node:
-            attr['dtype'] = json_node['dtype']
-
-        attr['cell'] = tnn.cell.GenFuncCell
-        attr['kwargs'] = {}
-        attr['kwargs']['harbor'] = _get_func_from_kwargs(**json_node['harbor'])
-        attr['kwargs']['pre_memory'] = []
-        for kwargs in json_node['pre_memory']:
-            attr['kwargs']['pre_memory'].append(_get_func_from_kwargs(**kwargs))
-        attr['kwargs']['memory'] = _get_func_from_kwargs(**json_node['memory'])
-        attr['kwargs']['post_memory'] = []
-        for kwargs in json_node['post_memory']:
-            attr['kwargs']['post_memory'].append(_get_func_from_kwargs(**kwargs))
-        attr['kwargs']['input_init'] = _get_func_from_kwargs(**json_node['input_init'])
-        attr['kwargs']['state_init'] = _get_func_from_kwargs(**json_node['state_init'])
-        attr['kwargs']['dtype'] = json_node['dtype']
-        attr['kwargs']['name'] = json_node['name']
-
-    return G
-
-
-def check_inputs(G, input_nodes):
-    '''Given a networkx graph G and a set of input_nodes,
-    checks whether the inputs are valid'''
-
-    for n in input_nodes:
-        if n not in G.nodes():
-            raise ValueError('The input nodes provided must all be in the graph.')
-
-    input_cover = set([])
-    for n in input_nodes:
-        input_cover |= (set([n]) | set(nx.descendants(G, n)))
-    if input_cover != set(G.nodes()):
-        missed_nodes = ', '.join(list(set(G.nodes()) - input_cover))
-        raise ValueError('Not all valid input nodes have been provided, as the following nodes will not receive any data: {}'.format(missed_nodes))
+check_inputs = tnn.topology.check_inputs
 
 
 def init_nodes(G, input_nodes, batch_size=256, channel_op='concat'):
     """
     Note: Modifies G in place
+
+    :Kwargs:
+        - batch_size (int or None, default: 256)
+            With None, the batch dimension is left unknown in all shapes, so
+            the unrolled graph can be fed any batch size (e.g. a smaller final
+            batch) without being built again. Every layer then has to
+            support it, e.g. "dynamic_fc" instead of "fc".
+        - channel_op (str, default: 'concat')
     """
     check_inputs(G, input_nodes)
 
-    with tf.Graph().as_default():  # separate graph that we'll destroy right away
-        # find output and harbor sizes for input nodes
-        for node in input_nodes:
-            attr = G.node[node]
-            if 'shape' not in attr:
-                raise ValueError('input node {} must have "shape" defined'.format(node))
+    # find output and harbor sizes
+    tnn.shapes.resolve(G, input_nodes, batch_size=batch_size,
+                       channel_op=channel_op, probe=_probe_output_shape(G))
 
-            kwargs = attr['kwargs']
-            shape = [batch_size] + attr['shape']
-            kwargs['harbor_shape'] = shape
-            output, state = attr['cell'](**kwargs)()
-            attr['output_shape'] = output.shape.as_list()
-
-        # find output and initial harbor sizes for input nodes
-        init_nodes = copy.copy(input_nodes)
-        while len(init_nodes) < len(G):
-            nodes = []
-            for node in init_nodes:
-                nodes += [n for n in G.successors(node) if n not in init_nodes]
-
-            for node in set(nodes):
-                shape_from = G.node[node]['shape_from']
-                if shape_from in init_nodes:
-                    nodes.pop(nodes.index(node))
-                    init_nodes.append(node)
-                    kwargs = G.node[node]['kwargs']
-                    kwargs['harbor_shape'] = G.node[shape_from]['output_shape'][:]
-                    output, state = G.node[node]['cell'](**kwargs)()
-                    G.node[node]['output_shape'] = output.shape.as_list()
-
-    # now correct harbor sizes to the final sizes and initialize cells
+    # initialize cells
     for node, attr in G.nodes(data=True):
-        if node not in input_nodes:
-            pred_shapes = [G.node[pred]['output_shape'] for pred in G.predecessors(node)]
-            attr['kwargs']['harbor_shape'] = harbor_policy(pred_shapes,
-                                                           attr['kwargs']['harbor_shape'], channel_op=channel_op)
-
         attr['cell'] = attr['cell'](**attr['kwargs'])
 
-def harbor_policy(in_shapes, shape, channel_op='concat'):
-    nchnls = []
-    if len(shape) == 4:
-        for shp in in_shapes:
-            if len(shp) == 4:
-                c = shp[-1]
-            elif len(shp) == 2:
-                c = shape[3]
-            nchnls.append(c)
-    elif len(shape) == 2:
-        for shp in in_shapes:
-            c = np.prod(shp[1:])
-            nchnls.append(c)
-    if channel_op != 'concat':
-        return shape
-    else:
-        return shape[:-1] + [sum(nchnls)]
+    compile_plan(G, input_nodes)
+
 
-def unroll(G, input_seq, ntimes=None):
+def _probe_output_shape(G):
+    """
+    Finds the output shape of cells with functions that have no shape rule
+    by building them in a separate graph that is destroyed right away
+    """
+    def probe(node, harbor_shape):
+        attr = G.node[node]
+        kwargs = copy.copy(attr['kwargs'])
+        batch_size = harbor_shape[0]
+        kwargs['harbor_shape'] = [1 if batch_size is None else batch_size] + harbor_shape[1:]
+        with tf.Graph().as_default():
+            output, state = attr['cell'](**kwargs)()
+        return [batch_size] + output.shape.as_list()[1:]
+    return probe
+
+
+harbor_policy = tnn.shapes.harbor_policy
+
+
+Plan = collections.namedtuple('Plan', ['nodes', 'attrs', 'cells', 'inputs',
+                                       'preds', 'edges', 'standins'])
+
+
+def compile_plan(G, input_nodes):
+    """
+    Precomputes what `unroll` looks up at every time step
+
+    Nodes are numbered in the order of `G.nodes()` and every per-node field is
+    a list indexed by that number, so a time step only walks lists instead of
+    querying networkx. The plan is built by `init_nodes` and cached on G; it
+    is rebuilt whenever the topology or the cells change, and reused by every
+    later `unroll` of the same graph (e.g. train and validation towers, or
+    different `ntimes`).
+
+    :Args:
+        - G
+            NetworkX DiGraph that stores initialized GenFuncCell in 'cell' nodes
+        - input_nodes (list)
+            Names of the input nodes
+
+    :Returns:
+        A `Plan` with fields:
+        - nodes: node names
+        - attrs: node attribute dicts
+        - cells: GenFuncCell of every node
+        - inputs: the key of `input_seq` feeding each node, or None
+        - preds: tuples of predecessor indices, sorted by name
+        - edges: tuples of edge types ('feedforward', 'skip' or 'feedback'),
+          aligned with `preds`
+        - standins: (init function, shape, init kwargs) used to create the
+          output of a node before it has run
+    """
+    key = ('plan', tuple(sorted(input_nodes)),
+           tuple([id(G.node[n].get('cell')) for n in G]))
+    return tnn.topology.cached(G, key, lambda: _compile_plan(G, input_nodes))
+
+
+def _typed(init, dtype):
+    """`init` with its result cast to `dtype`, so standins match reduced-precision cells"""
+    def typed_init(*args, **kwargs):
+        return tnn.precision.cast(init(*args, **kwargs), dtype)
+    return typed_init
+
+
+def _compile_plan(G, input_nodes):
+    nodes = list(G.nodes())
+    index = dict((node, i) for i, node in enumerate(nodes))
+    edge_types = tnn.topology.edge_types(G, input_nodes)
+    attrs = [G.node[node] for node in nodes]
+    preds = []
+    edges = []
+    for node in nodes:
+        node_preds = sorted(G.predecessors(node))
+        preds.append(tuple([index[p] for p in node_preds]))
+        edges.append(tuple([edge_types[(p, node)] for p in node_preds]))
+    standins = []
+    for attr in attrs:
+        cell = attr['cell']
+        standins.append((_typed(cell.input_init[0], cell.dtype), attr['output_shape'],
+                         cell.input_init[1]))
+    return Plan(nodes=nodes,
+                attrs=attrs,
+                cells=[attr['cell'] for attr in attrs],
+                inputs=[node if node in input_nodes else None for node in nodes],
+                preds=preds,
+                edges=edges,
+                standins=standins)
+
+
+def unroll(G, input_seq, ntimes=None, mode='static', wavefront=False, hoist=False, initial=None,
+           fetches=None):
     """
     Unrolls a TensorFlow graph in time
 
@@ -183,21 +157,64 @@ def unroll(G, input_seq, ntimes=None):
     :Kwargs:
         - ntimes (int or None, default: None)
             The number of time steps
+        - mode ('static' or 'while', default: 'static')
+            With 'static', a separate copy of every cell is built for every
+            time step. With 'while', the first time step is built as usual
+            (so that all variables get created) and the remaining steps run
+            inside a single `tf.while_loop`, so the graph size does not grow
+            with `ntimes`. Per-step outputs and states are collected in
+            TensorArrays and exposed through the same `attr['outputs']` and
+            `attr['states']` lists in both modes.
+        - wavefront (bool, default: False)
+            Only build cells where they can matter (static mode only). A node
+            that is `d` edges away from the closest input cannot receive any
+            signal before time `d`; until then, if its output is provably all
+            zeros (see `tnn.topology.quiet`), it emits its `input_init` output
+            and `state_init` state instead of running its cell. Other nodes
+            (e.g. with biases) are computed from the first step whose output
+            reaches a computed step over a skip or feedback edge, or from the
+            start if their memory decays, and their earlier entries in
+            `attr['outputs']` and `attr['states']` are None. Every entry that
+            is not None is the same as without `wavefront` (see
+            `tnn.topology.wavefront`). Symmetrically,
+            a node `d` edges away from the closest output node is not built
+            after time `ntimes - 1 - d`, as it can no longer affect the final
+            outputs; its entries in `attr['outputs']` and `attr['states']`
+            are None.
+        - hoist (bool, default: False)
+            Build time-invariant stages only once (see `GenFuncCell.hoist`).
+            When an input node always gets the same tensor, e.g. a single
+            image repeated over time, its harbor and pre-memory stages (the
+            first convolution) are computed once, and so are resized skip
+            connections from nodes whose output does not change.
+        - initial (tuple or None, default: None)
+            (outputs, states) dicts with the output and state of every node
+            before the first time step, e.g. the last ones of a previous
+            unroll, to continue a sequence. By default the sequence starts
+            from `input_init` outputs and `state_init` states.
+        - fetches (list or None, default: None)
+            The outputs that will be used, as (node, t) pairs or node names
+            (for the last time step); negative t count from the end. Only
+            these outputs and states are kept in `attr['outputs']` and
+            `attr['states']`, the other entries are None, so no other tensor
+            is held on to. In the static mode, the cells of node `n` are not
+            built after the last time step that can still reach a fetched
+            output (as with `wavefront`, but for the fetched outputs instead
+            of all output nodes). In the while mode, only the fetched nodes
+            are collected in TensorArrays.
+
+    :Returns:
+        None, or with `fetches` a dict reporting what was kept: `kept` and
+        `dropped` (numbers of (node, t) outputs), `kept_bytes` and
+        `dropped_bytes` (size of their outputs and states for one run) and
+        `skipped_steps` (number of (node, t) cells that were not built)
     """
-    # find the longest path from the inputs to the outputs:
     input_nodes = input_seq.keys()
     check_inputs(G, input_nodes)
-    output_nodes = [n for n in G if len(G.successors(n)) == 0]
-    inp_out = itertools.product(input_nodes, output_nodes)
-    paths = []
-    for inp, out in inp_out:
-        paths.extend([p for p in nx.all_simple_paths(G, inp, out)])
-
-    path_lengths = map(len, paths)
-    longest_path_len = max(path_lengths) if path_lengths else 0
 
     if ntimes is None:
-        ntimes = longest_path_len + 1
+        # find the longest path from the inputs to the outputs
+        ntimes = tnn.topology.longest_path_length(G, input_nodes) + 1
         print('Using a default ntimes of: ', ntimes) # useful for logging
 
     for k in input_seq.keys():
@@ -205,35 +222,420 @@ def unroll(G, input_seq, ntimes=None):
         if not isinstance(input_val, (tuple, list)):
             input_seq[k] = [input_val] * ntimes
 
-    for node, attr in G.nodes(data=True):
+    plan = compile_plan(G, input_nodes)
+    for attr, cell in zip(plan.attrs, plan.cells):
         attr['outputs'] = []
         attr['states'] = []
+        cell.hoist(hoist)  # also drops tensors cached by a previous unroll
+
+    if initial is not None:
+        if wavefront:
+            raise ValueError('wavefront scheduling assumes the sequence starts from '
+                             'scratch and cannot be used with initial outputs and states')
+        initial = ([initial[0][node] for node in plan.nodes],
+                   [initial[1][node] for node in plan.nodes])
+    else:
+        initial = (None, None)
+
+    keep = None
+    if fetches is not None:
+        keep = _normalize_fetches(G, fetches, ntimes)
+
+    nskipped = 0
+    if mode == 'static':
+        first, last = None, None
+        if wavefront:
+            first, last = tnn.topology.wavefront(G, input_nodes, ntimes)
+            quiet = tnn.topology.quiet(G, input_nodes)
+            quiet_idx = [quiet[node] for node in plan.nodes]
+        if keep is not None:
+            last = _last_needed(G, keep)
+        if first is not None:
+            first_idx = [first[node] for node in plan.nodes]
+        if last is not None:
+            last_idx = [last[node] for node in plan.nodes]
+        silent, dead = (), ()
+        outputs, states = initial
+        for t in range(ntimes):  # Loop over time
+            inputs = {k: v[t] for k, v in input_seq.items()}
+            if first is not None:
+                silent = set([i for i, f in enumerate(first_idx) if t < f and quiet_idx[i]])
+                # not computed yet, but their output would not be zeros either
+                dead = set([i for i, f in enumerate(first_idx) if t < f and not quiet_idx[i]])
+            if last is not None:
+                dead = set(dead) | set([i for i, l in enumerate(last_idx) if t > l])
+                nskipped += len(dead)
+            outputs, states = _unroll_step(plan, t, inputs, outputs, states,
+                                           silent=silent, dead=dead)
+            for node, attr, output, state in zip(plan.nodes, plan.attrs, outputs, states):
+                if keep is not None and (node, t) not in keep:
+                    output, state = None, None
+                attr['outputs'].append(output)
+                attr['states'].append(state)
+        if wavefront:
+            _fill_silent_states(G, first, quiet, keep=keep)
+    elif mode == 'while':
+        if wavefront:
+            raise ValueError('wavefront scheduling is only supported in the static mode')
+        _unroll_while(plan, input_seq, ntimes, initial, keep=keep)
+    else:
+        raise ValueError('unroll mode must be "static" or "while", got {}'.format(mode))
+
+    if keep is not None:
+        return _retention_report(G, keep, ntimes, nskipped)
+
+
+def _normalize_fetches(G, fetches, ntimes):
+    """Set of the (node, t) pairs in `fetches`, with t in [0, ntimes)"""
+    keep = set()
+    for fetch in fetches:
+        node, t = (fetch, -1) if not isinstance(fetch, (tuple, list)) else fetch
+        if node not in G:
+            raise ValueError('cannot fetch {}: no such node'.format(node))
+        if t < 0:
+            t += ntimes
+        if not 0 <= t < ntimes:
+            raise ValueError('cannot fetch {} at time {}: the graph is unrolled for {} '
+                             'steps'.format(node, fetch[1], ntimes))
+        keep.add((node, t))
+    return keep
+
+
+def _last_needed(G, keep):
+    """
+    Last time step at which each node can still affect a fetched output
+
+    The output of node `n` at time `t` reaches node `m` `d` edges away at
+    `t + d` at the earliest, so it matters if some (m, s) is fetched with
+    `t + d <= s`. Nodes that cannot reach any fetch get -1.
+    """
+    latest = {}
+    for node, t in keep:
+        latest[node] = max(latest.get(node, -1), t)
+    last = dict((node, -1) for node in G)
+    for fetched, s in latest.items():
+        for node, d in tnn.topology.distances(G, [fetched], reverse=True).items():
+            last[node] = max(last[node], s - d)
+    return last
+
+
+def _known(shape):
+    """Shape with an unknown batch size counted as 1, i.e. per example"""
+    return [1 if dim is None else dim for dim in shape]
+
+
+def _retention_report(G, keep, ntimes, nskipped):
+    kept_bytes = 0
+    dropped_bytes = 0
+    for node, attr in G.nodes(data=True):
+        cell = attr['cell']
+        nbytes = np.prod(_known(attr['output_shape'])) * cell.dtype.size
+        if hasattr(cell, 'state_shape'):
+            nbytes += np.prod(_known(cell.state_shape.as_list())) * cell.dtype.size
+        nkept = len([t for t in range(ntimes) if (node, t) in keep])
+        kept_bytes += nkept * nbytes
+        dropped_bytes += (ntimes - nkept) * nbytes
+    return {'kept': len(keep),
+            'dropped': G.number_of_nodes() * ntimes - len(keep),
+            'kept_bytes': int(kept_bytes),
+            'dropped_bytes': int(dropped_bytes),
+            'skipped_steps': nskipped}
+
+
+def _fill_silent_states(G, first, quiet, keep=None):
+    """
+    Replaces the missing states of silent time steps of `quiet` nodes with
+    `state_init`
+
+    With `keep`, only the states of these (node, t) pairs are filled.
+    """
+    for node, attr in G.nodes(data=True):
+        cell = attr['cell']
+        if not quiet[node] or not hasattr(cell, 'state_shape'):  # not zeros, or never got any signal
+            continue
+        shape = cell.state_shape.as_list()
+        if None in shape:  # dynamic batch size, read it from a state that was computed
+            shape = tnn.cell._shape([s for s in attr['states'] if s is not None][-1])
+        for t in range(min(first[node], len(attr['states']))):
+            if keep is not None and (node, t) not in keep:
+                continue
+            attr['states'][t] = cell.state_init[0](shape=shape,
+                                                   dtype=cell.dtype,
+                                                   name=node + '/silent_state',
+                                                   **cell.state_init[1])
+
+
+def _unroll_step(plan, t, inputs, prev_outputs=None, prev_states=None, silent=(), dead=()):
+    """
+    Calls every cell in the plan once
+
+    Cells get their inputs as `tnn.cell.HarborInput` records that say which
+    node produced each tensor, over which kind of edge and at which time step.
 
-    for t in range(ntimes):  # Loop over time
-        for node, attr in G.nodes(data=True):  # Loop over nodes
-            if t == 0:
-                inputs = []
-                if node in input_nodes:
-                    inputs.append(input_seq[node][t])
-                for pred in sorted(G.predecessors(node)):
-                    cell = G.node[pred]['cell']
-                    output_shape = G.node[pred]['output_shape']
-                    _inp = cell.input_init[0](shape=output_shape,
-                                                name=pred + '/standin',
-                                                **cell.input_init[1])
-                    inputs.append(_inp)
-
-                if all([i is None for i in inputs]):
-                    inputs = None
-                state = None
+    :Args:
+        - plan (Plan)
+            As returned by `compile_plan`
+        - t (int or tensor)
+            The current time step
+        - inputs (dict)
+            Input tensor for each input node at this time step
+    :Kwargs:
+        - prev_outputs (list or None, default: None)
+            Outputs of every node at the previous time step, in plan order.
+            If None, this is the first time step and standins are created
+            from `input_init`.
+        - prev_states (list or None, default: None)
+            States of every node at the previous time step, in plan order
+        - silent (set, default: ())
+            Indices of nodes that have not received any signal yet. They
+            output their `input_init` value and their state is None (i.e.,
+            `state_init`).
+        - dead (set, default: ())
+            Indices of nodes that are not computed at all. Their output and
+            state are None.
+
+    :Returns:
+        (outputs, states) lists in plan order
+    """
+    HarborInput = tnn.cell.HarborInput
+    nodes = plan.nodes
+    outputs = [None] * len(nodes)
+    states = [None] * len(nodes)
+    standins = {}
+    batch = {}  # dynamic batch size, read from the inputs when first needed
+
+    def standin(i, name):
+        init, shape, init_kwargs = plan.standins[i]
+        if shape[0] is None:
+            if 'size' not in batch:
+                batch['size'] = _batch_size(inputs, prev_outputs)
+            shape = [batch['size']] + shape[1:]
+        return init(shape=shape, name=nodes[i] + name, **init_kwargs)
+
+    for i, cell in enumerate(plan.cells):  # Loop over nodes
+        if i in dead:
+            continue
+        if i in silent:
+            outputs[i] = standin(i, '/silent')
+            continue
+
+        node_inputs = []
+        if plan.inputs[i] is not None:
+            node_inputs.append(HarborInput(inputs[plan.inputs[i]], None, 'input', t))
+        for p, edge in zip(plan.preds[i], plan.edges[i]):
+            if prev_outputs is None:
+                if p not in standins:
+                    standins[p] = standin(p, '/standin')
+                _inp = standins[p]
             else:
-                inputs = []
-                if node in input_nodes:
-                    inputs.append(input_seq[node][t])
-                for pred in sorted(G.predecessors(node)):
-                    inputs.append(G.node[pred]['outputs'][t-1])
-                state = attr['states'][t-1]
-
-            output, state = attr['cell'](inputs=inputs, state=state)
-            attr['outputs'].append(output)
-            attr['states'].append(state)
+                _inp = prev_outputs[p]
+            node_inputs.append(HarborInput(_inp, nodes[p], edge, t - 1))
+
+        if prev_outputs is None and all([inp.tensor is None for inp in node_inputs]):
+            node_inputs = None
+        state = None if prev_states is None else prev_states[i]
+
+        outputs[i], states[i] = cell(inputs=node_inputs, state=state)
+    return outputs, states
+
+
+def _batch_size(inputs, prev_outputs=None):
+    """
+    Batch size of a time step: static if it is known, otherwise a scalar
+    tensor read from the inputs
+    """
+    tensors = [inp for inp in inputs.values() if inp is not None]
+    if prev_outputs is not None:
+        tensors += [out for out in prev_outputs if out is not None]
+    for tensor in tensors:
+        if tensor.shape.as_list()[0] is not None:
+            return tensor.shape.as_list()[0]
+    if len(tensors) == 0:
+        return None
+    return tf.shape(tensors[0])[0]
+
+
+def _unroll_while(plan, input_seq, ntimes, initial=(None, None), keep=None):
+    """
+    Unrolls the plan with time steps 1..ntimes-1 inside a `tf.while_loop`
+
+    The first time step is built outside of the loop because that is where
+    cells create their variables (variables cannot be initialized from inside
+    a control flow construct). Its outputs and states then seed the loop
+    variables. With `keep`, only the nodes with a (node, t) pair in it are
+    collected.
+    """
+    outputs, states = _unroll_step(plan, 0, {k: v[0] for k, v in input_seq.items()}, *initial)
+    input_tas = _input_arrays(input_seq, ntimes)
+
+    if keep is None:
+        collected = list(range(len(plan.nodes)))
+    else:
+        kept_nodes = set([node for node, t in keep])
+        collected = [i for i, node in enumerate(plan.nodes) if node in kept_nodes]
+
+    output_tas = []
+    state_tas = []
+    for output, state in [(outputs[i], states[i]) for i in collected]:
+        ta = tf.TensorArray(dtype=output.dtype, size=ntimes,
+                            element_shape=output.shape)
+        output_tas.append(ta.write(0, output))
+        ta = tf.TensorArray(dtype=state.dtype, size=ntimes,
+                            element_shape=state.shape)
+        state_tas.append(ta.write(0, state))
+
+    def cond(t, *args):
+        return t < ntimes
+
+    def body(t, prev_outputs, prev_states, output_tas, state_tas):
+        inputs = _read_inputs(input_seq, input_tas, t)
+        outputs, states = _unroll_step(plan, t, inputs, prev_outputs, prev_states)
+        output_tas = [ta.write(t, outputs[i]) for ta, i in zip(output_tas, collected)]
+        state_tas = [ta.write(t, states[i]) for ta, i in zip(state_tas, collected)]
+        return t + 1, outputs, states, output_tas, state_tas
+
+    loop_vars = (tf.constant(1), outputs, states, output_tas, state_tas)
+    _, _, _, output_tas, state_tas = tf.while_loop(cond, body, loop_vars, name='unroll')
+
+    for attr in plan.attrs:
+        attr['outputs'] = [None] * ntimes
+        attr['states'] = [None] * ntimes
+        # loop-internal tensors cannot be used outside of the loop
+        attr['cell'].output = None
+        attr['cell'].state = None
+    for i, output_ta, state_ta in zip(collected, output_tas, state_tas):
+        node, attr = plan.nodes[i], plan.attrs[i]
+        outputs = tf.unstack(output_ta.stack(), num=ntimes)
+        states = tf.unstack(state_ta.stack(), num=ntimes)
+        for t in range(ntimes):
+            if keep is None or (node, t) in keep:
+                attr['outputs'][t] = outputs[t]
+                attr['states'][t] = states[t]
+        attr['cell'].output = outputs[-1]
+        attr['cell'].state = states[-1]
+
+
+def _input_arrays(input_seq, ntimes):
+    """
+    TensorArrays to read input sequences from inside a `tf.while_loop`
+
+    Constant inputs (the same tensor at every step) are captured directly and
+    get None instead.
+    """
+    input_tas = {}
+    for k, seq in input_seq.items():
+        if all([s is seq[0] for s in seq]):
+            input_tas[k] = None
+        else:
+            ta = tf.TensorArray(dtype=seq[0].dtype, size=ntimes,
+                                element_shape=seq[0].shape, name=k + '/input_ta')
+            input_tas[k] = ta.unstack(tf.stack(seq))
+    return input_tas
+
+
+def _read_inputs(input_seq, input_tas, t):
+    inputs = {}
+    for k, seq in input_seq.items():
+        inputs[k] = seq[0] if input_tas[k] is None else input_tas[k].read(t)
+    return inputs
+
+
+def unroll_until(G, input_seq, halt, ntimes=None, output_nodes=None, per_example=True):
+    """
+    Unrolls G until a halting criterion is met, for inference
+
+    Runs the time steps inside a `tf.while_loop` that checks `halt` on the
+    outputs after every step, and stops as soon as every example of the
+    batch has halted or after `ntimes` steps. Examples that never halt get
+    the same outputs as with `unroll`.
+
+    :Args:
+        - G
+            NetworkX DiGraph that stores initialized GenFuncCell in 'cell' nodes
+        - input_seq (dict)
+            A dict of inputs that specifies the input for each input node as its keys
+        - halt (callable)
+            Called as `halt(outputs)` with a dict of the outputs of
+            `output_nodes` at a time step; returns a boolean [batch] tensor
+            that is True for the examples that can stop, e.g.
+            `confidence_halt('fc8', .9)`
+    :Kwargs:
+        - ntimes (int or None, default: None)
+            The maximum number of time steps, as in `unroll`
+        - output_nodes (list or None, default: None)
+            Nodes passed to `halt` and returned; by default the nodes without
+            successors
+        - per_example (bool, default: True)
+            If True, the outputs of every example are frozen at the step
+            where it halted, while the rest of the batch goes on. If False,
+            all outputs are from the step at which the whole batch stopped.
+
+    :Returns:
+        A dict with
+        - outputs: dict of the final outputs of `output_nodes`
+        - exit_steps: [batch] int32 tensor with the time step at which every
+          example halted, or `ntimes - 1` if it never did
+        - nsteps: number of time steps that were run
+    """
+    input_nodes = list(input_seq.keys())
+    check_inputs(G, input_nodes)
+    if ntimes is None:
+        ntimes = tnn.topology.longest_path_length(G, input_nodes) + 1
+        print('Using a default ntimes of: ', ntimes) # useful for logging
+    input_seq = dict(input_seq)
+    for k, input_val in input_seq.items():
+        if not isinstance(input_val, (tuple, list)):
+            input_seq[k] = [input_val] * ntimes
+    if output_nodes is None:
+        output_nodes = tnn.topology.output_nodes(G)
+
+    plan = compile_plan(G, input_nodes)
+    for cell in plan.cells:
+        cell.hoist(False)
+    out_idx = [plan.nodes.index(node) for node in output_nodes]
+
+    def check(t, outputs, done, exit_steps, results):
+        current = [outputs[i] for i in out_idx]
+        halted = tf.logical_or(done, halt(dict(zip(output_nodes, current))))
+        newly = tf.logical_and(halted, tf.logical_not(done))
+        exit_steps = tf.where(newly, tf.fill(tf.shape(exit_steps), t), exit_steps)
+        if per_example:
+            results = [tf.where(done, r, c) for r, c in zip(results, current)]
+        else:
+            results = current
+        return halted, exit_steps, results
+
+    outputs, states = _unroll_step(plan, 0, {k: v[0] for k, v in input_seq.items()})
+    results = [outputs[i] for i in out_idx]
+    batch_size = tnn.cell._shape(results[0])[0]
+    done = tf.zeros([batch_size], dtype=tf.bool)
+    exit_steps = tf.fill([batch_size], ntimes - 1)
+    done, exit_steps, results = check(0, outputs, done, exit_steps, results)
+    input_tas = _input_arrays(input_seq, ntimes)
+
+    def cond(t, done, *args):
+        return tf.logical_and(t < ntimes, tf.logical_not(tf.reduce_all(done)))
+
+    def body(t, done, exit_steps, prev_outputs, prev_states, results):
+        inputs = _read_inputs(input_seq, input_tas, t)
+        outputs, states = _unroll_step(plan, t, inputs, prev_outputs, prev_states)
+        done, exit_steps, results = check(t, outputs, done, exit_steps, results)
+        return t + 1, done, exit_steps, outputs, states, results
+
+    loop_vars = (tf.constant(1), done, exit_steps, outputs, states, results)
+    nsteps, _, exit_steps, _, _, results = tf.while_loop(cond, body, loop_vars,
+                                                         name='unroll_until')
+    return {'outputs': dict(zip(output_nodes, results)),
+            'exit_steps': exit_steps,
+            'nsteps': nsteps}
+
+
+def confidence_halt(node, threshold):
+    """
+    Halting criterion for `unroll_until`: the softmax of the logits in `node`
+    gives at least `threshold` to its most likely class
+    """
+    def halt(outputs):
+        confidence = tf.reduce_max(tf.nn.softmax(outputs[node]), axis=-1)
+        return confidence >= threshold
+    return halt
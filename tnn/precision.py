@@ -0,0 +1,156 @@
+"""
+Reduced-precision execution
+
+A GenFuncCell with a `dtype` of float16 or bfloat16 (e.g. `"dtype":
+"float16"` in the json file) computes its activations and states in that
+type, while its variables are stored in float32: `master_weights_getter`
+creates them in float32 and hands a cast copy to the cell functions, so the
+optimizer still updates float32 weights. Small float16 gradients underflow,
+so scale the loss when training with `compute_gradients` or `minimize`.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import tensorflow as tf
+
+REDUCED = (tf.float16, tf.bfloat16)
+
+
+def is_reduced(dtype):
+    return tf.as_dtype(dtype).base_dtype in REDUCED
+
+
+def master_weights_getter(dtype):
+    """
+    Custom getter for `tf.variable_scope` that keeps variables in float32
+
+    Floating point variables are created (or reused) as float32 and returned
+    cast to `dtype`.
+    """
+    dtype = tf.as_dtype(dtype)
+
+    def getter(getter, name, *args, **kwargs):
+        requested = tf.as_dtype(kwargs.get('dtype') or tf.float32)
+        if not requested.is_floating:
+            return getter(name, *args, **kwargs)
+        kwargs['dtype'] = tf.float32
+        var = getter(name, *args, **kwargs)
+        return tf.cast(var, dtype)
+    return getter
+
+
+def cast(tensor, dtype):
+    """Casts floating point tensors to `dtype`, leaves everything else as is"""
+    dtype = tf.as_dtype(dtype)
+    if tensor is None or tensor.dtype.base_dtype == dtype or not tensor.dtype.is_floating:
+        return tensor
+    return tf.cast(tensor, dtype)
+
+
+class DynamicLossScale(object):
+    """
+    Loss scale that adapts to the gradients
+
+    The scale is halved whenever the gradients overflow, and doubled after
+    `increment_period` finite steps in a row.
+
+    :Kwargs:
+        - initial (float, default: 2 ** 15)
+        - increment_period (int, default: 2000)
+        - factor (float, default: 2.)
+        - name (str, default: 'loss_scale')
+            Variable scope of the scale, which has to differ between
+            instances in the same graph
+    """
+
+    def __init__(self, initial=2 ** 15, increment_period=2000, factor=2., name='loss_scale'):
+        self.increment_period = increment_period
+        self.factor = factor
+        with tf.variable_scope(name):
+            self.scale = tf.get_variable('scale', initializer=float(initial), trainable=False)
+            self.good_steps = tf.get_variable('good_steps', initializer=0, trainable=False)
+
+    def update(self, finite):
+        """Op that adapts the scale given whether the gradients were finite"""
+        def on_finite():
+            grow = self.good_steps + 1 >= self.increment_period
+            new_scale = tf.where(grow, self.scale * self.factor, self.scale)
+            new_steps = tf.where(grow, 0, self.good_steps + 1)
+            return tf.group(tf.assign(self.scale, new_scale),
+                            tf.assign(self.good_steps, new_steps))
+
+        def on_overflow():
+            return tf.group(tf.assign(self.scale, tf.maximum(self.scale / self.factor, 1.)),
+                            tf.assign(self.good_steps, 0))
+        return tf.cond(finite, on_finite, on_overflow)
+
+
+def compute_gradients(loss, var_list=None, loss_scale=1.):
+    """
+    Gradients of a reduced-precision loss, in float32
+
+    The loss is multiplied by `loss_scale` before differentiating, so that
+    float16 gradients do not flush to zero, and the gradients are divided by
+    it again after casting them to the dtype of their float32 variables.
+
+    :Args:
+        - loss (tensor)
+    :Kwargs:
+        - var_list (list or None, default: None)
+            By default all trainable variables
+        - loss_scale (float, tensor or DynamicLossScale, default: 1.)
+
+    :Returns:
+        A list of (gradient, variable) pairs
+    """
+    if var_list is None:
+        var_list = tf.trainable_variables()
+    if isinstance(loss_scale, DynamicLossScale):
+        loss_scale = loss_scale.scale
+    loss_scale = tf.convert_to_tensor(loss_scale, dtype=tf.float32)
+    scaled = tf.cast(loss, tf.float32) * loss_scale
+    grads = tf.gradients(scaled, var_list)
+    unscaled = []
+    for g, v in zip(grads, var_list):
+        if g is not None:
+            if isinstance(g, tf.IndexedSlices):
+                g = tf.convert_to_tensor(g)
+            g = tf.cast(g, v.dtype.base_dtype) / tf.cast(loss_scale, v.dtype.base_dtype)
+        unscaled.append(g)
+    return list(zip(unscaled, var_list))
+
+
+def all_finite(grads_and_vars):
+    """Scalar bool tensor, True if no gradient has a NaN or Inf"""
+    checks = [tf.reduce_all(tf.is_finite(g)) for g, v in grads_and_vars if g is not None]
+    return tf.reduce_all(tf.stack(checks))
+
+
+def minimize(optimizer, loss, var_list=None, loss_scale=1., global_step=None):
+    """
+    `optimizer.minimize` with loss scaling
+
+    With a `DynamicLossScale`, the scale is adapted and steps where the
+    gradients overflow are skipped: neither the variables nor the optimizer
+    slots change, and only `global_step` is incremented.
+    """
+    grads_and_vars = compute_gradients(loss, var_list=var_list, loss_scale=loss_scale)
+    grads_and_vars = [(g, v) for g, v in grads_and_vars if g is not None]
+    if not isinstance(loss_scale, DynamicLossScale):
+        return optimizer.apply_gradients(grads_and_vars, global_step=global_step)
+    finite = all_finite(grads_and_vars)
+    # create the slots before the cond: not every TensorFlow 1.x can create
+    # variables inside of it, and creating them again is a no-op
+    with tf.control_dependencies(None):
+        optimizer._create_slots([v for g, v in grads_and_vars])
+
+    def apply():
+        return optimizer.apply_gradients(grads_and_vars, global_step=global_step)
+
+    def skip():
+        if global_step is None:
+            return tf.no_op()
+        return tf.assign_add(global_step, 1).op
+    apply_op = tf.cond(finite, apply, skip)
+    with tf.control_dependencies([apply_op]):
+        return loss_scale.update(finite)
@@ -0,0 +1,178 @@
+"""
+Per-node, per-time step profiling
+
+Runs a session step with full tracing and attributes the time and memory of
+every op to the (node, time step, stage) it was built for, using the name
+scope of each GenFuncCell call (e.g. `conv3_5`) and the stage scopes inside
+it (`pre_0`, `memory`, `post_1`, ...; other ops in the cell scope belong to
+the harbor). Gradient ops are attributed to the forward op they
+differentiate. Works on graphs unrolled in the static mode; in the while
+mode every step after the first runs in the same loop body.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import re
+import csv
+import json
+import collections
+
+import tensorflow as tf
+
+Event = collections.namedtuple('Event', ['op', 'device', 'node', 'time', 'stage', 'backward',
+                                         'start', 'duration', 'bytes'])
+
+FIELDS = ['node', 'time', 'stage', 'backward']
+_GRADIENTS = re.compile(r'^(.*/)?gradients(_\d+)?/')
+
+
+def scopes(G):
+    """
+    Name scope of every cell call, as a dict {scope: (node, t)}
+
+    When the same output is reused over several time steps (see
+    `GenFuncCell.hoist`), its ops are attributed to the first of them.
+    """
+    calls = {}
+    for node, attr in G.nodes(data=True):
+        for t, output in enumerate(attr.get('outputs', [])):
+            if output is None or '/' not in output.op.name:
+                continue
+            scope, name = output.op.name.rsplit('/', 1)
+            if name == 'output' and scope not in calls:
+                calls[scope] = (node, t)
+    return calls
+
+
+def _stage(rel):
+    first = rel.split('/')[0]
+    if first.startswith('pre_') or first.startswith('post_'):
+        return first
+    if first in ('memory', 'state'):
+        return 'memory'
+    if first == 'output':
+        return 'output'
+    return 'harbor'
+
+
+def attribute(op_name, calls):
+    """
+    (node, t, stage, backward) of an op, with None for the node and time of
+    ops outside of any cell
+    """
+    match = _GRADIENTS.match(op_name)
+    backward = match is not None
+    if backward:
+        op_name = (match.group(1) or '') + op_name[match.end():]
+    parts = op_name.split('/')
+    for k in range(len(parts) - 1, 0, -1):
+        scope = '/'.join(parts[:k])
+        if scope in calls:
+            node, t = calls[scope]
+            return node, t, _stage('/'.join(parts[k:])), backward
+    return None, None, None, backward
+
+
+def profile(sess, fetches, G, feed_dict=None):
+    """
+    Runs `fetches` once with full tracing
+
+    :Args:
+        - sess (tf.Session)
+        - fetches
+            Anything `sess.run` accepts, e.g. a train op
+        - G
+            The unrolled NetworkX DiGraph the fetches were built from
+    :Kwargs:
+        - feed_dict (dict or None, default: None)
+
+    :Returns:
+        A `Profile`
+    """
+    run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+    run_metadata = tf.RunMetadata()
+    sess.run(fetches, feed_dict=feed_dict, options=run_options, run_metadata=run_metadata)
+    return Profile.from_step_stats(run_metadata.step_stats, scopes(G))
+
+
+class Profile(object):
+    """
+    Traced ops of one session run, attributed to nodes, time steps and stages
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    @classmethod
+    def from_step_stats(cls, step_stats, calls):
+        events = []
+        for dev_stats in step_stats.dev_stats:
+            for node_stats in dev_stats.node_stats:
+                if node_stats.node_name == '_SOURCE':
+                    continue
+                node, t, stage, backward = attribute(node_stats.node_name, calls)
+                nbytes = 0
+                for output in node_stats.output:
+                    nbytes += output.tensor_description.allocation_description.requested_bytes
+                events.append(Event(op=node_stats.node_name,
+                                    device=dev_stats.device,
+                                    node=node, time=t, stage=stage, backward=backward,
+                                    start=node_stats.all_start_micros,
+                                    duration=node_stats.all_end_rel_micros,
+                                    bytes=nbytes))
+        return cls(events)
+
+    def table(self, by=FIELDS):
+        """
+        Total time (in microseconds), output bytes and number of ops per group
+
+        :Kwargs:
+            - by (list, default: ['node', 'time', 'stage', 'backward'])
+                Event fields to group by, e.g. ['node'] or ['node', 'time']
+
+        :Returns:
+            A list of dicts with the `by` fields, 'micros', 'bytes' and 'ops',
+            slowest first
+        """
+        groups = collections.OrderedDict()
+        for event in self.events:
+            key = tuple([getattr(event, field) for field in by])
+            if key not in groups:
+                groups[key] = dict(zip(by, key), micros=0, bytes=0, ops=0)
+            groups[key]['micros'] += event.duration
+            groups[key]['bytes'] += event.bytes
+            groups[key]['ops'] += 1
+        return sorted(groups.values(), key=lambda row: -row['micros'])
+
+    def to_csv(self, path, by=FIELDS):
+        """Writes `table(by)` to a CSV file"""
+        rows = self.table(by=by)
+        with open(path, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=list(by) + ['micros', 'bytes', 'ops'])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+
+    def to_chrome_trace(self, path):
+        """
+        Writes the ops to a trace for chrome://tracing, with one row per node
+        """
+        rows = sorted(set([e.node for e in self.events if e.node is not None]))
+        tids = dict((node, i + 1) for i, node in enumerate(rows))
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': 0,
+                  'args': {'name': '(outside of cells)'}}]
+        for node, tid in tids.items():
+            trace.append({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': tid,
+                          'args': {'name': node}})
+        start = min([e.start for e in self.events]) if len(self.events) > 0 else 0
+        for e in self.events:
+            if e.node is None:
+                name = e.op
+            else:
+                name = '{} t={} {}{}'.format(e.node, e.time, e.stage, ' (backward)' if e.backward else '')
+            trace.append({'name': name, 'cat': e.stage or 'other', 'ph': 'X',
+                          'pid': 0, 'tid': tids.get(e.node, 0),
+                          'ts': e.start - start, 'dur': e.duration,
+                          'args': {'op': e.op, 'device': e.device, 'bytes': e.bytes}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace}, f)
@@ -0,0 +1,116 @@
+"""
+Registry of the functions that json configs refer to by name
+
+A name is looked up among the functions registered with `register` first,
+then in `tnn.cell`, `tfutils.model`, `tf.nn`, `tf` and `tf.contrib.layers`,
+in that order. Lookups are memoized, so every name is only searched for once
+however many nodes use it. Unknown names raise a ValueError that suggests
+the closest known names.
+
+To use your own layers in a config, register them before loading it:
+
+    @tnn.registry.register
+    def my_layer(inp, out_depth, **kwargs):
+        ...
+
+    # or under another name
+    tnn.registry.register(my_layer, name='layer')
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import difflib
+import importlib
+
+NAMESPACES = ['tnn.cell', 'tfutils.model', 'tensorflow.nn', 'tensorflow',
+              'tensorflow.contrib.layers']
+# namespaces that may be missing, e.g. tf.contrib in newer TensorFlow
+OPTIONAL = ['tensorflow.contrib.layers']
+
+_registered = {}
+_cache = {}
+
+
+def register(function=None, name=None):
+    """
+    Registers a function under `name` (by default its `__name__`)
+
+    Registered functions take precedence over the functions of the same name
+    in `NAMESPACES`. Can be used as a decorator, with or without `name`.
+    """
+    if function is None:
+        return lambda f: register(f, name=name)
+    if not callable(function):
+        raise ValueError('only functions can be registered, got {!r}'.format(function))
+    _registered[function.__name__ if name is None else name] = function
+    return function
+
+
+def unregister(name):
+    _registered.pop(name, None)
+
+
+def _namespaces():
+    """
+    Imports the namespaces one by one
+
+    A namespace that fails to import (e.g. TensorFlow is broken) raises its
+    ImportError instead of making all of its functions look unknown, unless
+    it is `OPTIONAL`.
+    """
+    for namespace in NAMESPACES:
+        try:
+            module = importlib.import_module(namespace)
+        except ImportError:
+            if namespace in OPTIONAL:
+                continue
+            raise
+        yield module
+
+
+def lookup(name):
+    """
+    The function called `name`
+
+    :Raises:
+        ValueError if there is no such function, ImportError if a namespace
+        other than the `OPTIONAL` ones cannot be imported
+    """
+    if name in _registered:
+        return _registered[name]
+    if name not in _cache:
+        for module in _namespaces():
+            function = getattr(module, name, None)
+            if function is not None and callable(function):
+                _cache[name] = function
+                break
+        else:
+            raise ValueError(_unknown_message(name))
+    return _cache[name]
+
+
+def known(name):
+    """True if `lookup(name)` would find a function"""
+    try:
+        lookup(name)
+    except ValueError:
+        return False
+    return True
+
+
+def _unknown_message(name):
+    candidates = set(_registered)
+    for module in _namespaces():
+        candidates.update([n for n in dir(module)
+                           if not n.startswith('_') and callable(getattr(module, n, None))])
+    close = difflib.get_close_matches(name, sorted(candidates), n=3)
+    message = 'unknown function "{}": it is not registered and not in {}'.format(
+        name, ', '.join(NAMESPACES))
+    if len(close) > 0:
+        message += ' (did you mean {}?)'.format(' or '.join(['"{}"'.format(c) for c in close]))
+    return message
+
+
+def resolve(function, **kwargs):
+    """(function, kwargs) of a json function entry such as {"function": "conv", ...}"""
+    return lookup(function), kwargs
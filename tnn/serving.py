@@ -0,0 +1,384 @@
+"""
+Request-coalescing inference
+
+Clients usually send one example at a time, while an unrolled graph runs
+much faster per example on a full batch. `Runner` queues single-example
+requests, waits at most `max_latency` after the first one for others to
+arrive, pads the batch to the batch size the graph was built with if needed,
+runs a single session call and hands every caller its own row of the
+requested (node, time step) outputs. It can be called from any number of
+threads, or over a Unix socket with `serve` and `Client`.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import os
+import stat
+import time
+import socket
+import struct
+import threading
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+try:
+    import socketserver
+except ImportError:  # Python 2
+    import SocketServer as socketserver
+
+import numpy as np
+
+_STOP = object()
+
+
+class Request(object):
+    """A pending request, whose outputs `result` waits for"""
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.submitted = time.time()
+        self.finished = None
+        self._done = threading.Event()
+        self._outputs = None
+        self._error = None
+
+    def _set(self, outputs=None, error=None):
+        self._outputs = outputs
+        self._error = error
+        self.finished = time.time()
+        self._done.set()
+
+    def result(self, timeout=None):
+        """
+        Outputs of this request as a dict keyed like the runner's outputs
+
+        :Raises:
+            The error of the session call, if it failed
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError('request did not finish within {} s'.format(timeout))
+        if self._error is not None:
+            raise self._error
+        return self._outputs
+
+
+class Runner(object):
+    """
+    Coalesces single-example requests into batches
+
+    :Args:
+        - sess (tf.Session)
+        - inputs (dict)
+            The tensor (usually a placeholder) fed with a batch of examples
+            for every input node
+        - outputs (dict)
+            The tensors to fetch, under the keys callers get them back with
+    :Kwargs:
+        - batch_size (int or None, default: None)
+            Largest batch to run, by default the static batch size of the
+            inputs. Required if the graph was built with a dynamic batch size.
+        - max_latency (float, default: .005)
+            How long (in seconds) the first request of a batch waits for more
+            requests before the batch is run anyway
+    """
+
+    def __init__(self, sess, inputs, outputs, batch_size=None, max_latency=.005):
+        self.sess = sess
+        self.inputs = dict(inputs)
+        self.outputs = dict(outputs)
+        self.max_latency = max_latency
+
+        static = set([t.shape.as_list()[0] for t in self.inputs.values()])
+        if len(static) != 1:
+            raise ValueError('all inputs must have the same batch size')
+        static = static.pop()
+        # graphs built with a static batch size only accept full batches
+        self.pad = static is not None
+        if batch_size is None:
+            if static is None:
+                raise ValueError('the graph has a dynamic batch size, so batch_size must be given')
+            batch_size = static
+        elif static is not None and batch_size > static:
+            raise ValueError('the graph was built for batches of at most {}'.format(static))
+        self.batch_size = batch_size
+        self._example_shapes = dict((node, t.shape.as_list()[1:]) for node, t in self.inputs.items())
+        self._dtypes = dict((node, t.dtype.as_numpy_dtype) for node, t in self.inputs.items())
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.reset_stats()
+        self._thread = None
+        self.start()
+
+    @classmethod
+    def from_graph(cls, sess, G, inputs, fetches, **kwargs):
+        """
+        Runner for a graph unrolled with `tnn.main.unroll`
+
+        :Args:
+            - sess (tf.Session)
+            - G
+                The unrolled NetworkX DiGraph
+            - inputs (dict)
+                The tensor each input node was unrolled on, as given in
+                `input_seq` (a placeholder holding a batch of examples)
+            - fetches (list)
+                (node, t) pairs, or node names for their last time step. They
+                are also the keys of the outputs of every request.
+        :Kwargs:
+            Passed on to `Runner`
+        """
+        outputs = {}
+        for fetch in fetches:
+            if isinstance(fetch, tuple):
+                node, t = fetch
+            else:
+                node, t = fetch, -1
+            output = G.node[node]['outputs'][t]
+            if output is None:
+                raise ValueError('output of {} at time step {} was not kept by unroll'.format(node, t))
+            outputs[fetch] = output
+        return cls(sess, inputs, outputs, **kwargs)
+
+    def start(self):
+        """Starts the thread that runs the batches (done when created)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name='tnn-serving')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Runs the requests that are already queued and stops"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def submit(self, inputs):
+        """
+        Queues one example
+
+        :Args:
+            - inputs (array or dict)
+                An example (without batch dimension) for every input node, as
+                a dict keyed by input node or as a single array if there is
+                only one input node
+
+        :Returns:
+            A `Request`; its `result()` waits for the outputs
+        """
+        if not isinstance(inputs, dict):
+            if len(self.inputs) != 1:
+                raise ValueError('inputs must be a dict keyed by input node when there '
+                                 'are several input nodes')
+            inputs = {list(self.inputs.keys())[0]: inputs}
+        missing = set(self.inputs) - set(inputs)
+        if len(missing) > 0:
+            raise ValueError('no example for input nodes {}'.format(', '.join(sorted(missing))))
+        for node, example in inputs.items():
+            if node not in self.inputs:
+                raise ValueError('{} is not an input node'.format(node))
+            if list(np.shape(example)) != self._example_shapes[node]:
+                raise ValueError('expected an example of shape {} for {}, got {}'.format(
+                    self._example_shapes[node], node, list(np.shape(example))))
+        request = Request(inputs)
+        self._queue.put(request)
+        return request
+
+    def run(self, inputs, timeout=None):
+        """Outputs for one example, see `submit`"""
+        return self.submit(inputs).result(timeout)
+
+    def _loop(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = first.submitted + self.max_latency
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                try:
+                    if remaining > 0:
+                        request = self._queue.get(timeout=remaining)
+                    else:  # only take requests that are already waiting
+                        request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is _STOP:
+                    stop = True
+                    break
+                batch.append(request)
+            self._run(batch)
+
+    def _run(self, batch):
+        nrows = self.batch_size if self.pad else len(batch)
+        start = time.time()
+        try:
+            feed_dict = {}
+            for node, tensor in self.inputs.items():
+                rows = np.zeros([nrows] + self._example_shapes[node], dtype=self._dtypes[node])
+                for i, request in enumerate(batch):
+                    rows[i] = request.inputs[node]
+                feed_dict[tensor] = rows
+            values = self.sess.run(self.outputs, feed_dict=feed_dict)
+        except Exception as e:  # fail the requests, not the runner
+            for request in batch:
+                request._set(error=e)
+            return
+        end = time.time()
+        for i, request in enumerate(batch):
+            request._set(outputs=dict((key, value[i]) for key, value in values.items()))
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['requests'] += len(batch)
+            self._stats['padded'] += nrows - len(batch)
+            self._stats['run_seconds'] += end - start
+            self._stats['latencies'].extend([r.finished - r.submitted for r in batch])
+            if self._stats['first'] is None:
+                self._stats['first'] = min([r.submitted for r in batch])
+            self._stats['last'] = max([r.finished for r in batch])
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'batches': 0, 'requests': 0, 'padded': 0, 'run_seconds': 0.,
+                           'latencies': [], 'first': None, 'last': None}
+
+    def stats(self, percentiles=(50, 90, 99)):
+        """
+        Throughput and latency of the requests served so far
+
+        :Returns:
+            A dict with 'requests', 'batches', 'mean_batch_size', 'padded'
+            (fraction of rows run on padding), 'throughput' (requests per
+            second from the first request to the last answer), 'run_seconds'
+            (time spent in session calls) and 'latency_p<N>' for every
+            percentile (in seconds, from `submit` until the outputs are
+            available)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = list(stats.pop('latencies'))
+        first, last = stats.pop('first'), stats.pop('last')
+        nrows = stats['requests'] + stats['padded']
+        stats['mean_batch_size'] = stats['requests'] / stats['batches'] if stats['batches'] else 0.
+        stats['padded'] = stats['padded'] / nrows if nrows else 0.
+        stats['throughput'] = stats['requests'] / (last - first) if stats['requests'] and last > first else 0.
+        for p in percentiles:
+            stats['latency_p{}'.format(p)] = float(np.percentile(latencies, p)) if latencies else None
+        return stats
+
+
+# Unix socket interface: every message is a npz archive preceded by its
+# length as an unsigned 64-bit big-endian integer. Archives are loaded
+# without pickle, so clients cannot run code in the server.
+
+def _key(key):
+    if isinstance(key, tuple):
+        return '{}:{}'.format(*key)
+    return str(key)
+
+
+def _send(sock, arrays):
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    data = buf.getvalue()
+    sock.sendall(struct.pack('>Q', len(data)) + data)
+
+
+def _recv_exactly(sock, nbytes):
+    chunks = []
+    while nbytes > 0:
+        chunk = sock.recv(min(nbytes, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        nbytes -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv(sock):
+    header = _recv_exactly(sock, 8)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, struct.unpack('>Q', header)[0])
+    if data is None:
+        return None
+    archive = np.load(io.BytesIO(data), allow_pickle=False)
+    return dict((name, archive[name]) for name in archive.files)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        runner = self.server.runner
+        while True:
+            inputs = _recv(self.request)
+            if inputs is None:  # client closed the connection
+                return
+            try:
+                outputs = runner.run(inputs)
+                reply = dict((_key(key), value) for key, value in outputs.items())
+            except Exception as e:
+                reply = {'__error__': np.array(str(e))}
+            _send(self.request, reply)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(runner, path):
+    """
+    Serves a `Runner` on the Unix socket `path`
+
+    Every connection is handled in its own thread, and requests from all
+    connections are batched together.
+
+    :Returns:
+        The server, running in a background thread; call `shutdown()` and
+        `server_close()` on it to stop it
+    """
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):  # left by a previous server
+        os.remove(path)
+    server = _Server(path, _Handler)
+    server.runner = runner
+    thread = threading.Thread(target=server.serve_forever, name='tnn-serving-socket')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class Client(object):
+    """
+    Sends examples to a `Runner` served on a Unix socket
+
+    Outputs are returned as a dict keyed by 'node:t' for (node, t) fetches
+    and by node name for the others.
+    """
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+
+    def run(self, inputs):
+        """
+        Outputs for one example
+
+        :Args:
+            - inputs (dict)
+                An example for every input node
+        """
+        _send(self.sock, dict((str(node), np.asarray(example)) for node, example in inputs.items()))
+        reply = _recv(self.sock)
+        if reply is None:
+            raise RuntimeError('the server closed the connection')
+        if '__error__' in reply:
+            raise RuntimeError(str(reply['__error__']))
+        return reply
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,290 @@
+"""
+Static shape inference
+
+Computes the shapes that a GenFuncCell produces from its kwargs alone, so
+that `init_nodes` does not need to build the cells in a throwaway graph.
+Functions without a shape rule return None and are left to the caller.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import math
+import collections
+
+import numpy as np
+
+RULES = {}
+
+
+def rule(*names):
+    """
+    Registers a shape rule for the functions called `names`
+
+    A rule is called as `rule(shape, **kwargs)` with the input shape (a list)
+    and the kwargs given to the function in the json file, and returns the
+    output shape.
+    """
+    def decorator(func):
+        for name in names:
+            RULES[name] = func
+        return func
+    return decorator
+
+
+@rule('harbor')
+def _harbor(shape, harbor_shape=None, **kwargs):
+    return list(harbor_shape)
+
+
+@rule('memory', 'relu', 'relu6', 'elu', 'tanh', 'sigmoid', 'identity',
+      'lrn', 'local_response_normalization', 'dropout', 'softmax',
+      'batch_normalization')
+def _elementwise(shape, **kwargs):
+    return list(shape)
+
+
+def _spatial(shape, ksize, strides, padding):
+    if isinstance(ksize, int):
+        ksize = [ksize, ksize]
+    elif len(ksize) == 4:
+        ksize = ksize[1:3]
+    if isinstance(strides, int):
+        strides = [1, strides, strides, 1]
+    out = []
+    for size, k, s in zip(shape[1:3], ksize, strides[1:3]):
+        if padding == 'SAME':
+            out.append(int(math.ceil(size / s)))
+        elif padding == 'VALID':
+            out.append(int(math.ceil((size - k + 1) / s)))
+        else:
+            raise ValueError('unknown padding {}'.format(padding))
+    return out
+
+
+@rule('conv', 'component_conv')
+def _conv(shape, out_depth, ksize=[3, 3], strides=[1, 1, 1, 1], padding='SAME', **kwargs):
+    if len(shape) != 4:
+        raise ValueError('conv expects a 4-dim input, got shape {}'.format(shape))
+    return shape[:1] + _spatial(shape, ksize, strides, padding) + [out_depth]
+
+
+@rule('max_pool', 'avg_pool')
+def _pool(shape, ksize, strides, padding='SAME', **kwargs):
+    if len(shape) != 4:
+        raise ValueError('pooling expects a 4-dim input, got shape {}'.format(shape))
+    return shape[:1] + _spatial(shape, ksize, strides, padding) + shape[3:]
+
+
+@rule('fc')
+def _fc(shape, out_depth, **kwargs):
+    return shape[:1] + [out_depth]
+
+
+def harbor_policy(in_shapes, shape, channel_op='concat'):
+    nchnls = []
+    if len(shape) == 4:
+        for shp in in_shapes:
+            if len(shp) == 4:
+                c = shp[-1]
+            elif len(shp) == 2:
+                c = shape[3]
+            nchnls.append(c)
+    elif len(shape) == 2:
+        for shp in in_shapes:
+            c = np.prod(shp[1:])
+            nchnls.append(c)
+    if channel_op != 'concat':
+        return shape
+    else:
+        return shape[:-1] + [sum(nchnls)]
+
+
+def _name(function):
+    return getattr(function, '__name__', None)
+
+
+def cell_stages(kwargs, harbor_shape):
+    """
+    Shapes of every stage of a GenFuncCell
+
+    :Args:
+        - kwargs (dict)
+            GenFuncCell kwargs, as stored in `G.node[node]['kwargs']`
+        - harbor_shape (list)
+            Shape of the harbor output
+
+    :Returns:
+        A list of (stage, function name, function kwargs, input shape, output
+        shape) tuples, where stage is 'harbor', 'pre_<i>', 'memory' or
+        'post_<i>' as in the variable scopes of GenFuncCell, or None if any of
+        the functions has no shape rule.
+    """
+    stages = []
+    shape = list(harbor_shape)
+
+    function, fkwargs = kwargs['harbor']
+    fkwargs = {} if fkwargs is None else fkwargs
+    if _name(function) not in RULES:
+        return None
+    out_shape = RULES[_name(function)](shape, harbor_shape=harbor_shape, **fkwargs)
+    stages.append(('harbor', _name(function), fkwargs, shape, out_shape))
+    shape = out_shape
+
+    chain = [('pre_' + str(i), f) for i, f in enumerate(kwargs.get('pre_memory') or [])]
+    chain.append(('memory', kwargs['memory']))
+    chain += [('post_' + str(i), f) for i, f in enumerate(kwargs.get('post_memory') or [])]
+    for stage, (function, fkwargs) in chain:
+        fkwargs = {} if fkwargs is None else fkwargs
+        if _name(function) not in RULES:
+            return None
+        out_shape = RULES[_name(function)](shape, **fkwargs)
+        stages.append((stage, _name(function), fkwargs, shape, out_shape))
+        shape = out_shape
+    return stages
+
+
+def cell_shapes(kwargs, harbor_shape):
+    """
+    Returns (output_shape, state_shape) of a GenFuncCell, or None if unknown
+    """
+    stages = cell_stages(kwargs, harbor_shape)
+    if stages is None:
+        return None
+    state_shape = [s[-1] for s in stages if s[0] == 'memory'][0]
+    return stages[-1][-1], state_shape
+
+
+def _signature(kwargs):
+    """Hashable summary of the functions and kwargs that determine shapes"""
+    sig = []
+    for key in ['harbor', 'pre_memory', 'memory', 'post_memory']:
+        funcs = kwargs.get(key) or []
+        if key in ['harbor', 'memory']:
+            funcs = [funcs]
+        for function, fkwargs in funcs:
+            sig.append((_name(function), repr(sorted((fkwargs or {}).items()))))
+    return tuple(sig)
+
+
+def resolve(G, input_nodes, batch_size=256, channel_op='concat', probe=None):
+    """
+    Sets `output_shape` and the final `harbor_shape` of every node in G
+
+    Input nodes get a harbor of `[batch_size] + shape`. Every other node first
+    gets the output shape of its `shape_from` node as its harbor shape, which
+    determines its output shape; then its harbor shape is widened to fit all
+    of its predecessors according to `harbor_policy`. Nodes are visited with a
+    worklist keyed on `shape_from`, so this runs in O(V + E).
+
+    Results are cached in `G.graph`. When called again on the same graph
+    (e.g. after adding bypass or feedback edges), only the nodes whose
+    `shape_from` shape, kwargs or predecessors changed are recomputed.
+
+    :Args:
+        - G
+            NetworkX DiGraph as returned by `graph_from_json`
+        - input_nodes (list)
+            Names of the input nodes
+    :Kwargs:
+        - batch_size (int, default: 256)
+        - channel_op (str, default: 'concat')
+            How the harbor combines its inputs, see `harbor_policy`
+        - probe (callable or None, default: None)
+            Called as `probe(node, harbor_shape)` to find the output shape of
+            cells with functions that have no shape rule
+
+    :Returns:
+        A list of nodes whose harbor or output shapes were (re)computed
+    """
+    cache = G.graph.get('_shapes')
+    if cache is None or cache['key'] != (batch_size, channel_op):
+        cache = {'key': (batch_size, channel_op), 'nodes': {}}
+        G.graph['_shapes'] = cache
+    records = cache['nodes']
+    input_nodes = set(input_nodes)
+
+    dependents = collections.defaultdict(list)
+    queue = collections.deque()
+    for node in G:
+        attr = G.node[node]
+        if node in input_nodes:
+            if 'shape' not in attr:
+                raise ValueError('input node {} must have "shape" defined'.format(node))
+            queue.append(node)
+        elif 'shape_from' in attr:
+            dependents[attr['shape_from']].append(node)
+        else:
+            raise ValueError('node {} is not an input node and must have "shape_from" '
+                             'defined'.format(node))
+
+    # output shapes, in the order of the `shape_from` dependencies
+    output_shapes = {}
+    changed = set()
+    while len(queue) > 0:
+        node = queue.popleft()
+        attr = G.node[node]
+        if node in input_nodes:
+            base = [batch_size] + list(attr['shape'])
+        else:
+            base = list(output_shapes[attr['shape_from']])
+        signature = _signature(attr['kwargs'])
+
+        record = records.get(node)
+        if record is None or record['base'] != base or record['signature'] != signature:
+            shapes = cell_shapes(attr['kwargs'], base)
+            if shapes is not None:
+                output_shape = shapes[0]
+            elif probe is not None:
+                output_shape = probe(node, base)
+            else:
+                raise ValueError('cannot infer the output shape of node {}: some of its '
+                                 'functions have no shape rule'.format(node))
+            record = {'base': base, 'signature': signature,
+                      'output_shape': list(output_shape), 'preds': None}
+            records[node] = record
+            changed.add(node)
+        output_shapes[node] = record['output_shape']
+        queue.extend(dependents.pop(node, []))
+
+    unresolved = [n for n in G if n not in output_shapes]
+    if len(unresolved) > 0:
+        raise ValueError(_unresolved_message(G, unresolved))
+
+    # final harbor shapes
+    for node in G:
+        attr = G.node[node]
+        record = records[node]
+        if node in input_nodes:
+            preds = None
+        else:
+            preds = tuple((p, tuple(output_shapes[p])) for p in sorted(G.predecessors(node)))
+        if record['preds'] != preds or 'harbor_shape' not in record:
+            if node in input_nodes:
+                record['harbor_shape'] = record['base']
+            else:
+                record['harbor_shape'] = harbor_policy([list(s) for p, s in preds],
+                                                       record['base'],
+                                                       channel_op=channel_op)
+            record['preds'] = preds
+            changed.add(node)
+        attr['kwargs']['harbor_shape'] = list(record['harbor_shape'])
+        attr['output_shape'] = list(record['output_shape'])
+
+    return [n for n in G if n in changed]
+
+
+def _unresolved_message(G, unresolved):
+    for node in unresolved:
+        chain = [node]
+        while True:
+            shape_from = G.node[chain[-1]].get('shape_from')
+            if shape_from not in G:
+                return ('node {} gets its shape from {}, which is not in the '
+                        'graph'.format(chain[-1], shape_from))
+            if shape_from in chain:
+                cycle = chain[chain.index(shape_from):] + [shape_from]
+                return 'cycle in "shape_from": {}'.format(' -> '.join(cycle))
+            if shape_from not in unresolved:
+                break
+            chain.append(shape_from)
+    return 'could not resolve the shapes of nodes: {}'.format(', '.join(unresolved))
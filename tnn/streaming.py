@@ -0,0 +1,209 @@
+"""
+Streaming inference
+
+`unroll` builds all `ntimes` steps of a graph, so getting the output for a
+new video frame would mean running the whole sequence again. `Streamer`
+instead builds a single time step whose previous outputs and states live in
+non-trainable variables. Every `step` feeds one frame, runs the cells once
+and writes the new outputs and states back, so later frames continue where
+the previous ones stopped. Each row of the batch is an independent stream
+that can be `reset` on its own.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import tensorflow as tf
+
+import tnn.main
+import tnn.shapes
+import tnn.topology
+
+
+def state_shape(G, node):
+    """
+    Shape of the state of a node's cell, without building it in the graph
+    """
+    attr = G.node[node]
+    cell = attr['cell']
+    shapes = tnn.shapes.cell_shapes(attr['kwargs'], attr['kwargs']['harbor_shape'])
+    if shapes is not None:
+        return shapes[1]
+    if hasattr(cell, 'state_shape'):  # the cell has been called already
+        return cell.state_shape.as_list()
+    with tf.Graph().as_default():
+        _, state = type(cell)(**attr['kwargs'])()
+    return state.shape.as_list()
+
+
+class StateVariables(object):
+    """
+    Previous outputs and states of every node, kept in variables
+
+    Variables start from the values a node has before its first time step in
+    `unroll` (its `input_init` output and `state_init` state), so a graph
+    built on `read()` continues a sequence exactly where it was stopped.
+    They are local, non-trainable variables.
+
+    :Args:
+        - G
+            NetworkX DiGraph that stores initialized GenFuncCell in 'cell' nodes
+        - input_nodes (list)
+            Names of the input nodes
+    :Kwargs:
+        - name (str, default: 'state_variables')
+            Name scope of the variables
+    """
+
+    def __init__(self, G, input_nodes, name='state_variables'):
+        self.plan = tnn.main.compile_plan(G, input_nodes)
+        if any([shape[0] is None for _, shape, _ in self.plan.standins]):
+            raise ValueError('outputs and states are kept in variables, which need a fixed '
+                             'batch size: call init_nodes with batch_size set')
+        self.outputs = []
+        self.states = []
+        self._inits = []
+        with tf.name_scope(name):
+            for i, (node, cell) in enumerate(zip(self.plan.nodes, self.plan.cells)):
+                init, shape, init_kwargs = self.plan.standins[i]
+                output_init = init(shape=shape, name=node + '/output_init', **init_kwargs)
+                state_init = cell.state_init[0](shape=state_shape(G, node),
+                                                dtype=cell.dtype,
+                                                name=node + '/state_init',
+                                                **cell.state_init[1])
+                self.outputs.append(self._variable(output_init, node + '/prev_output'))
+                self.states.append(self._variable(state_init, node + '/prev_state'))
+                self._inits.extend([output_init, state_init])
+            batch_size = self.outputs[0].shape.as_list()[0]
+            self.steps = self._variable(tf.zeros([batch_size], dtype=tf.int32), 'steps')
+            self._inits.append(tf.zeros([batch_size], dtype=tf.int32))
+            self.variables = self.outputs + self.states + [self.steps]
+            self.initializer = tf.variables_initializer(self.variables, name='init')
+
+            self.reset_rows = tf.placeholder(tf.int32, shape=[None], name='reset_rows')
+            resets = [tf.scatter_update(v, self.reset_rows, tf.gather(init, self.reset_rows))
+                      for v, init in zip(self.variables, self._inits)]
+            self.reset_op = tf.group(*resets, name='reset')
+
+    def _variable(self, initial_value, name):
+        return tf.Variable(initial_value, trainable=False, name=name,
+                           collections=[tf.GraphKeys.LOCAL_VARIABLES])
+
+    def read(self):
+        """
+        Snapshots of the variables, as (outputs, states, steps)
+
+        Outputs and states are lists in the order of `plan.nodes`.
+        """
+        outputs = [tf.identity(v) for v in self.outputs]
+        states = [tf.identity(v) for v in self.states]
+        return outputs, states, tf.identity(self.steps)
+
+    def assign(self, outputs, states, nsteps=1):
+        """
+        Stores new outputs and states once all of them have been computed
+
+        `None` entries (nodes that were not computed) keep their value.
+        """
+        new = [t for t in outputs + states if t is not None]
+        with tf.control_dependencies(new):
+            updates = [tf.assign(v, t) for v, t in zip(self.outputs + self.states, outputs + states)
+                       if t is not None]
+            updates.append(tf.assign_add(self.steps, tf.fill(tf.shape(self.steps), nsteps)))
+        return tf.group(*updates)
+
+
+class Streamer(object):
+    """
+    Runs a graph one time step per call
+
+    Build it in the same variable scope as the rest of the model so that the
+    cells reuse their weights. The batch dimension set by `init_nodes` is the
+    number of concurrent streams.
+
+    :Args:
+        - G
+            NetworkX DiGraph that stores initialized GenFuncCell in 'cell' nodes
+        - input_nodes (list)
+            Names of the input nodes
+    :Kwargs:
+        - output_nodes (list or None, default: None)
+            Nodes whose outputs `step` returns; by default the nodes without
+            successors
+        - name (str, default: 'stream')
+            Name scope of the placeholders and variables
+    """
+
+    def __init__(self, G, input_nodes, output_nodes=None, name='stream'):
+        tnn.main.check_inputs(G, input_nodes)
+        self.input_nodes = list(input_nodes)
+        if output_nodes is None:
+            output_nodes = tnn.topology.output_nodes(G)
+        self.output_nodes = list(output_nodes)
+
+        with tf.name_scope(name):
+            self.frames = {}
+            for node in self.input_nodes:
+                attr = G.node[node]
+                self.frames[node] = tf.placeholder(attr['cell'].dtype,
+                                                   shape=attr['kwargs']['harbor_shape'],
+                                                   name=node + '/frame')
+            self.state = StateVariables(G, self.input_nodes)
+        plan = self.state.plan
+        prev_outputs, prev_states, steps = self.state.read()
+        outputs, states = tnn.main._unroll_step(plan, steps, self.frames, prev_outputs, prev_states)
+        self.outputs = dict((node, outputs[plan.nodes.index(node)]) for node in self.output_nodes)
+        self.update_op = self.state.assign(outputs, states)
+
+    @property
+    def initializer(self):
+        return self.state.initializer
+
+    def step(self, frames, sess=None):
+        """
+        Feeds one frame per stream and advances every stream by one time step
+
+        :Args:
+            - frames (array or dict)
+                A [streams, ...] batch of frames for each input node, as a
+                dict keyed by input node or as a single array if there is
+                only one input node
+        :Kwargs:
+            - sess (tf.Session or None, default: None)
+                Session to run in, the default session if None
+
+        :Returns:
+            A dict with the outputs of `output_nodes` at this time step
+        """
+        sess = tf.get_default_session() if sess is None else sess
+        if not isinstance(frames, dict):
+            if len(self.input_nodes) != 1:
+                raise ValueError('frames must be a dict keyed by input node when there '
+                                 'are several input nodes')
+            frames = {self.input_nodes[0]: frames}
+        feed_dict = dict((self.frames[node], frame) for node, frame in frames.items())
+        outputs, _ = sess.run([self.outputs, self.update_op], feed_dict=feed_dict)
+        return outputs
+
+    def reset(self, streams=None, sess=None):
+        """
+        Starts new sequences
+
+        :Kwargs:
+            - streams (list or None, default: None)
+                Batch rows to reset; all of them (and the step counters) if None.
+                Also initializes the variables the first time.
+            - sess (tf.Session or None, default: None)
+                Session to run in, the default session if None
+        """
+        sess = tf.get_default_session() if sess is None else sess
+        if streams is None:
+            sess.run(self.state.initializer)
+        else:
+            sess.run(self.state.reset_op,
+                     feed_dict={self.state.reset_rows: np.asarray(streams, dtype=np.int32)})
+
+    def steps(self, sess=None):
+        """Number of frames each stream has seen since its last reset"""
+        sess = tf.get_default_session() if sess is None else sess
+        return sess.run(self.state.steps)
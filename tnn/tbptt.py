@@ -0,0 +1,143 @@
+"""
+Truncated backpropagation through time
+
+`unroll` keeps every time step of a sequence in one graph, so the memory
+needed for training grows with the sequence length. `TruncatedUnroll`
+unrolls only `k` steps. The last outputs and states of a chunk are stored in
+variables (see `tnn.streaming.StateVariables`) and the next chunk starts
+from them, so the forward pass is the same as a full unroll while gradients
+stop at chunk boundaries.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import tensorflow as tf
+
+import tnn.main
+import tnn.streaming
+
+
+class TruncatedUnroll(object):
+    """
+    Unrolls G over chunks of `k` time steps that continue each other
+
+    Build it in the same variable scope as the rest of the model so that the
+    cells reuse their weights. Outputs and states of the chunk are in
+    `outputs` and `states` (and in `G.node[node]['outputs']` and
+    `['states']`, as after `unroll`); build the loss and train op on them and
+    run every chunk with `run`.
+
+    :Args:
+        - G
+            NetworkX DiGraph that stores initialized GenFuncCell in 'cell' nodes
+        - input_nodes (list)
+            Names of the input nodes
+        - k (int)
+            Number of time steps per chunk
+    :Kwargs:
+        - mode ('static' or 'while', default: 'static')
+            See `unroll`
+        - name (str, default: 'tbptt')
+            Name scope of the placeholders and variables
+    """
+
+    def __init__(self, G, input_nodes, k, mode='static', name='tbptt'):
+        self.k = k
+        self.input_nodes = list(input_nodes)
+        with tf.name_scope(name):
+            self.chunks = {}
+            for node in self.input_nodes:
+                attr = G.node[node]
+                self.chunks[node] = tf.placeholder(attr['cell'].dtype,
+                                                   shape=[k] + attr['kwargs']['harbor_shape'],
+                                                   name=node + '/chunk')
+            self.state = tnn.streaming.StateVariables(G, self.input_nodes)
+        plan = self.state.plan
+        prev_outputs, prev_states, _ = self.state.read()
+        initial = (dict((node, tf.stop_gradient(o)) for node, o in zip(plan.nodes, prev_outputs)),
+                   dict((node, tf.stop_gradient(s)) for node, s in zip(plan.nodes, prev_states)))
+        input_seq = dict((node, tf.unstack(chunk, num=k)) for node, chunk in self.chunks.items())
+        tnn.main.unroll(G, input_seq, ntimes=k, mode=mode, initial=initial)
+
+        self.outputs = dict((node, list(attr['outputs'])) for node, attr in zip(plan.nodes, plan.attrs))
+        self.states = dict((node, list(attr['states'])) for node, attr in zip(plan.nodes, plan.attrs))
+        self.update_op = self.state.assign([attr['outputs'][-1] for attr in plan.attrs],
+                                           [attr['states'][-1] for attr in plan.attrs],
+                                           nsteps=k)
+
+    @property
+    def initializer(self):
+        return self.state.initializer
+
+    def reset(self, streams=None, sess=None):
+        """
+        Starts new sequences, in all batch rows or only in `streams`
+
+        Also initializes the variables the first time it is called with
+        `streams=None`.
+        """
+        sess = tf.get_default_session() if sess is None else sess
+        if streams is None:
+            sess.run(self.state.initializer)
+        else:
+            sess.run(self.state.reset_op,
+                     feed_dict={self.state.reset_rows: np.asarray(streams, dtype=np.int32)})
+
+    def run(self, chunks, fetches=None, sess=None):
+        """
+        Runs one chunk and carries its last outputs and states to the next one
+
+        :Args:
+            - chunks (array or dict)
+                A [k, batch, ...] array for each input node, as a dict keyed by
+                input node or as a single array if there is only one input node
+        :Kwargs:
+            - fetches (default: None)
+                Anything `sess.run` accepts, e.g. the train op and the loss
+            - sess (tf.Session or None, default: None)
+                Session to run in, the default session if None
+
+        :Returns:
+            The values of `fetches`
+        """
+        sess = tf.get_default_session() if sess is None else sess
+        if not isinstance(chunks, dict):
+            if len(self.input_nodes) != 1:
+                raise ValueError('chunks must be a dict keyed by input node when there '
+                                 'are several input nodes')
+            chunks = {self.input_nodes[0]: chunks}
+        feed_dict = dict((self.chunks[node], chunk) for node, chunk in chunks.items())
+        if fetches is None:
+            sess.run(self.update_op, feed_dict=feed_dict)
+            return None
+        values, _ = sess.run([fetches, self.update_op], feed_dict=feed_dict)
+        return values
+
+    def run_sequence(self, sequence, fetches=None, sess=None):
+        """
+        Resets all streams and runs a whole sequence chunk by chunk
+
+        :Args:
+            - sequence (array or dict)
+                A [T, batch, ...] array for each input node, where T is a
+                multiple of k
+        :Kwargs:
+            - fetches, sess
+                See `run`
+
+        :Returns:
+            A list with the values of `fetches` for every chunk
+        """
+        if not isinstance(sequence, dict):
+            sequence = {self.input_nodes[0]: sequence}
+        ntimes = len(list(sequence.values())[0])
+        if ntimes % self.k != 0:
+            raise ValueError('the sequence length ({}) must be a multiple of the chunk '
+                             'length ({})'.format(ntimes, self.k))
+        self.reset(sess=sess)
+        values = []
+        for start in range(0, ntimes, self.k):
+            chunks = dict((node, seq[start: start + self.k]) for node, seq in sequence.items())
+            values.append(self.run(chunks, fetches=fetches, sess=sess))
+        return values
@@ -0,0 +1,297 @@
+"""
+Graph topology helpers
+
+These only depend on networkx so they can be used on a graph before any
+TensorFlow ops are built.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import collections
+
+import networkx as nx
+
+
+def _signature(G):
+    return frozenset(G.nodes()), frozenset(G.edges())
+
+
+def cached(G, key, func):
+    """
+    Returns `func()` memoized on G for as long as its topology does not change
+
+    The cache lives in `G.graph` and is dropped as soon as nodes or edges are
+    added or removed (e.g. by `G.add_edges_from` after `graph_from_json`).
+    """
+    signature = _signature(G)
+    cache = G.graph.get('_topology_cache')
+    if cache is None or cache['signature'] != signature:
+        cache = {'signature': signature, 'values': {}}
+        G.graph['_topology_cache'] = cache
+    if key not in cache['values']:
+        cache['values'][key] = func()
+    return cache['values'][key]
+
+
+def check_inputs(G, input_nodes):
+    '''Given a networkx graph G and a set of input_nodes,
+    checks whether the inputs are valid'''
+
+    for n in input_nodes:
+        if n not in G.nodes():
+            raise ValueError('The input nodes provided must all be in the graph.')
+
+    input_cover = set([])
+    for n in input_nodes:
+        input_cover |= (set([n]) | set(nx.descendants(G, n)))
+    if input_cover != set(G.nodes()):
+        missed_nodes = ', '.join(list(set(G.nodes()) - input_cover))
+        raise ValueError('Not all valid input nodes have been provided, as the following nodes will not receive any data: {}'.format(missed_nodes))
+
+
+def output_nodes(G):
+    """Nodes without successors"""
+    return [n for n in G if len(list(G.successors(n))) == 0]
+
+
+def longest_path_length(G, input_nodes):
+    """
+    Number of nodes on the longest path from an input node to an output node
+
+    Strongly connected components (feedback loops) are condensed into single
+    nodes weighted by their size, and the longest path is found with dynamic
+    programming over the condensed DAG in O(V + E). On acyclic graphs this is
+    exactly the longest simple path. Inside a feedback loop a simple path can
+    visit at most all the nodes of the loop, so each loop contributes its full
+    size; for feedback connections onto a feedforward chain (as in all our
+    configs) that is also exact, otherwise it is an upper bound.
+
+    As with `nx.all_simple_paths`, paths must have distinct endpoints, and 0 is
+    returned if no output can be reached.
+
+    :Args:
+        - G
+            NetworkX DiGraph
+        - input_nodes (list)
+            Names of the input nodes
+    """
+    key = ('longest_path_length', tuple(sorted(input_nodes)))
+    return cached(G, key, lambda: _longest_path_length(G, input_nodes))
+
+
+def _longest_path_length(G, input_nodes):
+    sccs = list(nx.strongly_connected_components(G))
+    C = nx.condensation(G, scc=sccs)  # component i holds the nodes of sccs[i]
+    mapping = dict((n, i) for i, members in enumerate(sccs) for n in members)
+    sizes = [len(members) for members in sccs]
+    sources = set(mapping[n] for n in input_nodes)
+
+    # longest[c]: most nodes on a path from any input that ends in component c
+    longest = {}
+    for c in nx.topological_sort(C):
+        best = [longest[p] for p in C.predecessors(c) if p in longest]
+        if len(best) > 0 or c in sources:
+            longest[c] = sizes[c] + max(best + [0])
+
+    lengths = []
+    for out in output_nodes(G):
+        best = [longest[p] for p in C.predecessors(mapping[out]) if p in longest]
+        if len(best) > 0:
+            lengths.append(max(best) + 1)
+    return max(lengths) if len(lengths) > 0 else 0
+
+
+def distances(G, sources, reverse=False):
+    """
+    Shortest number of edges from any of the `sources` to every reachable node
+
+    The returned dict is cached on G and must not be modified.
+
+    :Args:
+        - G
+            NetworkX DiGraph
+        - sources (list)
+            Names of the nodes to start from (at distance 0)
+    :Kwargs:
+        - reverse (bool, default: False)
+            Follow edges backwards, i.e. the distance from every node that
+            can reach the `sources` to the closest of them
+    """
+    key = ('distances', tuple(sorted(sources)), reverse)
+    return cached(G, key, lambda: _distances(G, sources, reverse))
+
+
+def _distances(G, sources, reverse):
+    neighbors = G.predecessors if reverse else G.successors
+    dist = dict((s, 0) for s in sources)
+    queue = collections.deque(sources)
+    while len(queue) > 0:
+        node = queue.popleft()
+        for n in neighbors(node):
+            if n not in dist:
+                dist[n] = dist[node] + 1
+                queue.append(n)
+    return dist
+
+
+def edge_types(G, input_nodes):
+    """
+    Classifies every edge of G as 'feedforward', 'skip' or 'feedback'
+
+    The depth of a node is the length of its `shape_from` chain down to an
+    input node. An edge is 'feedforward' if it comes from the `shape_from`
+    node of its target, 'skip' if it comes from a shallower node and
+    'feedback' otherwise. Nodes without `shape_from` fall back on their
+    distance from the input nodes.
+
+    The returned dict, keyed on (source, target), is cached on G and must not
+    be modified.
+
+    :Args:
+        - G
+            NetworkX DiGraph
+        - input_nodes (list)
+            Names of the input nodes
+    """
+    shape_from = tuple(sorted((n, G.node[n]['shape_from']) for n in G
+                              if 'shape_from' in G.node[n] and n not in input_nodes))
+    key = ('edge_types', tuple(sorted(input_nodes)), shape_from)
+    return cached(G, key, lambda: _edge_types(G, input_nodes, dict(shape_from)))
+
+
+def _edge_types(G, input_nodes, shape_from):
+    fallback = distances(G, input_nodes)
+    depth = dict((n, 0) for n in input_nodes)
+
+    def get_depth(node):
+        chain = []
+        while node not in depth:
+            if node not in shape_from or shape_from[node] in chain or shape_from[node] not in G:
+                depth[node] = fallback.get(node, len(G))
+                break
+            chain.append(node)
+            node = shape_from[node]
+        for n in reversed(chain):
+            depth[n] = depth[shape_from[n]] + 1
+        return depth[chain[0]] if len(chain) > 0 else depth[node]
+
+    types = {}
+    for source, target in G.edges():
+        if shape_from.get(target) == source:
+            types[(source, target)] = 'feedforward'
+        elif get_depth(source) < get_depth(target):
+            types[(source, target)] = 'skip'
+        else:
+            types[(source, target)] = 'feedback'
+    return types
+
+
+# functions that map all-zero inputs to zeros, whatever their parameters
+ZERO_AT_REST = frozenset(['relu', 'relu6', 'elu', 'tanh', 'max_pool', 'avg_pool', 'lrn',
+                          'local_response_normalization', 'dropout', 'flatten', 'identity'])
+
+
+def _function(stage):
+    function, kwargs = stage
+    return getattr(function, '__name__', None), kwargs or {}
+
+
+def memoryless(G, node):
+    """Whether the memory of `node` forgets its state at every time step"""
+    name, kwargs = _function(G.node[node]['kwargs']['memory'])
+    return name == 'memory' and kwargs.get('memory_decay', 0) == 0 and not kwargs.get('trainable', False)
+
+
+def zero_at_rest(G, node):
+    """
+    Whether the cell of `node` outputs zeros and keeps a zero state as long
+    as all its inputs are zeros, whatever its weights
+
+    This is decided conservatively from the config: no stage may add an
+    offset (such as a bias) or project its inputs.
+    """
+    attr = G.node[node]
+    kwargs = attr['kwargs']
+    if _function(kwargs['state_init'])[0] != 'zeros':
+        return False
+    name, harbor_kwargs = _function(kwargs['harbor'])
+    if name != 'harbor' or harbor_kwargs.get('channel_op', 'concat') != 'concat':
+        return False
+    rank = len(kwargs.get('harbor_shape', []))
+    if any([len(G.node[p].get('output_shape', [])) != rank for p in G.predecessors(node)]):
+        return False  # inputs of another rank are projected with an fc
+    if _function(kwargs['memory'])[0] != 'memory':
+        return False
+    stages = kwargs['pre_memory'] + kwargs['post_memory']
+    return all([_function(stage)[0] in ZERO_AT_REST for stage in stages])
+
+
+def quiet(G, input_nodes):
+    """
+    Nodes whose output is all zeros until a signal from the inputs reaches
+    them, as a dict {node: bool}
+
+    That is the case if their `input_init` is zeros and they and all nodes
+    upstream of them are `zero_at_rest`.
+    """
+    dist_in = distances(G, input_nodes)
+    result = dict((node, _function(G.node[node]['kwargs']['input_init'])[0] == 'zeros'
+                   and (dist_in[node] == 0 or zero_at_rest(G, node))) for node in G)
+    changed = True
+    while changed:
+        changed = False
+        for node in G:
+            if result[node] and dist_in[node] > 0 and not all([result[p] for p in G.predecessors(node)]):
+                result[node] = False
+                changed = True
+    return result
+
+
+def wavefront(G, input_nodes, ntimes):
+    """
+    First and last time step at which each node has to be computed
+
+    A node `d` edges away from the closest input cannot receive any signal
+    before time `d`, and a node `d` edges away from the closest output can no
+    longer affect it after time `ntimes - 1 - d`. Until it is reached, the
+    output of a node does not depend on the inputs; for `quiet` nodes it is
+    all zeros and can be replaced by their `input_init`. Other nodes are
+    computed from the first step that a computed step depends on, through a
+    skip or feedback edge or through their own memory, so that every computed
+    step gives the same result as computing all of them.
+
+    :Args:
+        - G
+            NetworkX DiGraph with resolved shapes, e.g. after `init_nodes`
+        - input_nodes (list)
+            Names of the input nodes
+        - ntimes (int)
+            The number of time steps
+
+    :Returns:
+        (first, last) dicts keyed by node
+    """
+    dist_in = distances(G, input_nodes)
+    dist_out = distances(G, output_nodes(G), reverse=True)
+    first = dict((node, dist_in[node]) for node in G)
+    zeros = quiet(G, input_nodes)
+
+    for node in G:
+        if not zeros[node] and not memoryless(G, node):
+            first[node] = 0  # its state depends on every step before
+    changed = True
+    while changed:
+        changed = False
+        for node in G:
+            if zeros[node] or first[node] == 0:
+                continue
+            needed = max(min([first[m] - 1 for m in G.successors(node)] + [first[node]]), 0)
+            if needed < first[node]:
+                first[node] = needed
+                changed = True
+
+    last = {}
+    for node in G:
+        # nodes that cannot reach any output (or graphs without outputs) are kept
+        last[node] = ntimes - 1 - dist_out.get(node, 0)
+    return first, last